@@ -31,3 +31,28 @@ CELERY_QUEUES = (
 CELERY_DEFAULT_EXCHANGE = 'tasks'
 CELERY_DEFAULT_EXCHANGE_TYPE = 'topic'
 CELERY_DEFAULT_ROUTING_KEY = 'task.default'
+
+from datetime import timedelta
+
+CELERYBEAT_SCHEDULE = {
+    # Rolling windows of the project totals
+    "refresh-projects-totals": {
+        "task": "taiga.projects.services.totals.refresh_projects_totals",
+        "schedule": timedelta(days=1),
+    },
+    # Full recount of the project totals, repairing the drift of the buckets
+    "recount-projects-totals": {
+        "task": "taiga.projects.services.totals.recount_projects_totals",
+        "schedule": timedelta(weeks=1),
+    },
+    # Pending history snapshots left behind
+    "process-leftover-pending-snapshots": {
+        "task": "taiga.projects.history.tasks.process_leftover_pending_snapshots",
+        "schedule": timedelta(minutes=10),
+    },
+    # Keep only the last WEBHOOKS_LOG_MAX_ENTRIES logs of every webhook
+    "prune-webhook-logs": {
+        "task": "taiga.webhooks.tasks.prune_webhook_logs",
+        "schedule": timedelta(minutes=15),
+    },
+}
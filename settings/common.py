@@ -35,12 +35,17 @@ DATABASES = {
     }
 }
 
+# The cached stats are invalidated through the cache, so with more than one
+# process (gunicorn or celery workers) use a shared backend (memcached, redis...);
+# with the process local LocMemCache they are cached PROCESS_LOCAL_CACHE_TIMEOUT
+# at most, the invalidations made by the other processes can't be seen.
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "unique-snowflake"
     }
 }
+PROCESS_LOCAL_CACHE_TIMEOUT = 60  # 1 minute
 
 PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.PBKDF2PasswordHasher",
@@ -184,8 +189,16 @@ DJMAIL_TEMPLATE_EXTENSION = "jinja"
 
 # Events backend
 EVENTS_PUSH_BACKEND = "taiga.events.backends.postgresql.EventsPushBackend"
+# EVENTS_PUSH_BACKEND = "taiga.events.backends.postgresql.BatchedEventsPushBackend"
 # EVENTS_PUSH_BACKEND = "taiga.events.backends.rabbitmq.EventsPushBackend"
-# EVENTS_PUSH_BACKEND_OPTIONS = {"url": "//guest:guest@127.0.0.1/"}
+# EVENTS_PUSH_BACKEND_OPTIONS = {"url": "//guest:guest@127.0.0.1/", "pool_size": 4, "confirm_publish": False}
+
+# Send the events from a background thread of each process instead of the
+# request thread; when its queue is full the new events are dropped (the
+# queue depth and the counters of the serving process are exported, for
+# superusers, by the /api/v1/stats/events endpoint)
+EVENTS_ASYNC_SENDER = False
+EVENTS_SENDER_QUEUE_SIZE = 1000
 
 # Message System
 MESSAGE_STORAGE = "django.contrib.messages.storage.session.SessionStorage"
@@ -440,6 +453,12 @@ DEFAULT_PROJECT_TEMPLATE = "scrum"
 PUBLIC_REGISTER_ENABLED = False
 
 SEARCHES_MAX_RESULTS = 150
+# Default results of each type in the typeahead search mode. Its matches are
+# ranked by similarity and served by trigram indexes only if the pg_trgm
+# extension is installed: a database superuser must run "CREATE EXTENSION
+# pg_trgm" before migrating (or run "manage.py migrate searches zero" and
+# "manage.py migrate searches" after installing it).
+SEARCHES_TYPEAHEAD_LIMIT = 10
 
 SOUTH_MIGRATION_MODULES = {
     'easy_thumbnails': 'easy_thumbnails.south_migrations',
@@ -498,6 +517,24 @@ STATS_CACHE_TIMEOUT = 60*60  # In second
 # collapsed during that interval
 CHANGE_NOTIFICATIONS_MIN_INTERVAL = 0 #seconds
 
+# If True, the history snapshots of api changes are taken in background
+# (by celery or, if it is not enabled, by a local worker thread) and
+# the request only stores a pending marker with the frozen object
+HISTORY_ASYNC_SNAPSHOTS = False
+# Pending markers older than this (in seconds) are considered left behind
+# and processed by the process_pending_snapshots command (or celery beat)
+HISTORY_PENDING_SNAPSHOTS_TIMEOUT = 60 * 10
+
+# Max time the names of the project attributes (statuses, points, roles...)
+# used by the history values stay in cache, they are invalidated anyway when
+# they change (that requires a shared cache backend, see CACHES)
+HISTORY_VALUES_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
+# Storage codec for the snapshot, diff and values of history entries
+HISTORY_STORAGE_CODEC = "taiga.projects.history.codecs.JsonCodec"
+# HISTORY_STORAGE_CODEC = "taiga.projects.history.codecs.ZlibJsonCodec"
+HISTORY_STORAGE_CODEC_OPTIONS = {}
+
 
 # List of functions called for filling correctly the ProjectModulesConfig associated to a project
 # This functions should receive a Project parameter and return a dict with the desired configuration
@@ -513,9 +550,37 @@ GITLAB_VALID_ORIGIN_IPS = []
 
 EXPORTS_TTL = 60 * 60 * 24  # 24 hours
 
+# Max time a project stats (backlog burndown) stay in cache, they are
+# invalidated anyway when the user stories, points or milestones change
+# (requires a shared cache backend, see CACHES)
+PROJECT_STATS_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+# Max time a milestone stats (sprint burndown) stay in cache, they are invalidated
+# anyway when the milestone, its user stories or tasks change (and when the points
+# or task statuses change, that requires a shared cache backend, see CACHES)
+MILESTONE_STATS_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+
 CELERY_ENABLED = False
 WEBHOOKS_ENABLED = False
 
+# Webhooks delivery: timeouts (in seconds) of every attempt, number of
+# retries (with exponential backoff) of connection errors, connect timeouts and
+# 502/503/504 responses, and webhooks of an event sent at the same time
+WEBHOOKS_CONNECT_TIMEOUT = 5
+WEBHOOKS_READ_TIMEOUT = 10
+WEBHOOKS_MAX_RETRIES = 2
+WEBHOOKS_RETRY_BACKOFF = 1
+WEBHOOKS_MAX_WORKERS = 4
+
+# Logs kept for each webhook (pruned every WEBHOOKS_LOG_PRUNE_EVERY deliveries
+# of the webhook, and periodically by celery beat if it's enabled) and max
+# characters of the request and response bodies stored in them (None to store
+# them complete; the logs with a truncated request can't be resent)
+WEBHOOKS_LOG_MAX_ENTRIES = 10
+WEBHOOKS_LOG_PRUNE_EVERY = 100
+WEBHOOKS_LOG_MAX_REQUEST_SIZE = 100000
+WEBHOOKS_LOG_MAX_RESPONSE_SIZE = 10000
+
 
 # If is True /front/sitemap.xml show a valid sitemap of taiga-front client
 FRONT_SITEMAP_ENABLED = False
@@ -22,12 +22,18 @@ from django.core.paginator import (
     Paginator,
     InvalidPage,
 )
+from django.db.models import Q
 from django.http import Http404
 from django.utils.translation import ugettext as _
 
+from taiga.base.utils import json
+
 from .settings import api_settings
 from .templatetags.api import replace_query_param
 
+import base64
+import binascii
+import datetime
 import warnings
 
 
@@ -127,6 +133,86 @@ class LazyPaginator(Paginator):
     page_range = property(_get_page_range)
 
 
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(values):
+    """
+    Encode the ordering values of the last object of a page in an
+    opaque token.
+    """
+    values = [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise InvalidCursor("That cursor is not valid")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("That cursor is not valid")
+    return values
+
+
+class CursorPage(object):
+    def __init__(self, object_list, next_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.paginator = paginator
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorPaginator(object):
+    """
+    Implement keyset pagination.
+
+    Instead of counting and skipping rows, every page seeks the rows that
+    follow the last object of the previous page in the `ordering` fields,
+    so the cost of a page doesn't depend on how deep it is. The last field
+    must be unique (usually the id) to break ties.
+    """
+
+    def __init__(self, object_list, per_page, ordering):
+        self.object_list = object_list.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def _get_seek_filter(self, values):
+        # (a, b) after (x, y) is: a after x, or a = x and b after y
+        seek_filter = Q()
+        for i, (field, value) in enumerate(zip(self.ordering, values)):
+            lookup = "{}__lt" if field.startswith("-") else "{}__gt"
+            field_filter = Q(**{lookup.format(field.lstrip("-")): value})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                field_filter &= Q(**{prev_field.lstrip("-"): prev_value})
+            seek_filter |= field_filter
+        return seek_filter
+
+    def page(self, cursor=None):
+        object_list = self.object_list
+        if cursor:
+            values = decode_cursor(cursor, len(self.ordering))
+            object_list = object_list.filter(self._get_seek_filter(values))
+
+        # Retrieve one more object to check if there is a next page.
+        objects = list(object_list[:self.per_page + 1])
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            last = objects[-1]
+            next_cursor = encode_cursor([getattr(last, f.lstrip("-")) for f in self.ordering])
+
+        return CursorPage(objects, next_cursor, self)
+
+
 class PaginationMixin(object):
     # Pagination settings
     paginate_by = api_settings.PAGINATE_BY
@@ -134,6 +220,10 @@ class PaginationMixin(object):
     max_paginate_by = api_settings.MAX_PAGINATE_BY
     page_kwarg = 'page'
     paginator_class = Paginator
+    # Ordering used by the cursor pagination, views that support it must
+    # set it, ie: ("-created", "-id")
+    cursor_ordering = None
+    cursor_kwarg = 'cursor'
 
     def get_paginate_by(self, queryset=None, **kwargs):
         """
@@ -171,6 +261,9 @@ class PaginationMixin(object):
         if "HTTP_X_DISABLE_PAGINATION" in self.request.META:
             return None
 
+        if self.cursor_ordering and page_size is None and self.use_cursor_pagination():
+            return self.paginate_queryset_by_cursor(queryset)
+
         if "HTTP_X_LAZY_PAGINATION" in self.request.META:
             self.paginator_class = LazyPaginator
 
@@ -245,3 +338,33 @@ class PaginationMixin(object):
 
     def get_pagination_serializer(self, page):
         return self.get_serializer(page.object_list, many=True)
+
+    def use_cursor_pagination(self):
+        return ("HTTP_X_CURSOR_PAGINATION" in self.request.META or
+                self.cursor_kwarg in self.request.QUERY_PARAMS)
+
+    def paginate_queryset_by_cursor(self, queryset):
+        """
+        Paginate a queryset with a `CursorPaginator`. The pages have no
+        count nor number, only the url of the next one.
+        """
+        page_size = self.get_paginate_by()
+        if not page_size:
+            return None
+
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        cursor = self.request.QUERY_PARAMS.get(self.cursor_kwarg)
+        try:
+            page = paginator.page(cursor)
+        except InvalidPage as e:
+            raise Http404(_('Invalid cursor: %(message)s') % {'message': str(e)})
+
+        self.headers["x-paginated"] = "true"
+        self.headers["x-paginated-by"] = page.paginator.per_page
+
+        if page.has_next():
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.cursor_kwarg, page.next_cursor)
+            self.headers["X-Pagination-Next"] = url
+
+        return page
@@ -24,6 +24,7 @@ from django.utils.translation import ugettext as _
 from taiga.base import exceptions as exc
 from taiga.base.api.utils import get_object_or_404
 from taiga.base.utils.db import to_tsquery
+from taiga.base.utils.db import has_search_vector
 
 logger = logging.getLogger(__name__)
 
@@ -454,12 +455,17 @@ class QFilter(FilterBackend):
         q = request.QUERY_PARAMS.get('q', None)
         if q:
             table = queryset.model._meta.db_table
-            where_clause = ("""
-                to_tsvector('english_nostop',
-                            coalesce({table}.subject, '') || ' ' ||
-                            coalesce({table}.ref) || ' ' ||
-                            coalesce({table}.description, '')) @@ to_tsquery('english_nostop', %s)
-            """.format(table=table))
+            if has_search_vector(queryset.model):
+                where_clause = ("""
+                    {table}.search_vector @@ to_tsquery('english_nostop', %s)
+                """.format(table=table))
+            else:
+                where_clause = ("""
+                    to_tsvector('english_nostop',
+                                coalesce({table}.subject, '') || ' ' ||
+                                coalesce({table}.ref) || ' ' ||
+                                coalesce({table}.description, '')) @@ to_tsquery('english_nostop', %s)
+                """.format(table=table))
 
             queryset = queryset.extra(where=[where_clause], params=[to_tsquery(q)])
 
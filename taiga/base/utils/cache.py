@@ -0,0 +1,73 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def get_cache_version(key:str) -> str:
+    """
+    Get the version stored in `key`, to be included in the keys of a
+    group of cached values so `bump_cache_version` invalidates all of
+    them at once. A lost version is replaced by a new random one, the
+    values cached with the previous one can't be used anymore.
+    """
+    version = cache.get(key)
+    if version is None:
+        new_version = uuid.uuid4().hex
+        cache.add(key, new_version, timeout=None)
+        version = cache.get(key) or new_version
+    return version
+
+
+def bump_cache_version(key:str):
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+
+
+def bump_cache_version_on_commit(key:str):
+    """
+    Bump the version now (for the rest of the current transaction) and
+    again when the transaction commits, so the values cached meanwhile by
+    concurrent requests, with the data before the commit, are discarded.
+    """
+    bump_cache_version(key)
+    if connection.in_atomic_block:
+        connection.on_commit(lambda: bump_cache_version(key))
+
+
+def is_process_local_cache() -> bool:
+    """
+    Check if the default cache is private to the process (LocMemCache),
+    so the values set (and the versions bumped) by the other processes
+    (gunicorn or celery workers) can't be seen.
+    """
+    return isinstance(cache, LocMemCache)
+
+
+def get_cache_timeout(timeout:int) -> int:
+    """
+    Get the timeout to cache a value invalidated with `bump_cache_version`.
+    With a process local cache the invalidations of the other processes
+    are missed, so it is limited to PROCESS_LOCAL_CACHE_TIMEOUT.
+    """
+    if is_process_local_cache():
+        return min(timeout, settings.PROCESS_LOCAL_CACHE_TIMEOUT)
+    return timeout
@@ -16,12 +16,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db import transaction
 from django.shortcuts import _get_queryset
 
 from . import functions
 
 import re
+import threading
+from collections import OrderedDict
 
 def get_object_or_none(klass, *args, **kwargs):
     """
@@ -129,6 +132,81 @@ def update_in_bulk_with_ids(ids, list_of_new_values, model):
         model.objects.filter(id=id).update(**new_values)
 
 
+def _is_pending_commit_hook(func) -> bool:
+    return any(hook is func for sids, hook in connection.run_on_commit)
+
+
+class _SavepointItems:
+    """
+    Items added in a savepoint. It's registered as a commit hook, so it's
+    discarded by django if the savepoint is rolled back.
+    """
+    def __init__(self):
+        self.items = []
+        self.committed = False
+
+    def __call__(self):
+        self.committed = True
+
+
+class CommitBuffer:
+    """
+    Accumulate items in the current transaction and pass them to `flush`
+    in a single call when it commits (at once outside a transaction).
+
+    A single commit hook is registered per transaction. The items added
+    in a savepoint that is rolled back are discarded, and the ones of a
+    transaction rolled back are dropped when the next one starts.
+    """
+    def __init__(self, flush):
+        self.flush = flush
+        self._local = threading.local()
+
+    def add(self, *items):
+        hook = getattr(self._local, "hook", None)
+        new_hook = hook is None or not _is_pending_commit_hook(hook)
+        if new_hook:
+            # A new function, to tell it from the hooks of other transactions
+            hook = self._local.hook = lambda: self._flush()
+            self._local.savepoints = OrderedDict()
+
+        sids = tuple(connection.savepoint_ids)
+        savepoint = self._local.savepoints.get(sids, None)
+        if savepoint is None:
+            savepoint = self._local.savepoints[sids] = _SavepointItems()
+            connection.on_commit(savepoint)
+
+        savepoint.items.extend(items)
+
+        if new_hook:
+            connection.on_commit(hook)
+
+    def _flush(self):
+        savepoints = self._local.savepoints
+        self._local.hook = self._local.savepoints = None
+
+        items = [item for savepoint in savepoints.values()
+                 if savepoint.committed or _is_pending_commit_hook(savepoint)
+                 for item in savepoint.items]
+        if items:
+            self.flush(items)
+
+
+_installed_pg_extensions = {}
+
+
+def is_pg_extension_installed(name:str) -> bool:
+    """
+    Check if a postgresql extension is installed in the
+    database. It is queried only once per process.
+    """
+    if name not in _installed_pg_extensions:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = %s)", [name])
+            _installed_pg_extensions[name] = cursor.fetchone()[0]
+    return _installed_pg_extensions[name]
+
+
 def to_tsquery(term):
     """
     Based on: https://gist.github.com/wolever/1a5ccf6396f00229b2dc
@@ -228,3 +306,66 @@ def to_tsquery(term):
         paren_count -= 1
 
     return " ".join(res)
+
+
+# Tables with a `search_vector` column: a weighted tsvector kept up to date
+# by a trigger and indexed with gin, created by the migrations of their apps
+# with `get_search_vector_sql`. It is not declared on the models, only the
+# full text searches (taiga.searches.services and taiga.base.filters.QFilter)
+# use it.
+SEARCH_VECTOR_TABLES = frozenset([
+    "userstories_userstory",
+    "tasks_task",
+    "issues_issue",
+    "wiki_wikipage",
+])
+
+
+def has_search_vector(model_cls) -> bool:
+    return model_cls._meta.db_table in SEARCH_VECTOR_TABLES
+
+
+def get_search_vector_sql(table:str, weighted_columns:list) -> tuple:
+    """
+    Get the (create, drop) sql of the search_vector column of a table,
+    its trigger and its index, from a list of (column, weight) tuples.
+    """
+    def vector(prefix):
+        return " || ".join("setweight(to_tsvector('english_nostop', coalesce({}{}::text, '')), '{}')"
+                            .format(prefix, column, weight) for column, weight in weighted_columns)
+
+    create_sql = """
+        ALTER TABLE {table} ADD COLUMN search_vector tsvector;
+
+        CREATE OR REPLACE FUNCTION {table}_search_vector_trigger()
+                           RETURNS trigger
+                          LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := {new_vector};
+            RETURN NEW;
+        END
+        $$;
+
+        CREATE TRIGGER {table}_search_vector_update
+                BEFORE INSERT OR UPDATE OF {columns}
+                    ON {table}
+              FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_trigger();
+
+        UPDATE {table}
+           SET search_vector = {table_vector};
+
+        CREATE INDEX {table}_search_vector_idx
+                  ON {table}
+               USING gin(search_vector);
+    """.format(table=table,
+               columns=", ".join(column for column, weight in weighted_columns),
+               new_vector=vector("NEW."),
+               table_vector=vector("{}.".format(table)))
+
+    drop_sql = """
+        DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table};
+        DROP FUNCTION IF EXISTS {table}_search_vector_trigger();
+        ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector;
+    """.format(table=table)
+
+    return create_sql, drop_sql
@@ -24,6 +24,14 @@ class BaseEventsPushBackend(object, metaclass=abc.ABCMeta):
     def emit_event(self, message:str, *, routing_key:str, channel:str="events"):
         pass
 
+    def emit_events(self, events:list):
+        """
+        Send a list of (message, routing_key, channel) events. Backends
+        able to send them at once should override it.
+        """
+        for message, routing_key, channel in events:
+            self.emit_event(message, routing_key=routing_key, channel=channel)
+
 
 def load_class(path):
     """
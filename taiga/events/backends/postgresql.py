@@ -12,19 +12,97 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import logging
+
 from django.db import transaction
 from django.db import connection
 
+from taiga.base.utils.db import CommitBuffer
+
 from . import base
 
+log = logging.getLogger("taiga.events")
+
+# Postgresql rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_SIZE = 7999
+
+
+def _get_notify_channel(routing_key:str, channel:str) -> str:
+    routing_key = routing_key.replace(".", "__")
+    return "{channel}_{routing_key}".format(channel=channel,
+                                            routing_key=routing_key)
+
 
 class EventsPushBackend(base.BaseEventsPushBackend):
     @transaction.atomic
     def emit_event(self, message:str, *, routing_key:str, channel:str="events"):
-        routing_key = routing_key.replace(".", "__")
-        channel = "{channel}_{routing_key}".format(channel=channel,
-                                                   routing_key=routing_key)
+        channel = _get_notify_channel(routing_key, channel)
         sql = "NOTIFY {channel}, %s".format(channel=channel)
         cursor = connection.cursor()
         cursor.execute(sql, [message])
         cursor.close()
+
+
+def split_payload(message:str) -> list:
+    """
+    Split a message too big for a NOTIFY in several messages, each one
+    with a part of its list of pks. Messages that can't be split are
+    discarded.
+    """
+    if len(message.encode("utf-8")) <= MAX_PAYLOAD_SIZE:
+        return [message]
+
+    event = json.loads(message)
+    pks = event.get("data", {}).get("pk")
+    if not isinstance(pks, list) or len(pks) < 2:
+        log.error("Discarded event of %s bytes, postgresql notifications "
+                  "are limited to %s bytes", len(message.encode("utf-8")), MAX_PAYLOAD_SIZE)
+        return []
+
+    messages = []
+    middle = len(pks) // 2
+    for part in [pks[:middle], pks[middle:]]:
+        event["data"]["pk"] = part
+        messages += split_payload(json.dumps(event))
+    return messages
+
+
+def _notify(notifications):
+    if not notifications:
+        return
+
+    values = ", ".join(["(%s, %s)"] * len(notifications))
+    sql = ("SELECT pg_notify(notifications.channel, notifications.payload) "
+           "FROM (VALUES {values}) AS notifications(channel, payload)").format(values=values)
+    params = [value for notification in notifications for value in notification]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+# Notifications of the current transaction waiting to be sent
+_pending_notifications = CommitBuffer(_notify)
+
+
+class BatchedEventsPushBackend(base.BaseEventsPushBackend):
+    """
+    Send the notifications with pg_notify in a single query.
+
+    Inside a transaction the notifications are accumulated and sent when
+    it commits, the ones of a rolled back savepoint are discarded.
+    Payloads over the postgresql limit are split by pks.
+    """
+    def emit_event(self, message:str, *, routing_key:str, channel:str="events"):
+        self.emit_events([(message, routing_key, channel)])
+
+    def emit_events(self, events:list):
+        notifications = []
+        for message, routing_key, channel in events:
+            notify_channel = _get_notify_channel(routing_key, channel)
+            notifications += [(notify_channel, payload) for payload in split_payload(message)]
+
+        if not connection.in_atomic_block:
+            _notify(notifications)
+            return
+
+        _pending_notifications.add(*notifications)
@@ -12,8 +12,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
+import os
 import logging
+import threading
+
+from contextlib import contextmanager
 
 from amqp import Connection as AmqpConnection
 from amqp.basic_message import Message as AmqpMessage
@@ -21,10 +24,10 @@ from urllib.parse import urlparse
 
 from . import base
 
-log = logging.getLogger("tagia.events")
+log = logging.getLogger("taiga.events")
 
 
-def _make_rabbitmq_connection(url):
+def _make_rabbitmq_connection(url, *, confirm_publish=False):
     parse_result = urlparse(url)
 
     # Parse host & user/password
@@ -40,26 +43,140 @@ def _make_rabbitmq_connection(url):
 
     vhost = parse_result.path
     return AmqpConnection(host=host, userid=user,
-                          password=password, virtual_host=vhost[1:])
+                          password=password, virtual_host=vhost[1:],
+                          confirm_publish=confirm_publish)
 
 
-class EventsPushBackend(base.BaseEventsPushBackend):
-    def __init__(self, url):
-        self.url = url
+class PublishError(Exception):
+    """
+    The message may have reached the broker, so it
+    can't be sent again without duplicating it.
+    """
 
-    def emit_event(self, message:str, *, routing_key:str, channel:str="events"):
-        connection = _make_rabbitmq_connection(self.url)
+
+class PooledChannel(object):
+    """
+    An open AMQP connection with its channel and the exchanges
+    already declared on it.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.channel = connection.channel()
+        self.declared_exchanges = set()
+
+    def publish(self, message:str, *, routing_key:str, exchange:str):
+        if exchange not in self.declared_exchanges:
+            self.channel.exchange_declare(exchange=exchange, type="topic", auto_delete=True)
+            self.declared_exchanges.add(exchange)
 
         try:
-            rchannel = connection.channel()
-            message = AmqpMessage(message)
+            self.channel.basic_publish(AmqpMessage(message), routing_key=routing_key, exchange=exchange)
+        except Exception as e:
+            raise PublishError("Error publishing the event") from e
+
+    def close(self):
+        try:
+            self.channel.close()
+            self.connection.close()
+        except Exception:
+            log.debug("Error closing the rabbitmq connection", exc_info=True)
 
-            rchannel.exchange_declare(exchange=channel, type="topic", auto_delete=True)
-            rchannel.basic_publish(message, routing_key=routing_key, exchange=channel)
-            rchannel.close()
 
+class ConnectionPool(object):
+    """
+    Keep up to `size` idle connections to rabbitmq, opened on demand.
+
+    The pool is reset after a fork (gunicorn workers, celery pool...)
+    because a child process can't share the sockets of its parent.
+    """
+    def __init__(self, url:str, *, size:int=4, confirm_publish:bool=False):
+        self.url = url
+        self.size = size
+        self.confirm_publish = confirm_publish
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # The connections inherited from the parent process are dropped
+        # without closing them, the parent is still using them.
+        self._pid = os.getpid()
+        self._idle = []
+
+    def _get(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            if self._idle:
+                return self._idle.pop()
+
+        connection = _make_rabbitmq_connection(self.url, confirm_publish=self.confirm_publish)
+        return PooledChannel(connection)
+
+    def _put(self, pooled_channel):
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(pooled_channel)
+                return
+
+        pooled_channel.close()
+
+    @contextmanager
+    def channel(self):
+        pooled_channel = self._get()
+        try:
+            yield pooled_channel
         except Exception:
-            log.error("Unhandled exception", exc_info=True)
+            # The connection may be broken, it is discarded and the next
+            # request will open a new one.
+            pooled_channel.close()
+            raise
+        else:
+            self._put(pooled_channel)
 
-        finally:
-            connection.close()
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for pooled_channel in idle:
+            pooled_channel.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url:str, *, size:int=4, confirm_publish:bool=False):
+    key = (url, size, confirm_publish)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(url, size=size, confirm_publish=confirm_publish)
+        return _pools[key]
+
+
+class EventsPushBackend(base.BaseEventsPushBackend):
+    def __init__(self, url, pool_size=4, confirm_publish=False):
+        self.url = url
+        self.pool = get_connection_pool(url, size=pool_size, confirm_publish=confirm_publish)
+
+    def emit_event(self, message:str, *, routing_key:str, channel:str="events"):
+        # A stale connection of the pool (closed by the broker, a network
+        # error...) is only detected when it is used. If it fails before
+        # publishing (opening it, declaring the exchange) the event is sent
+        # once more with a fresh connection; if it fails publishing it is
+        # not, because it may have been delivered.
+        for attempt in range(2):
+            try:
+                with self.pool.channel() as pooled_channel:
+                    pooled_channel.publish(message, routing_key=routing_key, exchange=channel)
+                return
+            except PublishError:
+                log.error("Unhandled exception", exc_info=True)
+                self.pool.clear()
+                return
+            except Exception:
+                if attempt:
+                    log.error("Unhandled exception", exc_info=True)
+                else:
+                    # The other idle connections are probably broken too
+                    self.pool.clear()
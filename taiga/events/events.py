@@ -16,8 +16,10 @@ import json
 import collections
 
 from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
 
 from taiga.base.utils import json
+from taiga.base.utils.db import CommitBuffer
 from taiga.base.utils.db import get_typename_for_model_instance
 from . import middleware as mw
 from . import backends
@@ -32,6 +34,10 @@ watched_types = set([
     "milestones.milestone",
 ])
 
+def _make_routing_key(projectid:int, content_type:str) -> str:
+    app_name, model_name = content_type.split(".", 1)
+    return "changes.project.{0}.{1}".format(projectid, app_name)
+
 
 def emit_event(data:dict, routing_key:str, *,
                sessionid:str=None, channel:str="events"):
@@ -64,9 +70,7 @@ def emit_event_for_model(obj, *, type:str="change", channel:str="events",
 
     projectid = getattr(obj, "project_id")
     pk = getattr(obj, "pk", None)
-
-    app_name, model_name = content_type.split(".", 1)
-    routing_key = "changes.project.{0}.{1}".format(projectid, app_name)
+    routing_key = _make_routing_key(projectid, content_type)
 
     data = {"type": type,
             "matches": content_type,
@@ -84,8 +88,7 @@ def emit_event_for_ids(ids, content_type:str, projectid:int, *,
     assert isinstance(ids, collections.Iterable)
     assert content_type, "'content_type' parameter is mandatory"
 
-    app_name, model_name = content_type.split(".", 1)
-    routing_key = "changes.project.{0}.{1}".format(projectid, app_name)
+    routing_key = _make_routing_key(projectid, content_type)
 
     data = {"type": type,
             "matches": content_type,
@@ -95,3 +98,65 @@ def emit_event_for_ids(ids, content_type:str, projectid:int, *,
                       channel=channel,
                       sessionid=sessionid,
                       data=data)
+
+
+def emit_event_for_model_on_commit(obj, *, type:str="change", channel:str="events",
+                                   content_type:str=None, sessionid:str=None):
+    """
+    Sends a model change event when the current transaction commits.
+
+    The events of the same transaction are grouped by routing key and type
+    and sent as a single message with the list of pks (a change of a pk
+    created or deleted in the same transaction is not sent). With
+    EVENTS_ASYNC_SENDER they are sent by a background thread.
+    """
+
+    if obj._importing:
+        return None
+
+    assert type in set(["create", "change", "delete"])
+    assert hasattr(obj, "project_id")
+
+    if not content_type:
+        content_type = get_typename_for_model_instance(obj)
+
+    key = (content_type, obj.project_id, type, channel, sessionid)
+    _buffer.add((key, obj.pk))
+
+
+def _emit_buffered_events(events):
+    buffered_events = collections.OrderedDict()
+    for key, pk in events:
+        buffered_events.setdefault(key, collections.OrderedDict())[pk] = None
+
+    messages = []
+    for (content_type, projectid, type, channel, sessionid), pks in buffered_events.items():
+        if type == "change":
+            created_pks = buffered_events.get((content_type, projectid, "create", channel, sessionid), {})
+            deleted_pks = buffered_events.get((content_type, projectid, "delete", channel, sessionid), {})
+            pks = [pk for pk in pks if pk not in created_pks and pk not in deleted_pks]
+        else:
+            pks = list(pks)
+
+        if not pks:
+            continue
+
+        data = {"session_id": sessionid,
+                "data": {"type": type,
+                         "matches": content_type,
+                         "pk": pks[0] if len(pks) == 1 else pks}}
+        messages.append((json.dumps(data), _make_routing_key(projectid, content_type), channel))
+
+    if not messages:
+        return
+
+    if getattr(settings, "EVENTS_ASYNC_SENDER", False):
+        from .sender import events_sender
+        events_sender.put(messages)
+    else:
+        backend = backends.get_events_backend()
+        backend.emit_events(messages)
+
+
+# Events of the current transaction waiting to be sent
+_buffer = CommitBuffer(_emit_buffered_events)
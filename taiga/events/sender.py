@@ -0,0 +1,98 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import queue
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from . import backends
+
+log = logging.getLogger("taiga.events")
+
+
+class EventsSender(object):
+    """
+    Background thread that sends the events of this process so a slow
+    events backend doesn't block the requests.
+
+    The queue is bounded: when it is full the new events are dropped
+    and counted. get_stats() returns the counters, they are logged
+    with the dropped and failed events and exported for monitoring
+    by the stats/events API (see `taiga.stats`).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.queue = None
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        with self.lock:
+            # After a fork the thread and the queue of the parent process
+            # are not usable
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.queue = queue.Queue(maxsize=getattr(settings, "EVENTS_SENDER_QUEUE_SIZE", 1000))
+                self.thread = None
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="events-sender", daemon=True)
+                self.thread.start()
+
+    def put(self, events:list):
+        self.start()
+        try:
+            self.queue.put_nowait(events)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += len(events)
+            log.warning("Events sender queue is full, {} events dropped ({})".format(
+                len(events), self.get_stats()))
+
+    def run(self):
+        events_queue = self.queue
+        while True:
+            events = events_queue.get()
+            try:
+                backends.get_events_backend().emit_events(events)
+                with self.stats_lock:
+                    self.sent += len(events)
+            except Exception:
+                with self.stats_lock:
+                    self.failed += len(events)
+                log.exception("Error sending {} events ({})".format(len(events), self.get_stats()))
+            finally:
+                connection.close()
+                events_queue.task_done()
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+                "queue_size": self.queue.maxsize if self.queue is not None else 0,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+
+events_sender = EventsSender()
@@ -16,7 +16,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.db.models import signals
-from django.db import connection
 
 from django.dispatch import receiver
 
@@ -42,8 +41,7 @@ def on_save_any_model(sender, instance, created, **kwargs):
     if created:
         type = "create"
 
-    emit_event = lambda: events.emit_event_for_model(instance, sessionid=sesionid, type=type)
-    connection.on_commit(emit_event)
+    events.emit_event_for_model_on_commit(instance, sessionid=sesionid, type=type)
 
 
 def on_delete_any_model(sender, instance, **kwargs):
@@ -55,5 +53,5 @@ def on_delete_any_model(sender, instance, **kwargs):
         return
 
     sesionid = mw.get_current_session_id()
-    events.emit_event_for_model(instance, sessionid=sesionid, type="delete")
+    events.emit_event_for_model_on_commit(instance, sessionid=sesionid, type="delete")
     
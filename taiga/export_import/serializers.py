@@ -639,7 +639,7 @@ class TimelineExportSerializer(serializers.ModelSerializer):
     data = TimelineDataField()
     class Meta:
         model = timeline_models.Timeline
-        exclude = ('id', 'project', 'namespace', 'object_id')
+        exclude = ('id', 'project', 'namespace', 'object_id', 'event')
 
 
 class ProjectExportSerializer(WatcheableObjectModelSerializer):
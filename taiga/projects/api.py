@@ -20,6 +20,7 @@ from easy_thumbnails.source_generators import pil_image
 from dateutil.relativedelta import relativedelta
 
 from django.apps import apps
+from django.conf import settings
 from django.db.models import signals, Prefetch
 from django.db.models import Value as V
 from django.db.models.functions import Coalesce
@@ -117,18 +118,21 @@ class ProjectViewSet(LikedResourceMixin, HistoryResourceMixin,
         # If filtering an activity period we must exclude the activities not updated recently enough
         now = timezone.now()
         order_by_field_name = self._get_order_by_field_name()
-        if order_by_field_name == "total_fans_last_week":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(weeks=1))
-        elif order_by_field_name == "total_fans_last_month":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(months=1))
-        elif order_by_field_name == "total_fans_last_year":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(years=1))
-        elif order_by_field_name == "total_activity_last_week":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(weeks=1))
-        elif order_by_field_name == "total_activity_last_month":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(months=1))
-        elif order_by_field_name == "total_activity_last_year":
-            qs = qs.filter(totals_updated_datetime__gte=now-relativedelta(years=1))
+        periods = {
+            "total_fans_last_week": relativedelta(weeks=1),
+            "total_fans_last_month": relativedelta(months=1),
+            "total_fans_last_year": relativedelta(years=1),
+            "total_activity_last_week": relativedelta(weeks=1),
+            "total_activity_last_month": relativedelta(months=1),
+            "total_activity_last_year": relativedelta(years=1),
+        }
+        if order_by_field_name in periods:
+            since = now - periods[order_by_field_name]
+            if not settings.CELERY_ENABLED:
+                # Without celery the rolling windows are moved here
+                # (only the ones not refreshed today)
+                services.refresh_stale_projects_totals(since=since)
+            qs = qs.filter(totals_updated_datetime__gte=since)
 
         return qs
 
@@ -302,7 +306,7 @@ class ProjectViewSet(LikedResourceMixin, HistoryResourceMixin,
     def stats(self, request, pk=None):
         project = self.get_object()
         self.check_permissions(request, "stats", project)
-        return response.Ok(services.get_stats_for_project(project))
+        return response.Ok(services.get_cached_stats_for_project(project))
 
     def _regenerate_csv_uuid(self, project, field):
         uuid_value = uuid.uuid4().hex
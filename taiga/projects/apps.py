@@ -98,6 +98,77 @@ def disconnect_task_status_signals():
 
 
 
+## Project stats Signals
+
+_project_stats_senders = (
+    ("userstories", "UserStory", "invalidate_project_stats"),
+    ("userstories", "RolePoints", "invalidate_project_stats_for_role_points"),
+    ("milestones", "Milestone", "invalidate_project_stats"),
+    ("projects", "Points", "invalidate_project_stats"),
+    ("projects", "Project", "invalidate_project_stats_for_project"),
+    ("tasks", "Task", "invalidate_milestone_stats"),
+    ("projects", "TaskStatus", "invalidate_milestone_stats"),
+)
+
+
+def connect_project_stats_signals():
+    from . import signals as handlers
+    # On user stories, role points, milestones, points or projects changes
+    # invalidate the cached project stats (and the milestone stats on
+    # tasks and task statuses changes too).
+    for app_label, model_name, handler_name in _project_stats_senders:
+        handler = getattr(handlers, handler_name)
+        dispatch_uid = "invalidate_project_stats_{}_{}".format(app_label, model_name)
+        signals.post_save.connect(handler, sender=apps.get_model(app_label, model_name),
+                                  dispatch_uid=dispatch_uid)
+        signals.post_delete.connect(handler, sender=apps.get_model(app_label, model_name),
+                                    dispatch_uid=dispatch_uid)
+
+
+def disconnect_project_stats_signals():
+    for app_label, model_name, handler_name in _project_stats_senders:
+        dispatch_uid = "invalidate_project_stats_{}_{}".format(app_label, model_name)
+        signals.post_save.disconnect(sender=apps.get_model(app_label, model_name),
+                                     dispatch_uid=dispatch_uid)
+        signals.post_delete.disconnect(sender=apps.get_model(app_label, model_name),
+                                       dispatch_uid=dispatch_uid)
+
+
+## History values Signals
+
+_history_values_senders = (
+    ("projects", "UserStoryStatus"),
+    ("projects", "TaskStatus"),
+    ("projects", "IssueStatus"),
+    ("projects", "IssueType"),
+    ("projects", "Points"),
+    ("projects", "Priority"),
+    ("projects", "Severity"),
+    ("users", "Role"),
+)
+
+
+def connect_history_values_signals():
+    from . import signals as handlers
+    # On project attributes changes clear their names cached
+    # by the history values.
+    for app_label, model_name in _history_values_senders:
+        dispatch_uid = "invalidate_history_values_{}_{}".format(app_label, model_name)
+        signals.post_save.connect(handlers.invalidate_history_values, sender=apps.get_model(app_label, model_name),
+                                  dispatch_uid=dispatch_uid)
+        signals.post_delete.connect(handlers.invalidate_history_values, sender=apps.get_model(app_label, model_name),
+                                    dispatch_uid=dispatch_uid)
+
+
+def disconnect_history_values_signals():
+    for app_label, model_name in _history_values_senders:
+        dispatch_uid = "invalidate_history_values_{}_{}".format(app_label, model_name)
+        signals.post_save.disconnect(sender=apps.get_model(app_label, model_name),
+                                     dispatch_uid=dispatch_uid)
+        signals.post_delete.disconnect(sender=apps.get_model(app_label, model_name),
+                                       dispatch_uid=dispatch_uid)
+
+
 class ProjectsAppConfig(AppConfig):
     name = "taiga.projects"
     verbose_name = "Projects"
@@ -107,3 +178,5 @@ class ProjectsAppConfig(AppConfig):
         connect_memberships_signals()
         connect_us_status_signals()
         connect_task_status_signals()
+        connect_project_stats_signals()
+        connect_history_values_signals()
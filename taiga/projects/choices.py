@@ -31,3 +31,10 @@ BLOCKING_CODES = [
     (BLOCKED_BY_STAFF, _("This project was blocked by staff")),
     (BLOCKED_BY_OWNER_LEAVING, _("This project was blocked because the owner left"))
 ]
+
+TOTALS_BUCKET_FANS = "fans"
+TOTALS_BUCKET_ACTIVITY = "activity"
+TOTALS_BUCKET_KINDS = (
+    (TOTALS_BUCKET_FANS, _("Fans")),
+    (TOTALS_BUCKET_ACTIVITY, _("Activity")),
+)
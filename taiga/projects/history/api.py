@@ -31,6 +31,7 @@ from . import services
 
 class HistoryViewSet(ReadOnlyListViewSet):
     serializer_class = serializers.HistoryEntrySerializer
+    cursor_ordering = ("created_at", "id")
 
     content_type = None
 
@@ -50,8 +51,10 @@ class HistoryViewSet(ReadOnlyListViewSet):
         # Switch between paginated or standard style responses
         page = self.paginate_queryset(queryset)
         if page is not None:
+            services.attach_projects_to_history_entries(page.object_list)
             serializer = self.get_pagination_serializer(page)
         else:
+            queryset = services.attach_projects_to_history_entries(queryset)
             serializer = self.get_serializer(queryset, many=True)
 
         return response.Ok(serializer.data)
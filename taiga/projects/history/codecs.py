@@ -0,0 +1,137 @@
+# Copyright (C) 2013 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Storage codecs for the json fields of history entries
+(snapshot, diff and values).
+
+Encoded values are stored as a json envelope with the codec
+name, so rows stored with different codecs (or not encoded
+at all) can coexist and are always decoded transparently.
+"""
+
+import base64
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+CODEC_KEY = "__codec__"
+DATA_KEY = "data"
+
+# Preset dictionary shared by all zlib encoded values. It contains the
+# field names and fragments repeated on almost every snapshot and diff,
+# so even small values (under the postgresql toast threshold) compress well.
+# The values are serialized with compact separators, the dictionary must
+# use them too.
+ZLIB_DICTIONARY = (b'"tribe_gig":"custom_attributes":[],"blocked_note":"",'
+                   b'"is_blocked":false,"is_closed":false,"is_iocaine":false,'
+                   b'"client_requirement":false,"team_requirement":false,'
+                   b'"from_issue":null,"finish_date":"None","points":{},'
+                   b'"backlog_order":"sprint_order":"kanban_order":'
+                   b'"taskboard_order":"us_order":"user_story":"milestone":null,'
+                   b'"assigned_to":null,"attachments":[],"tags":[],'
+                   b'"is_deprecated":false,"description":"","thumb_url":'
+                   b'"filename":"order":"url":"id":"subject":"status":'
+                   b'"severity":"priority":"type":"owner":"ref":'
+                   b'"content":"slug":"users":"roles":"description_html":')
+
+class JsonCodec(object):
+    """
+    Plain json codec (values are stored as they are).
+    """
+    name = "json"
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+
+class ZlibJsonCodec(object):
+    """
+    Compressed json codec: values are serialized to json,
+    compressed with zlib (using a shared preset dictionary)
+    and stored base64 encoded.
+
+    The name is versioned with the dictionary, a new dictionary
+    needs a new name (and a codec to decode the old values).
+    """
+    name = "zlib1"
+    dictionary = ZLIB_DICTIONARY
+
+    def __init__(self, level:int=6):
+        self.level = level
+
+    def encode(self, value):
+        compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+        raw = json.dumps(value, cls=DjangoJSONEncoder, separators=(",", ":")).encode("utf-8")
+        data = compressor.compress(raw) + compressor.flush()
+        return {CODEC_KEY: self.name, DATA_KEY: base64.b64encode(data).decode("ascii")}
+
+    def decode(self, value):
+        decompressor = zlib.decompressobj(zdict=self.dictionary)
+        raw = decompressor.decompress(base64.b64decode(value[DATA_KEY]))
+        return json.loads(raw.decode("utf-8"))
+
+
+_codecs = {codec.name: codec for codec in [JsonCodec(), ZlibJsonCodec()]}
+
+# Configured codecs by class path and options
+_configured_codecs = {}
+
+
+def get_codec(path:str=None, options:dict=None):
+    if path is None:
+        path = getattr(settings, "HISTORY_STORAGE_CODEC", "taiga.projects.history.codecs.JsonCodec")
+
+    if options is None:
+        options = getattr(settings, "HISTORY_STORAGE_CODEC_OPTIONS", {})
+
+    key = (path, json.dumps(options, sort_keys=True))
+    codec = _configured_codecs.get(key, None)
+    if codec is None:
+        codec = _configured_codecs[key] = import_string(path)(**options)
+        _codecs.setdefault(codec.name, codec)
+    return codec
+
+
+def is_encoded(value) -> bool:
+    return isinstance(value, dict) and CODEC_KEY in value and DATA_KEY in value
+
+
+def encode(value, codec=None):
+    if value is None or is_encoded(value):
+        return value
+
+    if codec is None:
+        codec = get_codec()
+    return codec.encode(value)
+
+
+def decode(value):
+    if not is_encoded(value):
+        return value
+
+    codec = _codecs.get(value[CODEC_KEY], None)
+    if codec is None:
+        raise RuntimeError("No history storage codec found for {}".format(value[CODEC_KEY]))
+    return codec.decode(value)
@@ -15,66 +15,194 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import defaultdict
+from contextlib import contextmanager
 from contextlib import suppress
 
 from functools import partial
 from django.apps import apps
-from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 
 from taiga.base.utils.urls import get_absolute_url
 from taiga.base.utils.iterators import as_tuple
 from taiga.base.utils.iterators import as_dict
-from taiga.mdrender.service import render as mdrender
+from taiga.base.utils.cache import get_cache_version, bump_cache_version_on_commit, get_cache_timeout
 
 from taiga.projects.attachments.services import get_timeline_image_thumbnail_url
 
 import os
+import threading
 
 ####################
 # Values
 ####################
 
-@as_dict
-def _get_generic_values(ids:tuple, *, typename=None, attr:str="name") -> tuple:
-    app_label, model_name = typename.split(".", 1)
-    content_type = ContentType.objects.get(app_label=app_label, model=model_name)
-    model_cls = content_type.model_class()
+class ValuesResolver(object):
+    """
+    Resolves values of many history diffs sharing the
+    fetched values between them.
+
+    In collecting mode the requested identifiers are only
+    recorded (and nothing is resolved), so they can be fetched
+    later with one query per model calling `fetch_requested`.
+    """
+    def __init__(self):
+        self.collecting = False
+        self.requested = {}
+        self.values = defaultdict(dict)
+
+    def resolve(self, key:str, ids, fetch) -> dict:
+        ids = set(filter(lambda x: x is not None, ids))
+
+        if self.collecting:
+            self.requested.setdefault(key, (fetch, set()))[1].update(ids)
+            return {}
+
+        cached = self.values[key]
+        missing = tuple(x for x in ids if str(x) not in cached)
+        if missing:
+            cached.update(fetch(missing))
+
+        return {str(x): cached[str(x)] for x in ids if str(x) in cached}
+
+    def fetch_requested(self):
+        for key, (fetch, ids) in self.requested.items():
+            self.values[key].update(fetch(tuple(ids)))
+        self.requested = {}
+
+
+_local = threading.local()
+
 
-    ids = filter(lambda x: x is not None, ids)
+@contextmanager
+def values_resolver():
+    """
+    Share a ValuesResolver with all the values
+    implementations called inside this block.
+    """
+    previous = getattr(_local, "resolver", None)
+    _local.resolver = resolver = ValuesResolver()
+    try:
+        yield resolver
+    finally:
+        _local.resolver = previous
+
+
+@contextmanager
+def values_of_project(project_id):
+    """
+    The values implementations called inside this block resolve
+    the project attributes (statuses, points, roles...) with the
+    process wide cache of the project `project_id`.
+    """
+    previous = getattr(_local, "project_id", None)
+    _local.project_id = project_id
+    try:
+        yield
+    finally:
+        _local.project_id = previous
+
+
+def _resolve_values(key:str, ids, fetch) -> dict:
+    resolver = getattr(_local, "resolver", None)
+    if resolver is None:
+        return fetch(tuple(filter(lambda x: x is not None, ids)))
+    return resolver.resolve(key, ids, fetch)
+
+
+@as_dict
+def _fetch_generic_values(ids:tuple, *, typename=None, attr:str="name") -> tuple:
+    model_cls = apps.get_model(typename)
     qs = model_cls.objects.filter(pk__in=ids)
     for instance in qs:
         yield str(instance.pk), getattr(instance, attr)
 
 
 @as_dict
-def _get_users_values(ids:set) -> dict:
+def _fetch_users_values(ids:tuple) -> dict:
     user_model = apps.get_model("users", "User")
-    ids = filter(lambda x: x is not None, ids)
-    qs = user_model.objects.filter(pk__in=tuple(ids))
+    qs = user_model.objects.filter(pk__in=ids)
 
     for user in qs:
         yield str(user.pk), user.get_full_name()
 
 
 @as_dict
-def _get_user_story_values(ids:set) -> dict:
+def _fetch_user_story_values(ids:tuple) -> dict:
     userstory_model = apps.get_model("userstories", "UserStory")
-    ids = filter(lambda x: x is not None, ids)
-    qs = userstory_model.objects.filter(pk__in=tuple(ids))
+    qs = userstory_model.objects.filter(pk__in=ids)
 
     for userstory in qs:
         yield str(userstory.pk), "#{} {}".format(userstory.ref, userstory.subject)
 
 
-_get_us_status_values = partial(_get_generic_values, typename="projects.userstorystatus")
-_get_task_status_values = partial(_get_generic_values, typename="projects.taskstatus")
-_get_issue_status_values = partial(_get_generic_values, typename="projects.issuestatus")
-_get_issue_type_values = partial(_get_generic_values, typename="projects.issuetype")
-_get_role_values = partial(_get_generic_values, typename="users.role")
-_get_points_values = partial(_get_generic_values, typename="projects.points")
-_get_priority_values = partial(_get_generic_values, typename="projects.priority")
-_get_severity_values = partial(_get_generic_values, typename="projects.severity")
+def _get_generic_values(ids:tuple, *, typename=None, attr:str="name") -> dict:
+    fetch = partial(_fetch_generic_values, typename=typename, attr=attr)
+    return _resolve_values("{}.{}".format(typename, attr), ids, fetch)
+
+
+def _get_users_values(ids:set) -> dict:
+    return _resolve_values("users.user", ids, _fetch_users_values)
+
+
+def _get_user_story_values(ids:set) -> dict:
+    return _resolve_values("userstories.userstory", ids, _fetch_user_story_values)
+
+
+# Names of the project attributes by (project id, typename), fetched all at
+# once and stored in the cache with a version bumped by the post_save and
+# post_delete signals of their models (see `taiga.projects.apps`), so renames
+# made by other processes are seen. With a process local cache the versions
+# of other processes can't be seen, and the names are kept
+# PROCESS_LOCAL_CACHE_TIMEOUT at most (see `get_cache_timeout`).
+def _get_project_values_cache_version_key(project_id, typename:str) -> str:
+    return "history-project-values-version:{}:{}".format(project_id, typename)
+
+
+def clear_project_values_cache(project_id, typename:str):
+    bump_cache_version_on_commit(_get_project_values_cache_version_key(project_id, typename))
+
+
+def _get_cached_project_values(project_id, typename:str) -> dict:
+    version = get_cache_version(_get_project_values_cache_version_key(project_id, typename))
+    key = "history-project-values:{}:{}:{}".format(project_id, typename, version)
+
+    names = cache.get(key)
+    if names is None:
+        model_cls = apps.get_model(typename)
+        qs = model_cls.objects.filter(project_id=project_id).values_list("pk", "name")
+        names = {str(pk): name for pk, name in qs}
+        cache.set(key, names, timeout=get_cache_timeout(settings.HISTORY_VALUES_CACHE_TIMEOUT))
+    return names
+
+
+def _get_project_values(ids:tuple, *, typename=None) -> dict:
+    project_id = getattr(_local, "project_id", None)
+    if project_id is None:
+        return _get_generic_values(ids, typename=typename)
+
+    cached = _get_cached_project_values(project_id, typename)
+
+    ids = set(filter(lambda x: x is not None, ids))
+    values = {str(x): cached[str(x)] for x in ids if str(x) in cached}
+
+    # Identifiers of other projects or created by other processes
+    missing = tuple(x for x in ids if str(x) not in cached)
+    if missing:
+        values.update(_get_generic_values(missing, typename=typename))
+    return values
+
+
+_get_us_status_values = partial(_get_project_values, typename="projects.userstorystatus")
+_get_task_status_values = partial(_get_project_values, typename="projects.taskstatus")
+_get_issue_status_values = partial(_get_project_values, typename="projects.issuestatus")
+_get_issue_type_values = partial(_get_project_values, typename="projects.issuetype")
+_get_role_values = partial(_get_project_values, typename="users.role")
+_get_points_values = partial(_get_project_values, typename="projects.points")
+_get_priority_values = partial(_get_project_values, typename="projects.priority")
+_get_severity_values = partial(_get_project_values, typename="projects.severity")
 _get_milestone_values = partial(_get_generic_values, typename="milestones.milestone")
 
 
@@ -256,11 +384,8 @@ def milestone_freezer(milestone) -> dict:
 
 
 def userstory_freezer(us) -> dict:
-    rp_cls = apps.get_model("userstories", "RolePoints")
-    rpqsd = rp_cls.objects.filter(user_story=us)
-
     points = {}
-    for rp in rpqsd:
+    for rp in us.role_points.all():
         points[str(rp.role_id)] = rp.points_id
 
     snapshot = {
@@ -274,7 +399,6 @@ def userstory_freezer(us) -> dict:
         "kanban_order": us.kanban_order,
         "subject": us.subject,
         "description": us.description,
-        "description_html": mdrender(us.project, us.description),
         "assigned_to": us.assigned_to_id,
         "milestone": us.milestone_id,
         "client_requirement": us.client_requirement,
@@ -285,7 +409,6 @@ def userstory_freezer(us) -> dict:
         "from_issue": us.generated_from_issue_id,
         "is_blocked": us.is_blocked,
         "blocked_note": us.blocked_note,
-        "blocked_note_html": mdrender(us.project, us.blocked_note),
         "custom_attributes": extract_user_story_custom_attributes(us),
         "tribe_gig": us.tribe_gig,
     }
@@ -304,13 +427,11 @@ def issue_freezer(issue) -> dict:
         "milestone": issue.milestone_id,
         "subject": issue.subject,
         "description": issue.description,
-        "description_html": mdrender(issue.project, issue.description),
         "assigned_to": issue.assigned_to_id,
         "attachments": extract_attachments(issue),
         "tags": issue.tags,
         "is_blocked": issue.is_blocked,
         "blocked_note": issue.blocked_note,
-        "blocked_note_html": mdrender(issue.project, issue.blocked_note),
         "custom_attributes": extract_issue_custom_attributes(issue),
     }
 
@@ -325,7 +446,6 @@ def task_freezer(task) -> dict:
         "milestone": task.milestone_id,
         "subject": task.subject,
         "description": task.description,
-        "description_html": mdrender(task.project, task.description),
         "assigned_to": task.assigned_to_id,
         "attachments": extract_attachments(task),
         "taskboard_order": task.taskboard_order,
@@ -335,7 +455,6 @@ def task_freezer(task) -> dict:
         "is_iocaine": task.is_iocaine,
         "is_blocked": task.is_blocked,
         "blocked_note": task.blocked_note,
-        "blocked_note_html": mdrender(task.project, task.blocked_note),
         "custom_attributes": extract_task_custom_attributes(task),
     }
 
@@ -347,7 +466,6 @@ def wikipage_freezer(wiki) -> dict:
         "slug": wiki.slug,
         "owner": wiki.owner_id,
         "content": wiki.content,
-        "content_html": mdrender(wiki.project, wiki.content),
         "attachments": extract_attachments(wiki),
     }
 
@@ -0,0 +1,65 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Examples:
+# python manage.py rebuild_history_snapshots
+# python manage.py rebuild_history_snapshots --purge
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django_pglocks import advisory_lock
+
+from taiga.projects.history import services
+from taiga.projects.history.models import HistoryEntry, HistorySnapshot
+
+from optparse import make_option
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Backfill the materialized history snapshots from existing history entries'
+    option_list = BaseCommand.option_list + (
+        make_option('--purge',
+                    action='store_true',
+                    dest='purge',
+                    default=False,
+                    help='Purge existing materialized snapshots'),
+        )
+
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        if options["purge"] == True:
+            HistorySnapshot.objects.all().delete()
+
+        keys = (HistoryEntry.objects.exclude(key=None)
+                                    .exclude(key__in=HistorySnapshot.objects.values("key"))
+                                    .order_by("key")
+                                    .values_list("key", flat=True)
+                                    .distinct())
+
+        total = rest = keys.count()
+        for key in keys.iterator():
+            with transaction.atomic(), advisory_lock(key):
+                fobj, partials = services.rebuild_snapshot_for_key(key)
+                if fobj is not None:
+                    services.store_snapshot_for_key(key, fobj.snapshot, partials=partials)
+
+            rest -= 1
+            logger.debug("[{} / {} remaining] - Rebuild history snapshot for {}".format(rest, total, key))
@@ -0,0 +1,134 @@
+# Copyright (C) 2013 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Examples:
+# python manage.py rewrite_history_storage
+# python manage.py rewrite_history_storage --batch-size 500
+# python manage.py rewrite_history_storage --benchmark --sample 5000
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.test.utils import override_settings
+
+from taiga.projects.history import codecs
+from taiga.projects.history.models import HistoryEntry
+
+from optparse import make_option
+
+import logging
+logger = logging.getLogger(__name__)
+
+FIELDS = ("snapshot", "diff", "values")
+
+
+def _stored_size(value) -> int:
+    if value is None:
+        return 0
+    return len(json.dumps(value, cls=DjangoJSONEncoder).encode("utf-8"))
+
+
+class Command(BaseCommand):
+    help = 'Rewrite history entries with the configured storage codec (HISTORY_STORAGE_CODEC)'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    action='store',
+                    dest='batch_size',
+                    type='int',
+                    default=1000,
+                    help='Number of history entries rewritten per transaction'),
+        ) + (
+        make_option('--benchmark',
+                    action='store_true',
+                    dest='benchmark',
+                    default=False,
+                    help='Only report the size and decode cost of the codec over a sample'),
+        ) + (
+        make_option('--sample',
+                    action='store',
+                    dest='sample',
+                    type='int',
+                    default=1000,
+                    help='Number of history entries used by the benchmark'),
+        )
+
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        codec = codecs.get_codec()
+
+        if options["benchmark"]:
+            self.benchmark(codec, options["sample"])
+        else:
+            self.rewrite(codec, options["batch_size"])
+
+    def rewrite(self, codec, batch_size):
+        total = HistoryEntry.objects.count()
+        done = 0
+        last_id = None
+
+        while True:
+            qs = HistoryEntry.objects.order_by("id").only("id", *FIELDS)
+            if last_id is not None:
+                qs = qs.filter(id__gt=last_id)
+
+            entries = list(qs[:batch_size])
+            if not entries:
+                break
+
+            with transaction.atomic():
+                for entry in entries:
+                    # Queryset update doesn't send post_save signals (timeline, webhooks...)
+                    values = {field: codecs.encode(getattr(entry, field), codec) for field in FIELDS}
+                    HistoryEntry.objects.filter(id=entry.id).update(**values)
+
+            done += len(entries)
+            last_id = entries[-1].id
+            logger.debug("[{} / {}] - Rewrite history entries with {} codec".format(done, total, codec.name))
+
+        self.stdout.write("Rewritten {} history entries with {} codec".format(done, codec.name))
+
+    def benchmark(self, codec, sample):
+        entries = list(HistoryEntry.objects.order_by("-created_at").only("id", *FIELDS)[:sample])
+
+        plain_size = encoded_size = 0
+        encoded_values = []
+        for entry in entries:
+            for field in FIELDS:
+                value = getattr(entry, field)
+                encoded = codecs.encode(value, codec)
+                plain_size += _stored_size(value)
+                encoded_size += _stored_size(encoded)
+                encoded_values.append(encoded)
+
+        start = time.perf_counter()
+        for encoded in encoded_values:
+            codecs.decode(encoded)
+        decode_time = time.perf_counter() - start
+
+        saved = plain_size - encoded_size
+        ratio = (saved / plain_size * 100) if plain_size else 0
+        decode_cost = (decode_time / len(entries) * 1000000) if entries else 0
+
+        self.stdout.write("Codec: {}".format(codec.name))
+        self.stdout.write("Entries: {}".format(len(entries)))
+        self.stdout.write("Plain json: {} bytes".format(plain_size))
+        self.stdout.write("Encoded: {} bytes".format(encoded_size))
+        self.stdout.write("Saved: {} bytes ({:.1f}%)".format(saved, ratio))
+        self.stdout.write("Decode cost: {:.1f} us/entry".format(decode_cost))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django_pgjson.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0008_auto_20150508_1028'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorySnapshot',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('snapshot', django_pgjson.fields.JsonField(null=True, default=None, blank=True)),
+                ('partials', models.PositiveIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+import django_pgjson.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0009_historysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSnapshot',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(max_length=255, db_index=True)),
+                ('user_id', models.IntegerField(null=True, default=None, blank=True)),
+                ('comment', models.TextField(blank=True)),
+                ('snapshot', django_pgjson.fields.JsonField(null=True, default=None, blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import taiga.projects.history.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0010_pendingsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historyentry',
+            name='diff',
+            field=taiga.projects.history.fields.HistoryJsonField(null=True, default=None, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='historyentry',
+            name='snapshot',
+            field=taiga.projects.history.fields.HistoryJsonField(null=True, default=None, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='historyentry',
+            name='values',
+            field=taiga.projects.history.fields.HistoryJsonField(null=True, default=None, blank=True),
+            preserve_default=True,
+        ),
+    ]
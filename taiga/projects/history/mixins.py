@@ -17,7 +17,7 @@
 
 import warnings
 
-from .services import take_snapshot
+from .services import request_snapshot
 from taiga.projects.notifications import services as notifications_services
 
 class HistoryResourceMixin(object):
@@ -66,7 +66,7 @@ class HistoryResourceMixin(object):
 
         notifications_services.analize_object_for_watchers(obj, comment, user)
 
-        self.__last_history = take_snapshot(sobj, comment=comment, user=user, delete=delete)
+        self.__last_history = request_snapshot(sobj, comment=comment, user=user, delete=delete)
         self.__object_saved = True
 
     def post_save(self, obj, created=False):
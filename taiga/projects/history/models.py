@@ -23,9 +23,11 @@ from django.conf import settings
 from django_pgjson.fields import JsonField
 
 from taiga.mdrender.service import get_diff_of_htmls
+from taiga.mdrender.service import render as mdrender
 
 from .choices import HistoryType
 from .choices import HISTORY_TYPE_CHOICES
+from .fields import HistoryJsonField
 
 from taiga.base.utils.diff import make_diff as make_diff_from_dicts
 
@@ -33,6 +35,14 @@ from taiga.base.utils.diff import make_diff as make_diff_from_dicts
 # previous diff has value for the attribute and we want to prevent their propagation
 IGNORE_DIFF_FIELDS = [ "watchers", "description_diff", "content_diff", "blocked_note_diff"]
 
+# Markdown fields whose html version is not stored by freeze_impl but rendered
+# when history entries are read (old entries can still store it).
+HTML_FIELDS = {
+    "description": "description_html",
+    "blocked_note": "blocked_note_html",
+    "content": "content_html",
+}
+
 def _generate_uuid():
     return str(uuid.uuid1())
 
@@ -54,13 +64,13 @@ class HistoryEntry(models.Model):
     key = models.CharField(max_length=255, null=True, default=None, blank=True, db_index=True)
 
     # Stores the last diff
-    diff = JsonField(null=True, blank=True, default=None)
+    diff = HistoryJsonField(null=True, blank=True, default=None)
 
     # Stores the last complete frozen object snapshot
-    snapshot = JsonField(null=True, blank=True, default=None)
+    snapshot = HistoryJsonField(null=True, blank=True, default=None)
 
     # Stores a values of all identifiers used in
-    values = JsonField(null=True, blank=True, default=None)
+    values = HistoryJsonField(null=True, blank=True, default=None)
 
     # Stores a comment
     comment = models.TextField(blank=True)
@@ -102,21 +112,69 @@ class HistoryEntry(models.Model):
         except model.DoesNotExist:
             return None
 
+    @cached_property
+    def project(self):
+        # Set in bulk for lists of entries by
+        # services.attach_projects_to_history_entries
+        if self.key is None:
+            return None
+
+        typename, pk = self.key.split(":", 1)
+        model = apps.get_model(typename)
+        obj = model.objects.filter(pk=pk).first()
+        if obj is None or isinstance(obj, apps.get_model("projects", "Project")):
+            return obj
+        return getattr(obj, "project", None)
+
+    def _render_html(self, text):
+        if text is None or self.project is None:
+            return None
+        return mdrender(self.project, text)
+
+    @cached_property
+    def rendered_diff(self):
+        """
+        Diff with the html version of markdown fields (rendered on read).
+        """
+        if not self.diff:
+            return self.diff
+
+        result = dict(self.diff)
+        for field, html_field in HTML_FIELDS.items():
+            if field in self.diff and html_field not in self.diff:
+                result[html_field] = [self._render_html(value) for value in self.diff[field]]
+        return result
+
+    @cached_property
+    def rendered_snapshot(self):
+        """
+        Snapshot with the html version of markdown fields (rendered on read).
+        """
+        if not self.snapshot:
+            return self.snapshot
+
+        result = dict(self.snapshot)
+        for field, html_field in HTML_FIELDS.items():
+            if field in self.snapshot and html_field not in self.snapshot:
+                result[html_field] = self._render_html(self.snapshot[field])
+        return result
+
     @cached_property
     def values_diff(self):
         result = {}
+        diff = self.rendered_diff
         users_keys = ["assigned_to", "owner"]
 
         def resolve_diff_value(key):
             value = None
-            diff = get_diff_of_htmls(
-                self.diff[key][0] or "",
-                self.diff[key][1] or ""
+            html_diff = get_diff_of_htmls(
+                diff[key][0] or "",
+                diff[key][1] or ""
             )
 
-            if diff:
+            if html_diff:
                 key = "{}_diff".format(key)
-                value = (None, diff)
+                value = (None, html_diff)
 
             return (key, value)
 
@@ -128,19 +186,19 @@ class HistoryEntry(models.Model):
                 return None
             return data[key]
 
-        for key in self.diff:
+        for key in diff:
             value = None
             if key in IGNORE_DIFF_FIELDS:
                 continue
             elif key in["description", "content", "blocked_note"]:
                 (key, value) = resolve_diff_value(key)
             elif key in users_keys:
-                value = [resolve_value("users", x) for x in self.diff[key]]
+                value = [resolve_value("users", x) for x in diff[key]]
             elif key == "points":
                 points = {}
 
-                pointsold = self.diff["points"][0]
-                pointsnew = self.diff["points"][1]
+                pointsold = diff["points"][0]
+                pointsnew = diff["points"][1]
                 # pointsold = pointsnew
 
                 if pointsold is None:
@@ -172,8 +230,8 @@ class HistoryEntry(models.Model):
                     "deleted": [],
                 }
 
-                oldattachs = {x["id"]:x for x in self.diff["attachments"][0]}
-                newattachs = {x["id"]:x for x in self.diff["attachments"][1]}
+                oldattachs = {x["id"]:x for x in diff["attachments"][0]}
+                newattachs = {x["id"]:x for x in diff["attachments"][1]}
 
                 for aid in set(tuple(oldattachs.keys()) + tuple(newattachs.keys())):
                     if aid in oldattachs and aid in newattachs:
@@ -203,8 +261,8 @@ class HistoryEntry(models.Model):
                     "deleted": [],
                 }
 
-                oldcustattrs = {x["id"]:x for x in self.diff["custom_attributes"][0] or []}
-                newcustattrs = {x["id"]:x for x in self.diff["custom_attributes"][1] or []}
+                oldcustattrs = {x["id"]:x for x in diff["custom_attributes"][0] or []}
+                newcustattrs = {x["id"]:x for x in diff["custom_attributes"][1] or []}
 
                 for aid in set(tuple(oldcustattrs.keys()) + tuple(newcustattrs.keys())):
                     if aid in oldcustattrs and aid in newcustattrs:
@@ -226,9 +284,9 @@ class HistoryEntry(models.Model):
                     value = custom_attributes
 
             elif key in self.values:
-                value = [resolve_value(key, x) for x in self.diff[key]]
+                value = [resolve_value(key, x) for x in diff[key]]
             else:
-                value = self.diff[key]
+                value = diff[key]
 
             if not value:
                 continue
@@ -239,3 +297,43 @@ class HistoryEntry(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+
+
+class HistorySnapshot(models.Model):
+    """
+    Domain model that stores the current (materialized)
+    frozen snapshot for each history key.
+
+    It is kept up to date by take_snapshot, so the last
+    snapshot of an object can be obtained with one indexed
+    read instead of replaying all partial diffs.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    snapshot = JsonField(null=True, blank=True, default=None)
+
+    # Number of partial history entries created since
+    # the last complete snapshot entry.
+    partials = models.PositiveIntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+
+
+class PendingSnapshot(models.Model):
+    """
+    Domain model that stores a lightweight marker for
+    a history snapshot requested but not taken yet.
+
+    It is used when HISTORY_ASYNC_SNAPSHOTS is enabled;
+    markers are processed (per key and in sequence order,
+    the id), each one with the object frozen when it was
+    requested, by `taiga.projects.history.services.process_pending_snapshots`.
+    """
+    key = models.CharField(max_length=255, db_index=True)
+    user_id = models.IntegerField(null=True, blank=True, default=None)
+    comment = models.TextField(blank=True)
+    # The object frozen when the snapshot was requested, so every
+    # entry gets the changes of its own request
+    snapshot = JsonField(null=True, blank=True, default=None)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
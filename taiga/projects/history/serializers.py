@@ -27,8 +27,8 @@ HISTORY_ENTRY_I18N_FIELDS=("points", "status", "severity", "priority", "type")
 
 
 class HistoryEntrySerializer(serializers.ModelSerializer):
-    diff = JsonField()
-    snapshot = JsonField()
+    diff = JsonField(source="rendered_diff")
+    snapshot = JsonField(source="rendered_snapshot")
     values = I18NJsonField(i18n_fields=HISTORY_ENTRY_I18N_FIELDS)
     values_diff = I18NJsonField(i18n_fields=HISTORY_ENTRY_I18N_FIELDS)
     user = serializers.SerializerMethodField("get_user")
@@ -27,6 +27,8 @@ This is possible example:
 """
 import logging
 from collections import namedtuple
+from collections import OrderedDict
+from contextlib import ExitStack
 from copy import deepcopy
 from functools import partial
 from functools import wraps
@@ -36,6 +38,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.paginator import Paginator, InvalidPage
 from django.apps import apps
+from django.db import connection
 from django.db import transaction as tx
 from django_pglocks import advisory_lock
 
@@ -44,6 +47,7 @@ from taiga.base.utils.db import get_typename_for_model_class
 from taiga.base.utils.diff import make_diff as make_diff_from_dicts
 
 from .models import HistoryType
+from .models import HTML_FIELDS
 
 
 # Type that represents a freezed object
@@ -63,6 +67,19 @@ _not_important_fields = {
     "tasks.task": frozenset(["us_order", "taskboard_order"]),
 }
 
+# Relations used by freeze implementations, fetched in bulk
+# by freeze_many as (select_related, prefetch_related) lookups.
+_freeze_related_fields = {
+    "userstories.userstory": (("project", "status", "custom_attributes_values"),
+                              ("role_points", "attachments", "project__userstorycustomattributes")),
+    "issues.issue": (("project", "status", "custom_attributes_values"),
+                     ("attachments", "project__issuecustomattributes")),
+    "tasks.task": (("project", "status", "custom_attributes_values"),
+                   ("attachments", "project__taskcustomattributes")),
+    "wiki.wikipage": ((),
+                      ("attachments",)),
+}
+
 log = logging.getLogger("taiga.history")
 
 
@@ -138,26 +155,66 @@ def freeze_model_instance(obj:object) -> FrozenObj:
     instances to hashable plain python objects and
     wrapped into FrozenObj.
     """
+    return freeze_many([obj])[0]
 
-    model_cls = obj.__class__
 
-    # Additional query for test if object is really exists
-    # on the database or it is removed.
-    try:
-        obj = model_cls.objects.get(pk=obj.pk)
-    except model_cls.DoesNotExist:
-        return None
+def with_freeze_related(queryset):
+    """
+    Add to a queryset the relations used by the freeze implementation
+    of its model, to freeze its instances with `freeze_many(objs, fetch=False)`.
+    """
+    typename = get_typename_for_model_class(queryset.model)
+    select_related, prefetch_related = _freeze_related_fields.get(typename, ((), ()))
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
 
-    typename = get_typename_for_model_class(model_cls)
-    if typename not in _freeze_impl_map:
-        raise RuntimeError("No implementation found for {}".format(typename))
 
-    key = make_key_from_model_object(obj)
-    impl_fn = _freeze_impl_map[typename]
-    snapshot = impl_fn(obj)
-    assert isinstance(snapshot, dict), "freeze handlers should return always a dict"
+def freeze_many(objs:list, *, fetch:bool=True) -> list:
+    """
+    Creates new frozen objects from a list of model instances.
+
+    Instances are fetched again from the database (for test if
+    they really exist or are removed) in one query per model,
+    prefetching the relations used by its freeze implementation.
+    The result preserves the order of `objs` and contains None
+    for removed instances.
+
+    With `fetch=False` the instances are frozen as they are, they
+    should be loaded with `with_freeze_related`.
+    """
+    pks_by_model = OrderedDict()
+    for obj in objs:
+        typename = get_typename_for_model_class(obj.__class__)
+        if typename not in _freeze_impl_map:
+            raise RuntimeError("No implementation found for {}".format(typename))
+        pks_by_model.setdefault(obj.__class__, set()).add(obj.pk)
+
+    instances = {}
+    if fetch:
+        for model_cls, pks in pks_by_model.items():
+            for instance in with_freeze_related(model_cls.objects.filter(pk__in=pks)):
+                instances[(model_cls, instance.pk)] = instance
+    else:
+        instances = {(obj.__class__, obj.pk): obj for obj in objs}
+
+    result = []
+    for obj in objs:
+        instance = instances.get((obj.__class__, obj.pk), None)
+        if instance is None:
+            result.append(None)
+            continue
+
+        typename = get_typename_for_model_class(instance.__class__)
+        impl_fn = _freeze_impl_map[typename]
+        snapshot = impl_fn(instance)
+        assert isinstance(snapshot, dict), "freeze handlers should return always a dict"
+
+        result.append(FrozenObj(make_key_from_model_object(instance), snapshot))
 
-    return FrozenObj(key, snapshot)
+    return result
 
 
 def is_hidden_snapshot(obj:FrozenDiff) -> bool:
@@ -190,7 +247,8 @@ def make_diff(oldobj:FrozenObj, newobj:FrozenObj) -> FrozenDiff:
     if oldobj is None:
         return FrozenDiff(newobj.key, {}, newobj.snapshot)
 
-    first = oldobj.snapshot
+    # Old snapshots can store the (now rendered on read) html fields
+    first = {key: value for key, value in oldobj.snapshot.items() if key not in HTML_FIELDS.values()}
     second = newobj.snapshot
 
     diff = make_diff_from_dicts(first, second)
@@ -198,11 +256,14 @@ def make_diff(oldobj:FrozenObj, newobj:FrozenObj) -> FrozenDiff:
     return FrozenDiff(newobj.key, diff, newobj.snapshot)
 
 
-def make_diff_values(typename:str, fdiff:FrozenDiff) -> dict:
+def make_diff_values(typename:str, fdiff:FrozenDiff, *, project_id=None) -> dict:
     """
     Given a typename and diff, build a values dict for it.
     If no implementation found for typename, warnig is raised in
     logging and returns empty dict.
+
+    The names of the attributes of the project `project_id`
+    (statuses, points, roles...) are cached by the process.
     """
 
     if typename not in _values_impl_map:
@@ -210,7 +271,30 @@ def make_diff_values(typename:str, fdiff:FrozenDiff) -> dict:
         return {}
 
     impl_fn = _values_impl_map[typename]
-    return impl_fn(fdiff.diff)
+    with values_of_project(project_id):
+        return impl_fn(fdiff.diff)
+
+
+def make_diff_values_in_bulk(fdiffs:list, project_ids:list=None) -> list:
+    """
+    Same as make_diff_values but for a list of diffs (of any
+    typename). All identifiers used by the values of the diffs
+    are fetched first, with one query per model.
+    """
+    typenames = [fdiff.key.rsplit(":", 1)[0] for fdiff in fdiffs]
+    if project_ids is None:
+        project_ids = [None] * len(fdiffs)
+
+    with values_resolver() as resolver:
+        resolver.collecting = True
+        for typename, fdiff, project_id in zip(typenames, fdiffs, project_ids):
+            make_diff_values(typename, fdiff, project_id=project_id)
+
+        resolver.collecting = False
+        resolver.fetch_requested()
+
+        return [make_diff_values(typename, fdiff, project_id=project_id)
+                for typename, fdiff, project_id in zip(typenames, fdiffs, project_ids)]
 
 
 def _rebuild_snapshot_from_diffs(keysnapshot, partials):
@@ -223,7 +307,14 @@ def _rebuild_snapshot_from_diffs(keysnapshot, partials):
     return result
 
 
-def get_last_snapshot_for_key(key:str) -> FrozenObj:
+def rebuild_snapshot_for_key(key:str):
+    """
+    Rebuild the current snapshot of a key from its history
+    entries: the last complete snapshot with all following
+    partial diffs applied.
+
+    Returns a (FrozenObj, number of partial entries) tuple.
+    """
     entry_model = apps.get_model("history", "HistoryEntry")
 
     # Search last snapshot
@@ -233,7 +324,7 @@ def get_last_snapshot_for_key(key:str) -> FrozenObj:
 
     keysnapshot = qs.first()
     if keysnapshot is None:
-        return None, True
+        return None, 0
 
     # Get all partial snapshots
     entries = tuple(entry_model.objects
@@ -242,12 +333,37 @@ def get_last_snapshot_for_key(key:str) -> FrozenObj:
                     .order_by("created_at"))
 
     snapshot = _rebuild_snapshot_from_diffs(keysnapshot.snapshot, entries)
-    max_partial_diffs = getattr(settings, "MAX_PARTIAL_DIFFS", 60)
+    return FrozenObj(keysnapshot.key, snapshot), len(entries)
+
+
+def store_snapshot_for_key(key:str, snapshot:dict, partials:int=0):
+    """
+    Store the materialized current snapshot for a key.
+    """
+    snapshot_model = apps.get_model("history", "HistorySnapshot")
+    snapshot_model.objects.update_or_create(key=key, defaults={"snapshot": snapshot,
+                                                               "partials": partials})
 
-    if len(entries) >= max_partial_diffs:
-        return FrozenObj(keysnapshot.key, snapshot), True
 
-    return FrozenObj(keysnapshot.key, snapshot), False
+def _get_current_snapshot_for_key(key:str):
+    snapshot_model = apps.get_model("history", "HistorySnapshot")
+
+    current = snapshot_model.objects.filter(key=key).first()
+    if current is not None:
+        return FrozenObj(key, current.snapshot), current.partials
+
+    # Keys without materialized snapshot (not backfilled yet)
+    # are reconstructed from their history entries.
+    return rebuild_snapshot_for_key(key)
+
+
+def get_last_snapshot_for_key(key:str) -> FrozenObj:
+    fobj, partials = _get_current_snapshot_for_key(key)
+    if fobj is None:
+        return None, True
+
+    max_partial_diffs = getattr(settings, "MAX_PARTIAL_DIFFS", 60)
+    return fobj, partials >= max_partial_diffs
 
 
 # Public api
@@ -283,56 +399,249 @@ def take_snapshot(obj:object, *, comment:str="", user=None, delete:bool=False):
 
     key = make_key_from_model_object(obj)
     with advisory_lock(key) as acquired_key_lock:
-        typename = get_typename_for_model_class(obj.__class__)
+        if getattr(settings, "HISTORY_ASYNC_SNAPSHOTS", False):
+            # The snapshots requested before this one go first
+            process_pending_snapshots(key)
 
         new_fobj = freeze_model_instance(obj)
-        old_fobj, need_real_snapshot = get_last_snapshot_for_key(key)
-
-        entry_model = apps.get_model("history", "HistoryEntry")
-        user_id = None if user is None else user.id
-        user_name = "" if user is None else user.get_full_name()
-
-        # Determine history type
-        if delete:
-            entry_type = HistoryType.delete
-        elif new_fobj and not old_fobj:
-            entry_type = HistoryType.create
-        elif new_fobj and old_fobj:
-            entry_type = HistoryType.change
-        else:
-            raise RuntimeError("Unexpected condition")
+        return take_snapshot_of_frozen_object(obj, new_fobj, comment=comment, user=user, delete=delete)
+
+
+def take_snapshot_of_frozen_object(obj:object, new_fobj:FrozenObj, *, comment:str="", user=None,
+                                   delete:bool=False, created_at=None):
+    """
+    Same as take_snapshot but with the object already frozen (used to
+    process the pending snapshots). The caller must hold the advisory
+    lock of the key.
+    """
+    pending = _make_pending_entry(obj, new_fobj, comment=comment, delete=delete)
+    if pending is None:
+        return None
 
-        fdiff = make_diff(old_fobj, new_fobj)
+    fvals = make_diff_values(pending.typename, pending.fdiff, project_id=getattr(obj, "project_id", None))
+    return _persist_pending_entry(pending, fvals, user=user, created_at=created_at)
 
-        # If diff and comment are empty, do
-        # not create empty history entry
-        if (not fdiff.diff and not comment
-            and old_fobj is not None
-            and entry_type != HistoryType.delete):
 
-            return None
+def request_snapshot(obj:object, *, comment:str="", user=None, delete:bool=False):
+    """
+    Same as take_snapshot, but when HISTORY_ASYNC_SNAPSHOTS is
+    enabled it only records a pending marker with the frozen
+    object, and the diff and the history entry are made in
+    background after the transaction commits (by celery or by
+    a local worker thread). In that case it returns None.
+
+    Deletions are always synchronous: the object must
+    still exist to be freezed.
+    """
+    if delete or not getattr(settings, "HISTORY_ASYNC_SNAPSHOTS", False):
+        return take_snapshot(obj, comment=comment, user=user, delete=delete)
 
-        fvals = make_diff_values(typename, fdiff)
+    from .tasks import process_pending_snapshots as process_pending_snapshots_task
+    from .tasks import local_worker
 
-        if len(comment) > 0:
-            is_hidden = False
+    key = make_key_from_model_object(obj)
+    fobj = freeze_model_instance(obj)
+    pending_model = apps.get_model("history", "PendingSnapshot")
+    pending_model.objects.create(key=key, comment=comment,
+                                 user_id=None if user is None else user.id,
+                                 snapshot=None if fobj is None else fobj.snapshot)
+
+    if settings.CELERY_ENABLED:
+        connection.on_commit(lambda: process_pending_snapshots_task.delay(key))
+    else:
+        connection.on_commit(lambda: local_worker.put(key))
+
+    return None
+
+
+@tx.atomic
+def process_pending_snapshots(key:str):
+    """
+    Take the snapshots of all the pending markers of a key, in
+    the same order they were requested, each one with the object
+    frozen when it was requested (so every entry gets the changes
+    of its own request, like with synchronous snapshots).
+    """
+    from taiga.projects.notifications import services as notifications_services
+
+    pending_model = apps.get_model("history", "PendingSnapshot")
+    user_model = apps.get_model("users", "User")
+    model_cls = get_model_from_key(key)
+
+    with advisory_lock(key):
+        pendings = list(pending_model.objects.filter(key=key).order_by("id"))
+        if not pendings:
+            return
+
+        obj = model_cls.objects.filter(pk=get_pk_from_key(key)).first()
+        users = user_model.objects.in_bulk({p.user_id for p in pendings if p.user_id is not None})
+
+        if obj is not None:
+            for pending in pendings:
+                if pending.snapshot is None:
+                    continue
+
+                user = users.get(pending.user_id, None)
+                new_fobj = FrozenObj(key, pending.snapshot)
+                entry = take_snapshot_of_frozen_object(obj, new_fobj, comment=pending.comment,
+                                                       user=user, created_at=pending.created_at)
+
+                if entry is not None and user is not None:
+                    notifications_services.analize_object_for_watchers(obj, entry.comment, user)
+                    notifications_services.send_notifications(obj, history=entry)
+
+        pending_model.objects.filter(id__in=[p.id for p in pendings]).delete()
+
+
+@tx.atomic
+def take_snapshots_in_bulk(objs:list, *, comment:str="", user=None, fetch:bool=True) -> list:
+    """
+    Same as take_snapshot but for a list of model instances,
+    freezing all of them with freeze_many and resolving the
+    values of all diffs at once. Removed instances are ignored.
+
+    Instances just loaded with `with_freeze_related` can be
+    passed with `fetch=False` to save the queries of fetching
+    them again.
+    """
+    objs = list(OrderedDict((make_key_from_model_object(obj), obj) for obj in objs).values())
+    keys = sorted(make_key_from_model_object(obj) for obj in objs)
+
+    with ExitStack() as stack:
+        # Keys are always locked in the same order to prevent deadlocks
+        for key in keys:
+            stack.enter_context(advisory_lock(key))
+
+        pendings = []
+        for obj, new_fobj in zip(objs, freeze_many(objs, fetch=fetch)):
+            if new_fobj is None:
+                continue
+
+            pending = _make_pending_entry(obj, new_fobj, comment=comment)
+            if pending is not None:
+                pendings.append(pending)
+
+        fvals_list = make_diff_values_in_bulk([p.fdiff for p in pendings],
+                                              [getattr(p.obj, "project_id", None) for p in pendings])
+        return [_persist_pending_entry(pending, fvals, user=user)
+                for pending, fvals in zip(pendings, fvals_list)]
+
+
+# History entry computed but not stored yet (see take_snapshot)
+PendingEntry = namedtuple("PendingEntry", ["obj", "key", "typename", "type", "fdiff",
+                                           "old_fobj", "partials", "comment"])
+
+
+def _make_pending_entry(obj:object, new_fobj:FrozenObj, *, comment:str="", delete:bool=False):
+    # The caller must hold the advisory lock of the key.
+    key = make_key_from_model_object(obj)
+    typename = get_typename_for_model_class(obj.__class__)
+
+    old_fobj, partials = _get_current_snapshot_for_key(key)
+
+    # Determine history type
+    if delete:
+        entry_type = HistoryType.delete
+    elif new_fobj and not old_fobj:
+        entry_type = HistoryType.create
+    elif new_fobj and old_fobj:
+        entry_type = HistoryType.change
+    else:
+        raise RuntimeError("Unexpected condition")
+
+    fdiff = make_diff(old_fobj, new_fobj)
+
+    # If diff and comment are empty, do
+    # not create empty history entry
+    if (not fdiff.diff and not comment
+        and old_fobj is not None
+        and entry_type != HistoryType.delete):
+
+        return None
+
+    return PendingEntry(obj, key, typename, entry_type, fdiff, old_fobj, partials, comment)
+
+
+def _persist_pending_entry(pending:PendingEntry, fvals:dict, *, user=None, created_at=None):
+    max_partial_diffs = getattr(settings, "MAX_PARTIAL_DIFFS", 60)
+    need_real_snapshot = pending.old_fobj is None or pending.partials >= max_partial_diffs
+
+    entry_model = apps.get_model("history", "HistoryEntry")
+    user_id = None if user is None else user.id
+    user_name = "" if user is None else user.get_full_name()
+
+    comment = pending.comment
+    fdiff = pending.fdiff
+    project = pending.obj.project
+
+    if len(comment) > 0:
+        is_hidden = False
+    else:
+        is_hidden = is_hidden_snapshot(fdiff)
+
+    kwargs = {
+        "user": {"pk": user_id, "name": user_name},
+        "key": pending.key,
+        "type": pending.type,
+        "snapshot": fdiff.snapshot if need_real_snapshot else None,
+        "diff": fdiff.diff,
+        "values": fvals,
+        "comment": comment,
+        "comment_html": mdrender(project, comment) if comment else "",
+        "is_hidden": is_hidden,
+        "is_snapshot": need_real_snapshot,
+    }
+    if created_at is not None:
+        kwargs["created_at"] = created_at
+
+    # The project is attached before saving, so the handlers of the
+    # new entry (timeline, webhooks...) don't have to query it
+    entry = entry_model(**kwargs)
+    entry.project = project
+    entry.save(force_insert=True)
+
+    # Keep the materialized snapshot of the key in sync
+    # while the key lock is still held.
+    if need_real_snapshot:
+        store_snapshot_for_key(pending.key, fdiff.snapshot, partials=0)
+    else:
+        snapshot = _rebuild_snapshot_from_diffs(pending.old_fobj.snapshot, [fdiff])
+        store_snapshot_for_key(pending.key, snapshot, partials=pending.partials + 1)
+
+    return entry
+
+
+def attach_projects_to_history_entries(entries) -> list:
+    """
+    Set the project (used to render the html fields) of a list
+    of history entries with a query per model and one more for
+    all the projects, instead of two queries per entry.
+    """
+    entries = list(entries)
+    project_model = apps.get_model("projects", "Project")
+
+    pks_by_typename = OrderedDict()
+    for entry in entries:
+        if entry.key is not None:
+            typename, pk = entry.key.split(":", 1)
+            pks_by_typename.setdefault(typename, set()).add(pk)
+
+    project_ids_by_key = {}
+    for typename, pks in pks_by_typename.items():
+        model_cls = apps.get_model(typename)
+        if model_cls is project_model:
+            project_ids = model_cls.objects.filter(pk__in=pks).values_list("pk", "pk")
         else:
-            is_hidden = is_hidden_snapshot(fdiff)
-
-        kwargs = {
-            "user": {"pk": user_id, "name": user_name},
-            "key": key,
-            "type": entry_type,
-            "snapshot": fdiff.snapshot if need_real_snapshot else None,
-            "diff": fdiff.diff,
-            "values": fvals,
-            "comment": comment,
-            "comment_html": mdrender(obj.project, comment),
-            "is_hidden": is_hidden,
-            "is_snapshot": need_real_snapshot,
-        }
-        
-        return entry_model.objects.create(**kwargs)
+            project_ids = model_cls.objects.filter(pk__in=pks).values_list("pk", "project_id")
+
+        for pk, project_id in project_ids:
+            project_ids_by_key["{}:{}".format(typename, pk)] = project_id
+
+    projects = project_model.objects.in_bulk(set(project_ids_by_key.values()))
+    for entry in entries:
+        entry.project = projects.get(project_ids_by_key.get(entry.key, None), None)
+
+    return entries
 
 
 # High level query api
@@ -353,6 +662,9 @@ def get_history_queryset_by_model_instance(obj:object, types=(HistoryType.change
 
 
 # Freeze implementatitions
+from .freeze_impl import values_resolver
+from .freeze_impl import values_of_project
+
 from .freeze_impl import project_freezer
 from .freeze_impl import milestone_freezer
 from .freeze_impl import userstory_freezer
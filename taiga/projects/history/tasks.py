@@ -0,0 +1,102 @@
+# Copyright (C) 2013 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import datetime
+import queue
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import connection
+
+from taiga.celery import app
+
+from . import services
+from .models import PendingSnapshot
+
+log = logging.getLogger("taiga.history")
+
+
+@app.task
+def process_pending_snapshots(key:str):
+    """
+    Take the snapshots of all the pending markers of a key.
+    See `services.process_pending_snapshots`.
+    """
+    services.process_pending_snapshots(key)
+
+
+@app.task
+def process_leftover_pending_snapshots(older_than:int=None):
+    """
+    Process the pending markers left behind (the task could not be
+    queued or the local worker died with its process) that are older
+    than `older_than` seconds (HISTORY_PENDING_SNAPSHOTS_TIMEOUT).
+    """
+    if older_than is None:
+        older_than = getattr(settings, "HISTORY_PENDING_SNAPSHOTS_TIMEOUT", 60 * 10)
+
+    limit_date = timezone.now() - datetime.timedelta(seconds=older_than)
+    keys = (PendingSnapshot.objects.filter(created_at__lt=limit_date)
+                                   .order_by("key")
+                                   .values_list("key", flat=True)
+                                   .distinct())
+
+    processed = 0
+    for key in list(keys):
+        try:
+            process_pending_snapshots(key)
+            processed += 1
+        except Exception:
+            log.exception("Error processing pending snapshots of {}".format(key))
+    return processed
+
+
+class LocalWorker(object):
+    """
+    Background thread that processes pending snapshots in
+    this process when celery is not enabled.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="history-local-worker",
+                                               daemon=True)
+                self.thread.start()
+
+    def put(self, key:str):
+        self.start()
+        self.queue.put(key)
+
+    def run(self):
+        while True:
+            key = self.queue.get()
+            try:
+                process_pending_snapshots(key)
+            except Exception:
+                log.exception("Error processing pending snapshots of {}".format(key))
+            finally:
+                connection.close()
+                self.queue.task_done()
+
+local_worker = LocalWorker()
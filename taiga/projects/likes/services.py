@@ -21,6 +21,9 @@ from django.db.transaction import atomic
 from django.apps import apps
 from django.contrib.auth import get_user_model
 
+from taiga.base.utils.db import get_typename_for_model_instance
+from taiga.projects.choices import TOTALS_BUCKET_FANS
+
 from .models import Like
 
 
@@ -36,8 +39,9 @@ def add_like(obj, user):
     obj_type = apps.get_model("contenttypes", "ContentType").objects.get_for_model(obj)
     with atomic():
         like, created = Like.objects.get_or_create(content_type=obj_type, object_id=obj.id, user=user)
-        if like.project is not None:
-            like.project.refresh_totals()
+        # Only project likes are counted as project fans
+        if created and get_typename_for_model_instance(obj) == "projects.project":
+            obj.increment_totals(TOTALS_BUCKET_FANS, like.created_date)
 
     return like
 
@@ -58,11 +62,10 @@ def remove_like(obj, user):
             return
 
         like = qs.first()
-        project = like.project
         qs.delete()
 
-        if project is not None:
-            project.refresh_totals()
+        if get_typename_for_model_instance(obj) == "projects.project":
+            obj.increment_totals(TOTALS_BUCKET_FANS, like.created_date, delta=-1)
 
 
 def get_fans(obj):
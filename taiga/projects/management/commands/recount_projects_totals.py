@@ -0,0 +1,32 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Examples:
+# python manage.py recount_projects_totals
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from taiga.projects.services import recount_projects_totals
+
+
+class Command(BaseCommand):
+    help = 'Recount the totals of all projects from likes and timeline entries'
+
+    @override_settings(DEBUG=False)
+    def handle(self, *args, **options):
+        recount_projects_totals()
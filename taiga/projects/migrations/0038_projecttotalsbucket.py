@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FILL_TOTALS_BUCKETS_SQL = """
+    INSERT INTO projects_projecttotalsbucket (project_id, kind, date, count)
+         SELECT likes_like.object_id, 'fans', date(likes_like.created_date), count(*)
+           FROM likes_like
+     INNER JOIN django_content_type ON django_content_type.id = likes_like.content_type_id
+          WHERE django_content_type.app_label = 'projects'
+            AND django_content_type.model = 'project'
+            AND likes_like.object_id IN (SELECT id FROM projects_project)
+       GROUP BY likes_like.object_id, date(likes_like.created_date);
+
+    INSERT INTO projects_projecttotalsbucket (project_id, kind, date, count)
+         SELECT timeline_timeline.project_id, 'activity', date(timeline_timeline.created), count(*)
+           FROM timeline_timeline
+          WHERE timeline_timeline.project_id IS NOT NULL
+            AND timeline_timeline.namespace = 'project:' || timeline_timeline.project_id
+       GROUP BY timeline_timeline.project_id, date(timeline_timeline.created);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0037_auto_20160208_1751'),
+        ('likes', '0001_initial'),
+        ('timeline', '0004_auto_20150603_1312'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectTotalsBucket',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=16, verbose_name='kind', choices=[('fans', 'Fans'), ('activity', 'Activity')])),
+                ('date', models.DateField(verbose_name='date')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+                ('project', models.ForeignKey(related_name='totals_buckets', verbose_name='project', to='projects.Project', on_delete=django.db.models.deletion.CASCADE)),
+            ],
+            options={
+                'verbose_name': 'project totals bucket',
+                'verbose_name_plural': 'project totals buckets',
+                'ordering': ['project', 'kind', 'date'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='projecttotalsbucket',
+            unique_together=set([('project', 'kind', 'date')]),
+        ),
+        migrations.RunSQL(FILL_TOTALS_BUCKETS_SQL, migrations.RunSQL.noop),
+    ]
@@ -33,10 +33,9 @@ from taiga.projects.notifications.utils import attach_watchers_to_queryset, atta
 
 from . import serializers
 from . import models
+from . import services
 from . import permissions
 
-import datetime
-
 
 class MilestoneViewSet(HistoryResourceMixin, WatchedResourceMixin,
                        BlockedByProjectMixin, ModelCrudViewSet):
@@ -109,36 +108,7 @@ class MilestoneViewSet(HistoryResourceMixin, WatchedResourceMixin,
 
         self.check_permissions(request, "stats", milestone)
 
-        total_points = milestone.total_points
-        milestone_stats = {
-            'name': milestone.name,
-            'estimated_start': milestone.estimated_start,
-            'estimated_finish': milestone.estimated_finish,
-            'total_points': total_points,
-            'completed_points': milestone.closed_points.values(),
-            'total_userstories': milestone.get_cached_user_stories().count(),
-            'completed_userstories': milestone.get_cached_user_stories().filter(is_closed=True).count(),
-            'total_tasks': milestone.tasks.count(),
-            'completed_tasks': milestone.tasks.filter(status__is_closed=True).count(),
-            'iocaine_doses': milestone.tasks.filter(is_iocaine=True).count(),
-            'days': []
-        }
-        current_date = milestone.estimated_start
-        sumTotalPoints = sum(total_points.values())
-        optimal_points = sumTotalPoints
-        milestone_days = (milestone.estimated_finish - milestone.estimated_start).days
-        optimal_points_per_day = sumTotalPoints / milestone_days if milestone_days else 0
-
-        while current_date <= milestone.estimated_finish:
-            milestone_stats['days'].append({
-                'day': current_date,
-                'name': current_date.day,
-                'open_points':  sumTotalPoints - milestone.total_closed_points_by_date(current_date),
-                'optimal_points': optimal_points,
-            })
-            current_date = current_date + datetime.timedelta(days=1)
-            optimal_points -= optimal_points_per_day
-
+        milestone_stats = services.get_milestone_stats(milestone)
         return response.Ok(milestone_stats)
 
 
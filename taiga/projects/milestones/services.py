@@ -15,10 +15,18 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum, Case, When, IntegerField
 from django.utils import timezone
 
+from taiga.base.utils.cache import get_cache_version, bump_cache_version_on_commit, get_cache_timeout
+from taiga.base.utils.dicts import dict_sum
+
 from . import models
 
+import datetime
 
 
 def calculate_milestone_is_closed(milestone):
@@ -37,3 +45,144 @@ def open_milestone(milestone):
     if milestone.closed:
         milestone.closed = False
         milestone.save(update_fields=["closed",])
+
+
+def _count_if(**condition):
+    return Sum(Case(When(then=1, **condition), default=0, output_field=IntegerField()))
+
+
+def _get_milestone_stats_cache_key(milestone):
+    # The last modification of the milestone, its tasks and user stories
+    # (seen by every process) is part of the key, and the version, shared
+    # by the milestones of the project, is bumped when the points and task
+    # statuses change
+    tasks = milestone.tasks.order_by().aggregate(count=Count("id"),
+                                                 finished=Max("finished_date"),
+                                                 modified=Max("modified_date"))
+    user_stories = milestone.user_stories.order_by().aggregate(count=Count("id"),
+                                                               modified=Max("modified_date"))
+    version = get_cache_version("milestone-stats-version:{}".format(milestone.project_id))
+
+    modifications = [milestone.modified_date, tasks["finished"], tasks["modified"], user_stories["modified"]]
+    modifications = ":".join("" if date is None else str(date.timestamp()) for date in modifications)
+    return "milestone-stats:{}:{}:{}:{}:{}".format(milestone.id, modifications, tasks["count"],
+                                                    user_stories["count"], version)
+
+
+def invalidate_milestone_stats_for_project(project_id):
+    bump_cache_version_on_commit("milestone-stats-version:{}".format(project_id))
+
+
+def _get_closed_points_by_date(milestone, points_per_user_story):
+    """
+    Get the accumulated closed points for each day of the milestone.
+
+    Every finished task closes the proportional part of the points of its
+    user story (the total user story points divided by its number of tasks).
+    """
+    user_story_model = apps.get_model("userstories", "UserStory")
+    tasks_per_user_story = dict(user_story_model.objects.filter(milestone=milestone)
+                                                        .order_by()
+                                                        .annotate(num_tasks=Count("tasks"))
+                                                        .values_list("id", "num_tasks"))
+
+    finished_tasks = (milestone.tasks.exclude(finished_date__isnull=True)
+                                     .exclude(user_story__isnull=True)
+                                     .order_by()
+                                     .extra(select={"finished_day": "date(tasks_task.finished_date AT TIME ZONE 'UTC')"})
+                                     .values_list("user_story_id", "finished_day")
+                                     .annotate(count=Count("id")))
+
+    closed_points_increments = {}
+    for user_story_id, finished_day, count in finished_tasks:
+        if user_story_id not in tasks_per_user_story:
+            # The user story is in another milestone
+            continue
+
+        # If the task was finished before starting the sprint it needs
+        # to be included
+        finished_day = max(finished_day, milestone.estimated_start)
+        points = points_per_user_story.get(user_story_id, 0) * count / tasks_per_user_story[user_story_id]
+        closed_points_increments[finished_day] = closed_points_increments.get(finished_day, 0) + points
+
+    closed_points_by_date = {}
+    accumulated_points = 0
+    current_date = milestone.estimated_start
+    while current_date <= milestone.estimated_finish:
+        accumulated_points += closed_points_increments.get(current_date, 0)
+        closed_points_by_date[current_date] = accumulated_points
+        current_date = current_date + datetime.timedelta(days=1)
+    return closed_points_by_date
+
+
+def _calculate_milestone_stats(milestone):
+    role_points_model = apps.get_model("userstories", "RolePoints")
+    role_points = (role_points_model.objects.filter(user_story__milestone=milestone)
+                                            .order_by()
+                                            .values_list("user_story_id", "user_story__is_closed", "role_id")
+                                            .annotate(points=Sum("points__value")))
+
+    total_points = []
+    completed_points = []
+    points_per_user_story = {}
+    for user_story_id, is_closed, role_id, points in role_points:
+        points = points or 0
+        total_points.append({role_id: points})
+        if is_closed:
+            completed_points.append({role_id: points})
+        points_per_user_story[user_story_id] = points_per_user_story.get(user_story_id, 0) + points
+
+    total_points = dict_sum(*total_points)
+    completed_points = dict_sum(*completed_points)
+
+    user_stories = milestone.user_stories.aggregate(total=Count("id"), completed=_count_if(is_closed=True))
+    tasks = milestone.tasks.aggregate(total=Count("id"),
+                                      completed=_count_if(status__is_closed=True),
+                                      iocaine=_count_if(is_iocaine=True))
+
+    milestone_stats = {
+        'name': milestone.name,
+        'estimated_start': milestone.estimated_start,
+        'estimated_finish': milestone.estimated_finish,
+        'total_points': total_points,
+        'completed_points': list(completed_points.values()),
+        'total_userstories': user_stories["total"],
+        'completed_userstories': user_stories["completed"] or 0,
+        'total_tasks': tasks["total"],
+        'completed_tasks': tasks["completed"] or 0,
+        'iocaine_doses': tasks["iocaine"] or 0,
+        'days': []
+    }
+
+    closed_points_by_date = _get_closed_points_by_date(milestone, points_per_user_story)
+    current_date = milestone.estimated_start
+    sum_total_points = sum(total_points.values())
+    optimal_points = sum_total_points
+    milestone_days = (milestone.estimated_finish - milestone.estimated_start).days
+    optimal_points_per_day = sum_total_points / milestone_days if milestone_days else 0
+
+    while current_date <= milestone.estimated_finish:
+        milestone_stats['days'].append({
+            'day': current_date,
+            'name': current_date.day,
+            'open_points': sum_total_points - closed_points_by_date.get(current_date, 0),
+            'optimal_points': optimal_points,
+        })
+        current_date = current_date + datetime.timedelta(days=1)
+        optimal_points -= optimal_points_per_day
+
+    return milestone_stats
+
+
+def get_milestone_stats(milestone):
+    """
+    Get the stats and the burndown of a milestone. They are cached until the
+    milestone, its tasks or user stories are modified (or a task is finished),
+    or `invalidate_milestone_stats_for_project` is called.
+    """
+    key = _get_milestone_stats_cache_key(milestone)
+    milestone_stats = cache.get(key)
+    if milestone_stats is None:
+        milestone_stats = _calculate_milestone_stats(milestone)
+        cache.set(key, milestone_stats, timeout=get_cache_timeout(settings.MILESTONE_STATS_CACHE_TIMEOUT))
+    return milestone_stats
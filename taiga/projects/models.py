@@ -17,6 +17,7 @@
 
 import hashlib
 import os
+import datetime
 import os.path as path
 import itertools
 import uuid
@@ -26,6 +27,7 @@ from unidecode import unidecode
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db import transaction, IntegrityError
 from django.db.models import signals, Q
 from django.apps import apps
 from django.conf import settings
@@ -272,6 +274,8 @@ class Project(ProjectDefaults, TaggedMixin, models.Model):
 
     _cached_user_stories = None
     _importing = None
+    # (is_private, anon_permissions) as loaded from the database
+    _loaded_visibility = None
 
     class Meta:
         verbose_name = "project"
@@ -291,6 +295,15 @@ class Project(ProjectDefaults, TaggedMixin, models.Model):
     def __repr__(self):
         return "<Project {0}>".format(self.id)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        project = super().from_db(db, field_names, values)
+        # Used to detect the visibility changes on save without
+        # querying it again (see taiga.timeline.signals)
+        if "is_private" in field_names and "anon_permissions" in field_names:
+            project._loaded_visibility = (project.is_private, list(project.anon_permissions or []))
+        return project
+
     def save(self, *args, **kwargs):
         if not self._importing or not self.modified_date:
             self.modified_date = timezone.now()
@@ -320,41 +333,122 @@ class Project(ProjectDefaults, TaggedMixin, models.Model):
         super().save(*args, **kwargs)
 
     def refresh_totals(self, save=True):
-        now = timezone.now()
-        self.totals_updated_datetime = now
-
+        """
+        Recount the project totals from likes and timeline entries,
+        repairing the per-day buckets (see `increment_totals`).
+        """
         Like = apps.get_model("likes", "Like")
         content_type = apps.get_model("contenttypes", "ContentType").objects.get_for_model(Project)
-        qs = Like.objects.filter(content_type=content_type, object_id=self.id)
+        likes_qs = (Like.objects.filter(content_type=content_type, object_id=self.id)
+                                .extra(select={"day": "date(created_date)"})
+                                .values("day")
+                                .annotate(count=models.Count("id")))
 
-        self.total_fans = qs.count()
+        tl_model = apps.get_model("timeline", "Timeline")
+        namespace = build_project_namespace(self)
+        timeline_qs = (tl_model.objects.filter(namespace=namespace)
+                                       .extra(select={"day": "date(created)"})
+                                       .values("day")
+                                       .annotate(count=models.Count("id")))
+
+        counts = {(choices.TOTALS_BUCKET_FANS, row["day"]): row["count"] for row in likes_qs}
+        counts.update({(choices.TOTALS_BUCKET_ACTIVITY, row["day"]): row["count"] for row in timeline_qs})
+
+        # Only the buckets that drifted are written
+        with transaction.atomic():
+            obsolete_ids = []
+            for bucket in self.totals_buckets.select_for_update():
+                count = counts.pop((bucket.kind, bucket.date), None)
+                if count is None:
+                    obsolete_ids.append(bucket.id)
+                elif count != bucket.count:
+                    ProjectTotalsBucket.objects.filter(id=bucket.id).update(count=count)
+
+            if obsolete_ids:
+                ProjectTotalsBucket.objects.filter(id__in=obsolete_ids).delete()
+
+            ProjectTotalsBucket.objects.bulk_create([
+                ProjectTotalsBucket(project=self, kind=kind, date=date, count=count)
+                for (kind, date), count in counts.items()
+            ])
+
+        self.refresh_totals_from_buckets(save=save)
+
+    def increment_totals(self, kind, date, delta=1):
+        """
+        Increment the per-day bucket of `kind` ("fans" or "activity")
+        and the project totals that include `date`.
+
+        Every counter is incremented by the database in a single query,
+        so concurrent increments can't overwrite each other. The rolling
+        week/month/year windows are moved by `refresh_totals_from_buckets`,
+        here too if they were not refreshed today.
+        """
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+
+        qs = ProjectTotalsBucket.objects.filter(project=self, kind=kind, date=date)
+        if not qs.update(count=models.F("count") + delta):
+            try:
+                with transaction.atomic():
+                    ProjectTotalsBucket.objects.create(project=self, kind=kind, date=date, count=delta)
+            except IntegrityError:
+                qs.update(count=models.F("count") + delta)
 
-        qs_week = qs.filter(created_date__gte=now-relativedelta(weeks=1))
-        self.total_fans_last_week = qs_week.count()
+        now = timezone.now()
+        if self.totals_updated_datetime is None or self.totals_updated_datetime.date() < now.date():
+            # The windows are stale, they are recalculated with the new bucket
+            self.refresh_totals_from_buckets()
+            return
 
-        qs_month = qs.filter(created_date__gte=now-relativedelta(months=1))
-        self.total_fans_last_month = qs_month.count()
+        field = "total_{}".format(kind)
+        fields = [field]
+        for suffix, period in [("last_week", relativedelta(weeks=1)),
+                               ("last_month", relativedelta(months=1)),
+                               ("last_year", relativedelta(years=1))]:
+            if date >= (now - period).date():
+                fields.append("{}_{}".format(field, suffix))
 
-        qs_year = qs.filter(created_date__gte=now-relativedelta(years=1))
-        self.total_fans_last_year = qs_year.count()
+        values = {field: models.F(field) + delta for field in fields}
+        values["totals_updated_datetime"] = now
+        type(self).objects.filter(pk=self.pk).update(**values)
 
-        tl_model = apps.get_model("timeline", "Timeline")
-        namespace = build_project_namespace(self)
+        for field in fields:
+            setattr(self, field, getattr(self, field) + delta)
+        self.totals_updated_datetime = now
 
-        qs = tl_model.objects.filter(namespace=namespace)
-        self.total_activity = qs.count()
+    def refresh_totals_from_buckets(self, save=True):
+        now = timezone.now()
+        self.totals_updated_datetime = now
 
-        qs_week = qs.filter(created__gte=now-relativedelta(weeks=1))
-        self.total_activity_last_week = qs_week.count()
+        def _sum(kind, since=None):
+            condition = models.Q(kind=kind)
+            if since is not None:
+                condition &= models.Q(date__gte=since.date())
+            return models.Sum(models.Case(models.When(condition, then="count"),
+                                          default=0, output_field=models.IntegerField()))
+
+        totals = self.totals_buckets.aggregate(
+            total_fans=_sum(choices.TOTALS_BUCKET_FANS),
+            total_fans_last_week=_sum(choices.TOTALS_BUCKET_FANS, now-relativedelta(weeks=1)),
+            total_fans_last_month=_sum(choices.TOTALS_BUCKET_FANS, now-relativedelta(months=1)),
+            total_fans_last_year=_sum(choices.TOTALS_BUCKET_FANS, now-relativedelta(years=1)),
+            total_activity=_sum(choices.TOTALS_BUCKET_ACTIVITY),
+            total_activity_last_week=_sum(choices.TOTALS_BUCKET_ACTIVITY, now-relativedelta(weeks=1)),
+            total_activity_last_month=_sum(choices.TOTALS_BUCKET_ACTIVITY, now-relativedelta(months=1)),
+            total_activity_last_year=_sum(choices.TOTALS_BUCKET_ACTIVITY, now-relativedelta(years=1)),
+        )
 
-        qs_month = qs.filter(created__gte=now-relativedelta(months=1))
-        self.total_activity_last_month = qs_month.count()
+        totals = {key: value or 0 for key, value in totals.items()}
+        totals["totals_updated_datetime"] = now
 
-        qs_year = qs.filter(created__gte=now-relativedelta(years=1))
-        self.total_activity_last_year = qs_year.count()
+        for key, value in totals.items():
+            setattr(self, key, value)
 
         if save:
-            self.save()
+            # Only the totals are updated, with no signals
+            # (and no full save) of the project
+            type(self).objects.filter(pk=self.pk).update(**totals)
 
     @property
     def cached_user_stories(self):
@@ -474,6 +568,26 @@ class Project(ProjectDefaults, TaggedMixin, models.Model):
             connect_all_userstories_signals()
             connect_memberships_signals()
 
+class ProjectTotalsBucket(models.Model):
+    """
+    Per-day counter of project fans and activity. Project totals
+    (and their rolling week/month/year windows) are computed
+    from these buckets.
+    """
+    project = models.ForeignKey("Project", null=False, blank=False,
+                                related_name="totals_buckets", verbose_name=_("project"))
+    kind = models.CharField(max_length=16, null=False, blank=False,
+                            choices=choices.TOTALS_BUCKET_KINDS, verbose_name=_("kind"))
+    date = models.DateField(null=False, blank=False, verbose_name=_("date"))
+    count = models.IntegerField(null=False, blank=False, default=0, verbose_name=_("count"))
+
+    class Meta:
+        verbose_name = "project totals bucket"
+        verbose_name_plural = "project totals buckets"
+        unique_together = ("project", "kind", "date")
+        ordering = ["project", "kind", "date"]
+
+
 class ProjectModulesConfig(models.Model):
     project = models.OneToOneField("Project", null=False, blank=False,
                                 related_name="modules_config", verbose_name=_("project"))
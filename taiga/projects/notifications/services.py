@@ -251,6 +251,11 @@ def send_sync_notifications(notification_id):
         return
 
     history_entries = tuple(notification.history_entries.all().order_by("created_at"))
+    # All the entries are of the same object, the project of the
+    # notification is used to render their html fields
+    for history_entry in history_entries:
+        history_entry.project = notification.project
+
     obj, _ = get_last_snapshot_for_key(notification.key)
     obj_class = get_model_from_key(obj.key)
 
@@ -43,9 +43,15 @@ from .modules_config import get_modules_config
 
 from .stats import get_stats_for_project_issues
 from .stats import get_stats_for_project
+from .stats import get_cached_stats_for_project
+from .stats import invalidate_stats_for_project
 from .stats import get_member_stats_for_project
 
 from .tags_colors import update_project_tags_colors_handler
+
+from .totals import refresh_projects_totals
+from .totals import recount_projects_totals
+from .totals import refresh_stale_projects_totals
 from .modules_config import get_modules_config
 
 from .transfer import request_project_transfer, start_project_transfer
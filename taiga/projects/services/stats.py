@@ -15,61 +15,131 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
 from django.utils.translation import ugettext as _
+from django.db import connection
 from django.db.models import Q, Count
 from django.apps import apps
+from contextlib import closing
+import bisect
 import datetime
 import copy
 import collections
+import itertools
 
+from taiga.base.utils.cache import get_cache_version, bump_cache_version_on_commit, get_cache_timeout
 from taiga.projects.history.models import HistoryEntry
 from taiga.projects.userstories.models import RolePoints
 
-def _count_status_object(status_obj, counting_storage):
-    if status_obj.id in counting_storage:
-        counting_storage[status_obj.id]['count'] += 1
-    else:
-        counting_storage[status_obj.id] = {}
-        counting_storage[status_obj.id]['count'] = 1
-        counting_storage[status_obj.id]['name'] = status_obj.name
-        counting_storage[status_obj.id]['id'] = status_obj.id
-        counting_storage[status_obj.id]['color'] = status_obj.color
-
-
-def _count_owned_object(user_obj, counting_storage):
-    if user_obj:
-        if user_obj.id in counting_storage:
-            counting_storage[user_obj.id]['count'] += 1
-        else:
-            counting_storage[user_obj.id] = {}
-            counting_storage[user_obj.id]['count'] = 1
-            counting_storage[user_obj.id]['username'] = user_obj.username
-            counting_storage[user_obj.id]['name'] = user_obj.get_full_name()
-            counting_storage[user_obj.id]['id'] = user_obj.id
-            counting_storage[user_obj.id]['color'] = user_obj.color
-    else:
-        if 0 in counting_storage:
-            counting_storage[0]['count'] += 1
-        else:
-            counting_storage[0] = {}
-            counting_storage[0]['count'] = 1
-            counting_storage[0]['username'] = _('Unassigned')
-            counting_storage[0]['name'] = _('Unassigned')
-            counting_storage[0]['id'] = 0
-            counting_storage[0]['color'] = 'black'
+def _count_status_objects(queryset, field_name):
+    """
+    Count the objects of `queryset` grouped by the status-like object
+    (type, status, priority or severity) in `field_name`.
+    """
+    counts = queryset.order_by().values_list(field_name).annotate(count=Count("id"))
+    counts = {id: count for id, count in counts if id is not None}
+
+    related_model = queryset.model._meta.get_field(field_name).related_model
+    counting_storage = {}
+    for status_obj in related_model.objects.filter(id__in=counts.keys()):
+        counting_storage[status_obj.id] = {
+            'count': counts[status_obj.id],
+            'name': status_obj.name,
+            'id': status_obj.id,
+            'color': status_obj.color,
+        }
+    return counting_storage
+
+
+def _count_owned_objects(queryset, field_name):
+    """
+    Count the objects of `queryset` grouped by the user in `field_name`,
+    objects without user are counted as 'Unassigned'.
+    """
+    counts = dict(queryset.order_by().values_list(field_name).annotate(count=Count("id")))
+
+    counting_storage = {}
+    if None in counts:
+        counting_storage[0] = {
+            'count': counts.pop(None),
+            'username': _('Unassigned'),
+            'name': _('Unassigned'),
+            'id': 0,
+            'color': 'black',
+        }
+
+    user_model = apps.get_model("users", "User")
+    for user_obj in user_model.objects.filter(id__in=counts.keys()):
+        counting_storage[user_obj.id] = {
+            'count': counts[user_obj.id],
+            'username': user_obj.username,
+            'name': user_obj.get_full_name(),
+            'id': user_obj.id,
+            'color': user_obj.color,
+        }
+    return counting_storage
+
+
+# Issues opened and closed each day, and still open at the end of the day by
+# severity and priority. Dates are compared in UTC, like the day boundaries.
+ISSUES_DAYS_STATS_SQL = """
+    WITH days AS (
+        SELECT generate_series(%(first_day)s::timestamp, %(last_day)s::timestamp, '1 day'::interval) AS day
+    ), issues AS (
+        SELECT severity_id,
+               priority_id,
+               created_date AT TIME ZONE 'UTC' AS created,
+               finished_date AT TIME ZONE 'UTC' AS finished
+          FROM issues_issue
+         WHERE project_id = %(project_id)s
+           AND created_date AT TIME ZONE 'UTC' < %(end)s
+           AND (finished_date IS NULL
+                OR finished_date AT TIME ZONE 'UTC' >= %(first_day)s
+                OR created_date AT TIME ZONE 'UTC' >= %(first_day)s)
+    )
+    SELECT days.day,
+           issues.severity_id,
+           issues.priority_id,
+           SUM(CASE WHEN issues.created >= days.day
+                     AND issues.created < days.day + '1 day'::interval THEN 1 ELSE 0 END),
+           SUM(CASE WHEN issues.finished >= days.day
+                     AND issues.finished < days.day + '1 day'::interval THEN 1 ELSE 0 END),
+           SUM(CASE WHEN issues.created < days.day + '1 day'::interval
+                     AND (issues.finished IS NULL OR issues.finished > days.day) THEN 1 ELSE 0 END)
+      FROM days CROSS JOIN issues
+  GROUP BY days.day, issues.severity_id, issues.priority_id
+"""
+
+
+def _get_issues_days_stats(project, days):
+    params = {
+        "project_id": project.id,
+        "first_day": days[0],
+        "last_day": days[-1],
+        "end": days[-1] + datetime.timedelta(days=1),
+    }
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(ISSUES_DAYS_STATS_SQL, params)
+        return cursor.fetchall()
 
 
 def get_stats_for_project_issues(project):
+    issues = project.issues.all()
+    total_issues = issues.count()
+    closed_issues = issues.filter(status__is_closed=True).count()
+
     project_issues_stats = {
-        'total_issues': 0,
-        'opened_issues': 0,
-        'closed_issues': 0,
-        'issues_per_type': {},
-        'issues_per_status': {},
-        'issues_per_priority': {},
-        'issues_per_severity': {},
-        'issues_per_owner': {},
-        'issues_per_assigned_to': {},
+        'total_issues': total_issues,
+        'opened_issues': total_issues - closed_issues,
+        'closed_issues': closed_issues,
+        'issues_per_type': _count_status_objects(issues, 'type'),
+        'issues_per_status': _count_status_objects(issues, 'status'),
+        'issues_per_priority': _count_status_objects(issues, 'priority'),
+        'issues_per_severity': _count_status_objects(issues, 'severity'),
+        'issues_per_owner': _count_owned_objects(issues, 'owner'),
+        'issues_per_assigned_to': _count_owned_objects(issues, 'assigned_to'),
         'last_four_weeks_days': {
             'by_open_closed': {'open': [], 'closed': []},
             'by_severity': {},
@@ -79,60 +149,35 @@ def get_stats_for_project_issues(project):
 
     }
 
-    issues = project.issues.all().select_related(
-        'status', 'priority', 'type', 'severity', 'owner', 'assigned_to'
-    )
-    for issue in issues:
-        project_issues_stats['total_issues'] += 1
-        if issue.status is not None and issue.status.is_closed:
-            project_issues_stats['closed_issues'] += 1
-        else:
-            project_issues_stats['opened_issues'] += 1
-        _count_status_object(issue.type, project_issues_stats['issues_per_type'])
-        _count_status_object(issue.status, project_issues_stats['issues_per_status'])
-        _count_status_object(issue.priority, project_issues_stats['issues_per_priority'])
-        _count_status_object(issue.severity, project_issues_stats['issues_per_severity'])
-        _count_owned_object(issue.owner, project_issues_stats['issues_per_owner'])
-        _count_owned_object(issue.assigned_to, project_issues_stats['issues_per_assigned_to'])
-
     for severity in project_issues_stats['issues_per_severity'].values():
         project_issues_stats['last_four_weeks_days']['by_severity'][severity['id']] = copy.copy(severity)
         del(project_issues_stats['last_four_weeks_days']['by_severity'][severity['id']]['count'])
-        project_issues_stats['last_four_weeks_days']['by_severity'][severity['id']]['data'] = []
+        project_issues_stats['last_four_weeks_days']['by_severity'][severity['id']]['data'] = [0] * 28
 
     for priority in project_issues_stats['issues_per_priority'].values():
         project_issues_stats['last_four_weeks_days']['by_priority'][priority['id']] = copy.copy(priority)
         del(project_issues_stats['last_four_weeks_days']['by_priority'][priority['id']]['count'])
-        project_issues_stats['last_four_weeks_days']['by_priority'][priority['id']]['data'] = []
-
-    for x in range(27, -1, -1):
-        day = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 0)) - datetime.timedelta(days=x)
-        next_day = day + datetime.timedelta(days=1)
-
-        open_this_day = filter(lambda x: x.created_date.replace(tzinfo=None) >= day, issues)
-        open_this_day = filter(lambda x: x.created_date.replace(tzinfo=None) < next_day, open_this_day)
-        open_this_day = len(list(open_this_day))
-        project_issues_stats['last_four_weeks_days']['by_open_closed']['open'].append(open_this_day)
-
-        closed_this_day = filter(lambda x: x.finished_date, issues)
-        closed_this_day = filter(lambda x: x.finished_date.replace(tzinfo=None) >= day, closed_this_day)
-        closed_this_day = filter(lambda x: x.finished_date.replace(tzinfo=None) < next_day, closed_this_day)
-        closed_this_day = len(list(closed_this_day))
-        project_issues_stats['last_four_weeks_days']['by_open_closed']['closed'].append(closed_this_day)
-
-        opened_this_day = filter(lambda x: x.created_date.replace(tzinfo=None) < next_day, issues)
-        opened_this_day = list(filter(lambda x: x.finished_date is None or x.finished_date.replace(tzinfo=None) > day, opened_this_day))
-
-        for severity in project_issues_stats['last_four_weeks_days']['by_severity']:
-            by_severity = filter(lambda x: x.severity_id == severity, opened_this_day)
-            by_severity = len(list(by_severity))
-            project_issues_stats['last_four_weeks_days']['by_severity'][severity]['data'].append(by_severity)
-
-        for priority in project_issues_stats['last_four_weeks_days']['by_priority']:
-            by_priority = filter(lambda x: x.priority_id == priority, opened_this_day)
-            by_priority = len(list(by_priority))
-            project_issues_stats['last_four_weeks_days']['by_priority'][priority]['data'].append(by_priority)
-
+        project_issues_stats['last_four_weeks_days']['by_priority'][priority['id']]['data'] = [0] * 28
+
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 0))
+    days = [today - datetime.timedelta(days=x) for x in range(27, -1, -1)]
+    day_indexes = {day: index for index, day in enumerate(days)}
+
+    open_per_day = [0] * 28
+    closed_per_day = [0] * 28
+    by_severity = project_issues_stats['last_four_weeks_days']['by_severity']
+    by_priority = project_issues_stats['last_four_weeks_days']['by_priority']
+    for day, severity_id, priority_id, opened, closed, open_at_day in _get_issues_days_stats(project, days):
+        index = day_indexes[day]
+        open_per_day[index] += opened
+        closed_per_day[index] += closed
+        if severity_id in by_severity:
+            by_severity[severity_id]['data'][index] += open_at_day
+        if priority_id in by_priority:
+            by_priority[priority_id]['data'][index] += open_at_day
+
+    project_issues_stats['last_four_weeks_days']['by_open_closed']['open'] = open_per_day
+    project_issues_stats['last_four_weeks_days']['by_open_closed']['closed'] = closed_per_day
     return project_issues_stats
 
 
@@ -223,18 +268,44 @@ def _get_milestones_stats_for_backlog(project, milestones):
     return milestones_stats
 
 
+class _MilestoneIntervalIndex(object):
+    """
+    Find the first milestone (in estimated_start order) whose
+    [estimated_start, estimated_finish) interval contains a date
+    in O(log n).
+    """
+
+    def __init__(self, milestones):
+        self.milestones = list(milestones)
+        self.starts = [m.estimated_start for m in self.milestones]
+        # Max estimated_finish of the milestones until each position, it's sorted
+        self.max_finishes = list(itertools.accumulate((m.estimated_finish for m in self.milestones), max))
+
+    def find(self, date):
+        # Only the milestones started at date are candidates
+        candidates = bisect.bisect_right(self.starts, date)
+        # The first milestone finishing after date is the first one where
+        # the max estimated_finish goes beyond date
+        index = bisect.bisect_right(self.max_finishes, date)
+        if index < candidates:
+            return self.milestones[index]
+        return None
+
+
 def get_stats_for_project(project):
-    # Let's fetch all the estimations related to a project with all the necesary
-    # related data
+    # Let's fetch all the estimations related to a project with
+    # only the necesary related data
     role_points = RolePoints.objects.filter(
         user_story__project = project,
-    ).prefetch_related(
-        "user_story",
-        "user_story__assigned_to",
-        "user_story__milestone",
-        "user_story__status",
-        "role",
-        "points")
+    ).values_list(
+        "role_id",
+        "points__value",
+        "user_story__milestone_id",
+        "user_story__milestone__closed",
+        "user_story__is_closed",
+        "user_story__team_requirement",
+        "user_story__client_requirement",
+        "user_story__created_date")
 
     # Data inicialization
     project._closed_points = 0
@@ -255,14 +326,7 @@ def get_stats_for_project(project):
         milestone._client_increment_points = 0
         milestones[milestone.id] = milestone
 
-    def _find_milestone_for_userstory(user_story):
-        for m in milestones.values():
-            if m.estimated_finish > user_story.created_date.date() and\
-               m.estimated_start <= user_story.created_date.date():
-
-              return m
-
-        return None
+    milestones_index = _MilestoneIntervalIndex(milestones.values())
 
     def _update_team_increment(milestone, value):
         if milestone:
@@ -277,18 +341,14 @@ def get_stats_for_project(project):
             project._future_client_increment += value
 
     # Iterate over all the project estimations and update our stats
-    for role_point in role_points:
-        role_id = role_point.role.id
-        points_value = role_point.points.value
-        milestone = role_point.user_story.milestone
-        is_team_requirement = role_point.user_story.team_requirement
-        is_client_requirement = role_point.user_story.client_requirement
-        us_milestone = _find_milestone_for_userstory(role_point.user_story)
-
+    for (role_id, points_value, milestone_id, milestone_closed, us_is_closed,
+         is_team_requirement, is_client_requirement, us_created_date) in role_points:
         # None estimations doesn't affect to project stats
         if points_value is None:
             continue
 
+        us_milestone = milestones_index.find(us_created_date.date())
+
         # Total defined points
         project._defined_points += points_value
 
@@ -298,20 +358,20 @@ def get_stats_for_project(project):
         project._defined_points_per_role[role_id] = project._defined_points_for_role
 
         # Closed points
-        if role_point.user_story.is_closed:
+        if us_is_closed:
             project._closed_points += points_value
             closed_points_for_role = project._closed_points_per_role.get(role_id, 0)
             closed_points_for_role += points_value
             project._closed_points_per_role[role_id] = closed_points_for_role
 
-            if milestone is not None:
-                milestones[milestone.id]._closed_points += points_value
+            if milestone_id is not None:
+                milestones[milestone_id]._closed_points += points_value
 
-        if milestone is not None and milestone.closed:
+        if milestone_id is not None and milestone_closed:
             project._closed_points_from_closed_milestones += points_value
 
         # Assigned to milestone points
-        if role_point.user_story.milestone is not None:
+        if milestone_id is not None:
             project._assigned_points += points_value
             assigned_points_for_role = project._assigned_points_per_role.get(role_id, 0)
             assigned_points_for_role += points_value
@@ -352,6 +412,30 @@ def get_stats_for_project(project):
     return project_stats
 
 
+def _get_stats_for_project_cache_key(project_id, language):
+    # The version changes with every invalidation, whatever the language
+    version = get_cache_version("project-stats-version:{}".format(project_id))
+    return "project-stats:{}:{}:{}".format(project_id, version, language)
+
+
+def get_cached_stats_for_project(project):
+    """
+    Same as `get_stats_for_project` but cached per project (and language)
+    until `invalidate_stats_for_project` is called (or, with a process
+    local cache, PROCESS_LOCAL_CACHE_TIMEOUT at most).
+    """
+    key = _get_stats_for_project_cache_key(project.id, translation.get_language())
+    project_stats = cache.get(key)
+    if project_stats is None:
+        project_stats = get_stats_for_project(project)
+        cache.set(key, project_stats, timeout=get_cache_timeout(settings.PROJECT_STATS_CACHE_TIMEOUT))
+    return project_stats
+
+
+def invalidate_stats_for_project(project_id):
+    bump_cache_version_on_commit("project-stats-version:{}".format(project_id))
+
+
 def _get_closed_bugs_per_member_stats(project):
     # Closed bugs per user
     closed_bugs = project.issues.filter(status__is_closed=True)\
@@ -0,0 +1,57 @@
+# Copyright (C) 2013 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.utils import timezone
+
+from taiga.celery import app
+from taiga.projects.models import Project
+
+
+@app.task
+def refresh_projects_totals():
+    """
+    Periodic refresh of the project totals from the per-day
+    buckets, moving the rolling week/month/year windows.
+    """
+    for project in Project.objects.all().only("id").iterator():
+        project.refresh_totals_from_buckets()
+
+
+def refresh_stale_projects_totals(since=None):
+    """
+    Refresh from the per-day buckets the totals of the projects not
+    refreshed today (and updated after `since`, if given), so the
+    rolling windows are right without the periodic task.
+    """
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    projects = Project.objects.filter(totals_updated_datetime__lt=today)
+    if since is not None:
+        projects = projects.filter(totals_updated_datetime__gte=since)
+
+    for project in projects.only("id").iterator():
+        project.refresh_totals_from_buckets()
+
+
+@app.task
+def recount_projects_totals():
+    """
+    Full reconciliation of the project totals: rebuilds the per-day
+    buckets of every project from likes and timeline entries,
+    repairing any drift of the incremental counters.
+    """
+    for project in Project.objects.all().only("id").iterator():
+        project.refresh_totals()
@@ -17,9 +17,13 @@
 
 from django.apps import apps
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 
 from taiga.projects.services.tags_colors import update_project_tags_colors_handler, remove_unused_tags
+from taiga.projects.services.stats import invalidate_stats_for_project
+from taiga.projects.milestones.services import invalidate_milestone_stats_for_project
 from taiga.projects.notifications.services import create_notify_policy_if_not_exists
+from taiga.projects.history.freeze_impl import clear_project_values_cache
 from taiga.base.utils.db import get_typename_for_model_class
 
 from easy_thumbnails.files import get_thumbnailer
@@ -55,6 +59,50 @@ def create_notify_policy(sender, instance, using, **kwargs):
         create_notify_policy_if_not_exists(instance.project, instance.user)
 
 
+## Project stats
+
+def invalidate_project_stats(sender, instance, **kwargs):
+    """
+    Invalidate the cached stats of the project (and of its milestones)
+    of a user story, milestone or points object.
+    """
+    invalidate_stats_for_project(instance.project_id)
+    invalidate_milestone_stats_for_project(instance.project_id)
+
+
+def invalidate_project_stats_for_project(sender, instance, **kwargs):
+    invalidate_stats_for_project(instance.id)
+
+
+## History values
+
+def invalidate_history_values(sender, instance, **kwargs):
+    """
+    Clear the cached names of a project attribute (status, points,
+    role...) used by the history values.
+    """
+    clear_project_values_cache(instance.project_id, get_typename_for_model_class(sender))
+
+
+def invalidate_project_stats_for_role_points(sender, instance, **kwargs):
+    try:
+        project_id = instance.user_story.project_id
+    except ObjectDoesNotExist:
+        # The user story is being deleted and it invalidates the stats
+        return
+
+    invalidate_stats_for_project(project_id)
+    invalidate_milestone_stats_for_project(project_id)
+
+
+def invalidate_milestone_stats(sender, instance, **kwargs):
+    """
+    Invalidate the cached stats of the milestones of the project of a
+    task or task status.
+    """
+    invalidate_milestone_stats_for_project(instance.project_id)
+
+
 ## Project attributes
 
 def project_post_save(sender, instance, created, **kwargs):
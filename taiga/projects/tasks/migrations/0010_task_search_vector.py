@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from taiga.base.utils.db import get_search_vector_sql
+
+
+CREATE_SEARCH_VECTOR, DROP_SEARCH_VECTOR = get_search_vector_sql("tasks_task", [("subject", "A"), ("ref", "B"), ("description", "C")])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0026_auto_20150911_1237'),
+        ('tasks', '0009_auto_20151104_1131'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH_VECTOR, DROP_SEARCH_VECTOR),
+    ]
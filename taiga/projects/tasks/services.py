@@ -19,7 +19,7 @@ import io
 import csv
 
 from taiga.base.utils import db, text
-from taiga.projects.history.services import take_snapshot
+from taiga.projects.history.services import take_snapshots_in_bulk, with_freeze_related
 from taiga.projects.tasks.apps import (
     connect_tasks_signals,
     disconnect_tasks_signals)
@@ -84,13 +84,9 @@ def update_tasks_order_in_bulk(bulk_data:list, field:str, project:object):
 
 
 def snapshot_tasks_in_bulk(bulk_data, user):
-    task_ids = []
-    for task_data in bulk_data:
-        try:
-            task = models.Task.objects.get(pk=task_data['task_id'])
-            take_snapshot(task, user=user)
-        except models.UserStory.DoesNotExist:
-            pass
+    ids = [data['task_id'] for data in bulk_data]
+    objs = with_freeze_related(models.Task.objects.filter(pk__in=ids))
+    take_snapshots_in_bulk(list(objs), user=user, fetch=False)
 
 
 def tasks_to_csv(project, queryset):
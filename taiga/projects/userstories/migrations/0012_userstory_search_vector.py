@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from taiga.base.utils.db import get_search_vector_sql
+
+
+CREATE_SEARCH_VECTOR, DROP_SEARCH_VECTOR = get_search_vector_sql("userstories_userstory", [("subject", "A"), ("ref", "B"), ("description", "C")])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0026_auto_20150911_1237'),
+        ('userstories', '0011_userstory_tribe_gig'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH_VECTOR, DROP_SEARCH_VECTOR),
+    ]
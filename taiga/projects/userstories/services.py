@@ -26,7 +26,7 @@ from django.utils import timezone
 from django.utils.translation import ugettext as _
 
 from taiga.base.utils import db, text
-from taiga.projects.history.services import take_snapshot
+from taiga.projects.history.services import take_snapshots_in_bulk, with_freeze_related
 from taiga.projects.userstories.apps import (
     connect_userstories_signals,
     disconnect_userstories_signals)
@@ -92,13 +92,9 @@ def update_userstories_order_in_bulk(bulk_data:list, field:str, project:object):
 
 
 def snapshot_userstories_in_bulk(bulk_data, user):
-    user_story_ids = []
-    for us_data in bulk_data:
-        try:
-            us = models.UserStory.objects.get(pk=us_data['us_id'])
-            take_snapshot(us, user=user)
-        except models.UserStory.DoesNotExist:
-            pass
+    ids = [data['us_id'] for data in bulk_data]
+    objs = with_freeze_related(models.UserStory.objects.filter(pk__in=ids))
+    take_snapshots_in_bulk(list(objs), user=user, fetch=False)
 
 
 def calculate_userstory_is_closed(user_story):
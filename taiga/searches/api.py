@@ -16,9 +16,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from django.apps import apps
+from django.utils.translation import ugettext as _
 
 from taiga.base.api import viewsets
 
+from taiga.base import exceptions as exc
 from taiga.base import response
 from taiga.base.api.utils import get_object_or_404
 from taiga.permissions.service import user_has_perm
@@ -27,43 +29,45 @@ from . import services
 from . import serializers
 
 
-from concurrent import futures
-
 class SearchViewSet(viewsets.ViewSet):
+    # Searchable types with the permission needed to view them
+    # and the serializer of the results
+    search_types = (
+        ("userstories", "view_us", serializers.UserStorySearchResultsSerializer),
+        ("tasks", "view_tasks", serializers.TaskSearchResultsSerializer),
+        ("issues", "view_issues", serializers.IssueSearchResultsSerializer),
+        ("wikipages", "view_wiki_pages", serializers.WikiPageSearchResultsSerializer),
+    )
+
     def list(self, request, **kwargs):
         text = request.QUERY_PARAMS.get('text', "")
         project_id = request.QUERY_PARAMS.get('project', None)
+        mode = request.QUERY_PARAMS.get('mode', services.FULLTEXT_MODE)
+        limit = request.QUERY_PARAMS.get('limit', None)
+
+        if mode not in services.SEARCH_MODES:
+            raise exc.BadRequest(_("Invalid search mode."))
+
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+
+            if limit < 1:
+                raise exc.BadRequest(_("'limit' must be a positive integer value."))
 
         project = self._get_project(project_id)
 
-        result = {}
-        with futures.ThreadPoolExecutor(max_workers=4) as executor:
-            futures_list = []
-            if user_has_perm(request.user, "view_us", project):
-                uss_future = executor.submit(self._search_user_stories, project, text)
-                uss_future.result_key = "userstories"
-                futures_list.append(uss_future)
-            if user_has_perm(request.user, "view_tasks", project):
-                tasks_future = executor.submit(self._search_tasks, project, text)
-                tasks_future.result_key = "tasks"
-                futures_list.append(tasks_future)
-            if user_has_perm(request.user, "view_issues", project):
-                issues_future = executor.submit(self._search_issues, project, text)
-                issues_future.result_key = "issues"
-                futures_list.append(issues_future)
-            if user_has_perm(request.user, "view_wiki_pages", project):
-                wiki_pages_future = executor.submit(self._search_wiki_pages, project, text)
-                wiki_pages_future.result_key = "wikipages"
-                futures_list.append(wiki_pages_future)
+        serializer_classes = {search_type: serializer_class
+                              for search_type, permission, serializer_class in self.search_types
+                              if user_has_perm(request.user, permission, project)}
+        search_types = [search_type for search_type, permission, serializer_class in self.search_types
+                        if search_type in serializer_classes]
 
-            for future in futures.as_completed(futures_list):
-                data = []
-                try:
-                    data = future.result()
-                except Exception as exc:
-                    print('%s generated an exception: %s' % (future.result_key, exc))
-                finally:
-                    result[future.result_key] = data
+        result = {}
+        for search_type, objects in services.search(project, text, search_types, mode=mode, limit=limit).items():
+            result[search_type] = serializer_classes[search_type](objects, many=True).data
 
         result["count"] = sum(map(lambda x: len(x), result.values()))
         return response.Ok(result)
@@ -71,23 +75,3 @@ class SearchViewSet(viewsets.ViewSet):
     def _get_project(self, project_id):
         project_model = apps.get_model("projects", "Project")
         return get_object_or_404(project_model, pk=project_id)
-
-    def _search_user_stories(self, project, text):
-        queryset = services.search_user_stories(project, text)
-        serializer = serializers.UserStorySearchResultsSerializer(queryset, many=True)
-        return serializer.data
-
-    def _search_tasks(self, project, text):
-        queryset = services.search_tasks(project, text)
-        serializer = serializers.TaskSearchResultsSerializer(queryset, many=True)
-        return serializer.data
-
-    def _search_issues(self, project, text):
-        queryset = services.search_issues(project, text)
-        serializer = serializers.IssueSearchResultsSerializer(queryset, many=True)
-        return serializer.data
-
-    def _search_wiki_pages(self, project, text):
-        queryset = services.search_wiki_pages(project, text)
-        serializer = serializers.WikiPageSearchResultsSerializer(queryset, many=True)
-        return serializer.data
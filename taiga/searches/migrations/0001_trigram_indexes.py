@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# NOTE: These indexes are needed by the typeahead mode of taiga.searches.services
+# (partial matches of the subject, or the slug, and the ref). The pg_trgm extension
+# must be installed by the database administrator (CREATE EXTENSION pg_trgm) and
+# they are only created if it is; otherwise the typeahead mode works without them.
+TRIGRAM_INDEXES = [
+    ("userstories_userstory", "subject", "subject"),
+    ("userstories_userstory", "ref", "(ref::text)"),
+    ("tasks_task", "subject", "subject"),
+    ("tasks_task", "ref", "(ref::text)"),
+    ("issues_issue", "subject", "subject"),
+    ("issues_issue", "ref", "(ref::text)"),
+    ("wiki_wikipage", "slug", "slug"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            return
+
+        for table, name, expression in TRIGRAM_INDEXES:
+            cursor.execute("CREATE INDEX {table}_{name}_trgm_idx ON {table} "
+                           "USING gin({expression} gin_trgm_ops)".format(table=table, name=name,
+                                                                         expression=expression))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, name, expression in TRIGRAM_INDEXES:
+            cursor.execute("DROP INDEX IF EXISTS {table}_{name}_trgm_idx".format(table=table, name=name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userstories', '0012_userstory_search_vector'),
+        ('tasks', '0010_task_search_vector'),
+        ('issues', '0007_issue_search_vector'),
+        ('wiki', '0003_wikipage_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
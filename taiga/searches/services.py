@@ -15,61 +15,156 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
+
 from django.apps import apps
 from django.conf import settings
+from django.db import connection
+from taiga.base.utils.db import is_pg_extension_installed
 from taiga.base.utils.db import to_tsquery
+from taiga.base.utils.slug import slugify
 
 MAX_RESULTS = getattr(settings, "SEARCHES_MAX_RESULTS", 150)
 
-
-def search_user_stories(project, text):
-    model_cls = apps.get_model("userstories", "UserStory")
-    where_clause = ("to_tsvector('english_nostop', coalesce(userstories_userstory.subject) || ' ' || "
-                                "coalesce(userstories_userstory.ref) || ' ' || "
-                                "coalesce(userstories_userstory.description, '')) "
-                    "@@ to_tsquery('english_nostop', %s)")
-
-    if text:
-        return (model_cls.objects.extra(where=[where_clause], params=[to_tsquery(text)])
-                                 .filter(project_id=project.pk)[:MAX_RESULTS])
-
-    return model_cls.objects.filter(project_id=project.pk)[:MAX_RESULTS]
-
-
-def search_tasks(project, text):
-    model_cls = apps.get_model("tasks", "Task")
-    where_clause = ("to_tsvector('english_nostop', coalesce(tasks_task.subject, '') || ' ' || "
-                    "coalesce(tasks_task.ref) || ' ' || "
-                    "coalesce(tasks_task.description, '')) @@ to_tsquery('english_nostop', %s)")
-
-    if text:
-        return (model_cls.objects.extra(where=[where_clause], params=[to_tsquery(text)])
-                                 .filter(project_id=project.pk)[:MAX_RESULTS])
-
-    return model_cls.objects.filter(project_id=project.pk)[:MAX_RESULTS]
-
-
-def search_issues(project, text):
-    model_cls = apps.get_model("issues", "Issue")
-    where_clause = ("to_tsvector('english_nostop', coalesce(issues_issue.subject) || ' ' || "
-                    "coalesce(issues_issue.ref) || ' ' || "
-                    "coalesce(issues_issue.description, '')) @@ to_tsquery('english_nostop', %s)")
-
-    if text:
-        return (model_cls.objects.extra(where=[where_clause], params=[to_tsquery(text)])
-                                 .filter(project_id=project.pk)[:MAX_RESULTS])
-
-    return model_cls.objects.filter(project_id=project.pk)[:MAX_RESULTS]
-
-
-def search_wiki_pages(project, text):
-    model_cls = apps.get_model("wiki", "WikiPage")
-    where_clause = ("to_tsvector('english_nostop', coalesce(wiki_wikipage.slug) || ' ' || "
-                                "coalesce(wiki_wikipage.content, '')) "
-                    "@@ to_tsquery('english_nostop', %s)")
-
-    if text:
-        return (model_cls.objects.extra(where=[where_clause], params=[to_tsquery(text)])
-                                 .filter(project_id=project.pk)[:MAX_RESULTS])
-
-    return model_cls.objects.filter(project_id=project.pk)[:MAX_RESULTS]
+TYPEAHEAD_LIMIT = getattr(settings, "SEARCHES_TYPEAHEAD_LIMIT", 10)
+
+FULLTEXT_MODE = "fulltext"
+TYPEAHEAD_MODE = "typeahead"
+SEARCH_MODES = (FULLTEXT_MODE, TYPEAHEAD_MODE)
+
+# Searchable types, their models and the field matched by the typeahead
+# mode (with the ref, if the model has it). Wiki pages have no title, so
+# their slug is matched (with the slugified text).
+SEARCH_TYPES = OrderedDict([
+    ("userstories", ("userstories", "UserStory", "subject")),
+    ("tasks", ("tasks", "Task", "subject")),
+    ("issues", ("issues", "Issue", "subject")),
+    ("wikipages", ("wiki", "WikiPage", "slug")),
+])
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _get_search_subquery(search_type, model_cls, project, text, limit):
+    """
+    Full text search with the precomputed (and indexed) search_vector
+    column of the model table (see `taiga.base.utils.db.SEARCH_VECTOR_TABLES`),
+    the best ranked results first.
+    """
+    table = model_cls._meta.db_table
+    sql = """
+        SELECT %s AS type, {table}.id AS id,
+               ts_rank({table}.search_vector, to_tsquery('english_nostop', %s)) AS rank
+          FROM {table}
+         WHERE {table}.project_id = %s
+           AND {table}.search_vector @@ to_tsquery('english_nostop', %s)
+      ORDER BY rank DESC, id DESC
+         LIMIT %s
+    """
+    tsquery = to_tsquery(text)
+    params = [search_type, tsquery, project.pk, tsquery, limit]
+
+    return sql.format(table=table), params
+
+
+def _get_typeahead_subquery(search_type, model_cls, project, text, limit):
+    """
+    Partial matches of the words being typed, served by the trigram
+    indexes of the field (and ref). The matches at the start of the field
+    come first and then, if the pg_trgm extension is installed, the most
+    similar ones.
+    """
+    table = model_cls._meta.db_table
+    field = SEARCH_TYPES[search_type][2]
+    text = text.strip()
+    if field == "slug":
+        text = slugify(text) or text
+    escaped_text = _escape_like(text)
+
+    rank = "CASE WHEN {table}.{field} ILIKE %s THEN 1 ELSE 0 END"
+    params = [search_type, escaped_text + "%"]
+    if is_pg_extension_installed("pg_trgm"):
+        rank = "similarity({table}.{field}, %s) + " + rank
+        params.insert(1, text)
+
+    where_clause = "{table}.{field} ILIKE %s"
+    params += [project.pk, "%" + escaped_text + "%"]
+    if any(f.name == "ref" for f in model_cls._meta.fields):
+        where_clause = "({table}.{field} ILIKE %s OR {table}.ref::text LIKE %s)"
+        params.append(escaped_text + "%")
+
+    sql = """
+        SELECT %s AS type, {table}.id AS id, """ + rank + """ AS rank
+          FROM {table}
+         WHERE {table}.project_id = %s
+           AND """ + where_clause + """
+      ORDER BY rank DESC, id DESC
+         LIMIT %s
+    """
+    params.append(limit)
+
+    return sql.format(table=table, field=field), params
+
+
+def search(project, text, search_types, *, mode=FULLTEXT_MODE, limit=None):
+    """
+    Search all the given types (keys of SEARCH_TYPES, usually the ones
+    the user has permissions to view) with a single UNION ALL query,
+    up to `limit` results of each type. The objects are loaded afterwards
+    with a query by type.
+
+    The typeahead mode matches partial words of the subject (or slug) and
+    ref instead of the full text search. It works better, with similarity
+    ranking and indexes, if the pg_trgm extension is installed.
+
+    Returns a dict with a list of objects, best ranked first, per type.
+    Without text the objects of the project are returned in the default
+    ordering of their models.
+    """
+    assert mode in SEARCH_MODES
+
+    if limit is None:
+        limit = TYPEAHEAD_LIMIT if mode == TYPEAHEAD_MODE else MAX_RESULTS
+    limit = min(limit, MAX_RESULTS)
+
+    results = OrderedDict((search_type, []) for search_type in search_types)
+    if not search_types:
+        return results
+
+    models = {search_type: apps.get_model(*SEARCH_TYPES[search_type][:2]) for search_type in search_types}
+
+    if not text.strip():
+        # Without text there is no rank, the objects keep the
+        # ordering of their models
+        for search_type in search_types:
+            results[search_type] = list(models[search_type].objects.filter(project_id=project.pk)[:limit])
+        return results
+
+    if mode == TYPEAHEAD_MODE:
+        get_subquery = _get_typeahead_subquery
+    else:
+        get_subquery = _get_search_subquery
+
+    subqueries = []
+    params = []
+    for search_type in search_types:
+        subquery, subquery_params = get_subquery(search_type, models[search_type], project, text, limit)
+        subqueries.append("({})".format(subquery))
+        params += subquery_params
+
+    with connection.cursor() as cursor:
+        cursor.execute(" UNION ALL ".join(subqueries), params)
+        rows = cursor.fetchall()
+
+    ids = OrderedDict((search_type, []) for search_type in search_types)
+    for search_type, id, rank in rows:
+        ids[search_type].append(id)
+
+    for search_type, type_ids in ids.items():
+        if type_ids:
+            objects = models[search_type].objects.in_bulk(type_ids)
+            results[search_type] = [objects[id] for id in type_ids if id in objects]
+
+    return results
@@ -54,3 +54,13 @@ class DiscoverStatsViewSet(BaseStatsViewSet):
         stats = OrderedDict()
         stats["projects"] = services.get_projects_discover_stats(user=request.user)
         return response.Ok(stats)
+
+
+class EventsStatsViewSet(viewsets.ViewSet):
+    permission_classes = (permissions.EventsStatsPermission,)
+
+    def list(self, request, **kwargs):
+        # Not cached, the stats are of the process serving the request
+        stats = OrderedDict()
+        stats["sender"] = services.get_events_sender_stats()
+        return response.Ok(stats)
@@ -22,3 +22,7 @@ class SystemStatsPermission(permissions.TaigaResourcePermission):
 
 class DiscoverStatsPermission(permissions.TaigaResourcePermission):
     global_perms = permissions.AllowAny()
+
+
+class EventsStatsPermission(permissions.TaigaResourcePermission):
+    global_perms = permissions.IsSuperUser()
@@ -25,3 +25,4 @@ if settings.STATS_ENABLED:
     router.register(r"stats/system", api.SystemStatsViewSet, base_name="system-stats")
 
 router.register(r"stats/discover", api.DiscoverStatsViewSet, base_name="discover-stats")
+router.register(r"stats/events", api.EventsStatsViewSet, base_name="events-stats")
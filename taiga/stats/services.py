@@ -21,6 +21,8 @@ from django.utils import timezone
 from datetime import timedelta
 from collections import OrderedDict
 
+import os
+
 
 ###########################################################################
 # Public Stats
@@ -151,3 +153,16 @@ def get_projects_discover_stats(user=None):
     stats["total"] = queryset.count()
 
     return stats
+
+
+###########################################################################
+# Events Stats
+###########################################################################
+
+def get_events_sender_stats():
+    from taiga.events.sender import events_sender
+
+    stats = OrderedDict()
+    stats["pid"] = os.getpid()
+    stats.update(sorted(events_sender.get_stats().items()))
+    return stats
@@ -29,6 +29,7 @@ from . import permissions
 
 class TimelineViewSet(ReadOnlyListViewSet):
     serializer_class = serializers.TimelineSerializer
+    cursor_ordering = ("-created", "-id")
 
     content_type = None
 
@@ -77,15 +78,20 @@ class TimelineViewSet(ReadOnlyListViewSet):
         qs = self.get_timeline(obj)
 
         if request.GET.get("only_relevant", None) is not None:
+            # The payload is checked with a subquery because the event table
+            # is not joined in the count query of the pagination
             qs = qs.extra(where=[
                 """
                 NOT(
-                    data::text LIKE '%%\"values_diff\": {}%%'
-                    AND
-                    event_type::text = ANY('{issues.issue.change,
+                    timeline_timeline.event_type::text = ANY('{issues.issue.change,
                                              tasks.task.change,
                                              userstories.userstory.change,
                                              wiki.wikipage.change}'::text[])
+                    AND
+                    EXISTS(SELECT 1
+                             FROM timeline_timelineevent
+                            WHERE timeline_timelineevent.id = timeline_timeline.event_id
+                              AND timeline_timelineevent.data::text LIKE '%%\"values_diff\": {}%%')
                 )
                 """])
 
@@ -36,3 +36,5 @@ class TimelineAppConfig(AppConfig):
                                                 sender=apps.get_model("projects", "Membership"))
         signals.post_save.connect(handlers.create_user_push_to_timeline,
                                                  sender=apps.get_model("users", "User"))
+        signals.pre_save.connect(handlers.update_timeline_visibility_on_project_change,
+                                                 sender=apps.get_model("projects", "Project"))
@@ -18,7 +18,8 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.test.utils import override_settings
 
-from taiga.timeline.models import Timeline
+from taiga.timeline.models import Timeline, TimelineEvent
+from taiga.timeline.service import delete_timeline_entries
 from taiga.projects.models import Project
 
 class Command(BaseCommand):
@@ -26,10 +27,11 @@ class Command(BaseCommand):
 
     @override_settings(DEBUG=False)
     def handle(self, *args, **options):
-        removing_timeline_ids = []
-        for t in Timeline.objects.filter(event_type="projects.membership.create").order_by("created"):
-            print(t.created)
-            if t.project.owner.id == t.data["user"].get("id", None):
-                removing_timeline_ids.append(t.id)
+        removing_event_ids = []
+        for e in TimelineEvent.objects.filter(event_type="projects.membership.create").order_by("created"):
+            print(e.created)
+            if e.project.owner.id == e.data["user"].get("id", None):
+                removing_event_ids.append(e.id)
 
-        Timeline.objects.filter(id__in=removing_timeline_ids).delete()
+        delete_timeline_entries(Timeline.objects.filter(event_id__in=removing_event_ids),
+                                TimelineEvent.objects.filter(id__in=removing_event_ids))
@@ -26,8 +26,8 @@ from django.db.models import Model
 from django.db import reset_queries
 from django.test.utils import override_settings
 
-from taiga.timeline.service import (_get_impl_key_from_model,
-    _timeline_impl_map, extract_user_info)
+from taiga.timeline.service import (_create_timeline_event, _build_timeline_entry,
+    extract_user_info)
 from taiga.timeline.models import Timeline
 from taiga.timeline.signals import _push_to_timelines
 from taiga.users.models import User
@@ -55,21 +55,13 @@ class BulkCreator(object):
 bulk_creator = BulkCreator()
 
 
-def custom_add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
+def custom_add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}, event=None):
     assert isinstance(obj, Model), "obj must be a instance of Model"
     assert isinstance(instance, Model), "instance must be a instance of Model"
-    event_type_key = _get_impl_key_from_model(instance.__class__, event_type)
-    impl = _timeline_impl_map.get(event_type_key, None)
-
-    bulk_creator.create_element(Timeline(
-        content_object=obj,
-        namespace=namespace,
-        event_type=event_type_key,
-        project=None,
-        data=impl(instance, extra_data=extra_data),
-        data_content_type = ContentType.objects.get_for_model(instance.__class__),
-        created=created_datetime,
-    ))
+    if event is None:
+        event = _create_timeline_event(instance, event_type, created_datetime, extra_data)
+
+    bulk_creator.create_element(_build_timeline_entry(obj, event, namespace))
 
 
 def generate_timeline():
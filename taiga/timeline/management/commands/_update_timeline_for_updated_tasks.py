@@ -35,7 +35,7 @@ def update_timeline(initial_date, final_date):
     if final_date:
         timelines = timelines.filter(created__lt=final_date)
 
-    timelines = timelines.filter(event_type="tasks.task.change")
+    timelines = timelines.filter(event_type="tasks.task.change").select_related("event")
 
     print("Generating tasks indexed by id dict")
     task_ids = timelines.values_list("object_id", flat=True)
@@ -58,8 +58,8 @@ def update_timeline(initial_date, final_date):
             counter += 1
             continue
 
-        timeline.data["task"]["userstory"] = userstory_timeline(user_story)
-        timeline.save(update_fields=["data"])
+        timeline.event.data["task"]["userstory"] = userstory_timeline(user_story)
+        timeline.event.save(update_fields=["data"])
         counter += 1
 
 
@@ -19,30 +19,36 @@
 # python manage.py rebuild_timeline --settings=settings.local_timeline --initial_date 2014-10-02 --final_date 2014-10-03
 # python manage.py rebuild_timeline --settings=settings.local_timeline --purge
 # python manage.py rebuild_timeline --settings=settings.local_timeline --initial_date 2014-10-02
+# python manage.py rebuild_timeline --settings=settings.local_timeline --processes 4 --chunk_size 50
+# python manage.py rebuild_timeline --settings=settings.local_timeline --processes 4 --chunk_size 50 --resume
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.management.base import BaseCommand
-from django.db.models import Model
-from django.db import reset_queries
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Model, Min, Max, F
+from django.db import connections, reset_queries
 from django.test.utils import override_settings
 
 
-from taiga.projects.models import Project
+from taiga.projects.models import Project, Membership
 from taiga.projects.history import services as history_services
 from taiga.projects.history.choices import HistoryType
 from taiga.projects.history.models import HistoryEntry
-from taiga.timeline.models import Timeline
-from taiga.timeline.service import (_add_to_object_timeline, _get_impl_key_from_model,
-    _timeline_impl_map, extract_user_info)
+from taiga.timeline.models import Timeline, TimelineEvent
+from taiga.timeline.service import (_create_timeline_event, _build_timeline_entry,
+    extract_user_info, delete_timeline_entries, BULK_CREATE_BATCH_SIZE)
 from taiga.timeline.signals import on_new_history_entry, _push_to_timelines
 from taiga.users.models import User
 
 from unittest.mock import patch
 from optparse import make_option
+from multiprocessing import Pool
 
 import gc
+import os
+import time
 
 
 class BulkCreator(object):
@@ -52,11 +58,11 @@ class BulkCreator(object):
 
     def create_element(self, element):
         self.timeline_objects.append(element)
-        if len(self.timeline_objects) > 1000:
+        if len(self.timeline_objects) > BULK_CREATE_BATCH_SIZE:
             self.flush()
 
     def flush(self):
-        Timeline.objects.bulk_create(self.timeline_objects, batch_size=1000)
+        Timeline.objects.bulk_create(self.timeline_objects, batch_size=BULK_CREATE_BATCH_SIZE)
         del self.timeline_objects
         self.timeline_objects = []
         gc.collect()
@@ -64,65 +70,75 @@ class BulkCreator(object):
 bulk_creator = BulkCreator()
 
 
-def custom_add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
+def custom_add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}, event=None):
     assert isinstance(obj, Model), "obj must be a instance of Model"
     assert isinstance(instance, Model), "instance must be a instance of Model"
-    event_type_key = _get_impl_key_from_model(instance.__class__, event_type)
-    impl = _timeline_impl_map.get(event_type_key, None)
+    if event is None:
+        event = _create_timeline_event(instance, event_type, created_datetime, extra_data)
 
-    bulk_creator.create_element(Timeline(
-        content_object=obj,
-        namespace=namespace,
-        event_type=event_type_key,
-        project=instance.project,
-        data=impl(instance, extra_data=extra_data),
-        data_content_type=ContentType.objects.get_for_model(instance.__class__),
-        created=created_datetime,
-    ))
+    bulk_creator.create_element(_build_timeline_entry(obj, event, namespace))
 
 
-def generate_timeline(initial_date, final_date, project_id):
-    if initial_date or final_date or project_id:
-        timelines = Timeline.objects.all()
-        if initial_date:
-            timelines = timelines.filter(created__gte=initial_date)
-        if final_date:
-            timelines = timelines.filter(created__lt=final_date)
-        if project_id:
-            timelines = timelines.filter(project__id=project_id)
-
-        timelines.delete()
-
-    with patch('taiga.timeline.service._add_to_object_timeline', new=custom_add_to_object_timeline):
-        # Projects api wasn't a HistoryResourceMixin so we can't interate on the HistoryEntries in this case
-        projects = Project.objects.order_by("created_date")
-        history_entries = HistoryEntry.objects.order_by("created_at")
+def _filter_by_dates(queryset, field, initial_date, final_date):
+    if initial_date:
+        queryset = queryset.filter(**{"{}__gte".format(field): initial_date})
+    if final_date:
+        queryset = queryset.filter(**{"{}__lt".format(field): final_date})
+    return queryset
+
+
+def _filter_history_entries_by_projects(queryset, project_ids):
+    # The keys of the objects of the projects are built by a subquery
+    # instead of sending a list with a key per object
+    subqueries = []
+    params = []
+    for typename in ("userstories.userstory", "tasks.task", "issues.issue", "wiki.wikipage",
+                     "milestones.milestone", "projects.project"):
+        model = apps.get_model(*typename.split("."))
+        project_field = "id" if model is Project else "project_id"
+        subqueries.append("SELECT %s || id FROM {} WHERE {} = ANY(%s)".format(model._meta.db_table, project_field))
+        params += ["{}:".format(typename), list(project_ids)]
+
+    where = "history_historyentry.key IN ({})".format(" UNION ALL ".join(subqueries))
+    return queryset.extra(where=[where], params=params)
+
 
-        if initial_date:
-            projects = projects.filter(created_date__gte=initial_date)
-            history_entries = history_entries.filter(created_at__gte=initial_date)
+def delete_timeline(initial_date, final_date, project_ids=None):
+    # The entries have the project and the date of their events
+    entries = _filter_by_dates(Timeline.objects.all(), "created", initial_date, final_date)
+    events = _filter_by_dates(TimelineEvent.objects.all(), "created", initial_date, final_date)
+    if project_ids is not None:
+        entries = entries.filter(project_id__in=project_ids)
+        events = events.filter(project_id__in=project_ids)
 
-        if final_date:
-            projects = projects.filter(created_date__lt=final_date)
-            history_entries = history_entries.filter(created_at__lt=final_date)
+    delete_timeline_entries(entries, events)
 
-        if project_id:
-            project = Project.objects.get(id=project_id)
-            us_keys = ['userstories.userstory:%s'%(id) for id in project.user_stories.values_list("id", flat=True)]
-            tasks_keys = ['tasks.task:%s'%(id) for id in project.tasks.values_list("id", flat=True)]
-            issue_keys = ['issues.issue:%s'%(id) for id in project.issues.values_list("id", flat=True)]
-            wiki_keys = ['wiki.wikipage:%s'%(id) for id in project.wiki_pages.values_list("id", flat=True)]
-            keys = us_keys + tasks_keys + issue_keys + wiki_keys
 
-            projects = projects.filter(id=project_id)
-            history_entries = history_entries.filter(key__in=keys)
+def _generate_timeline(initial_date, final_date, project_ids=None, verbose=True):
+    # The project totals are recounted once the timeline is regenerated
+    with patch('taiga.timeline.service._add_to_object_timeline', new=custom_add_to_object_timeline), \
+            patch('taiga.projects.models.Project.increment_totals'):
+        # Projects api wasn't a HistoryResourceMixin so we can't interate on the HistoryEntries in this case
+        projects = _filter_by_dates(Project.objects.order_by("created_date"), "created_date", initial_date, final_date)
+        history_entries = _filter_by_dates(HistoryEntry.objects.order_by("created_at"), "created_at", initial_date, final_date)
+
+        memberships = (Membership.objects.exclude(user=None)
+                                         .exclude(user=F("project__owner"))
+                                         .select_related("project", "user"))
+        memberships = _filter_by_dates(memberships, "created_at", initial_date, final_date)
+
+        if project_ids is not None:
+            projects = projects.filter(id__in=project_ids)
+            history_entries = _filter_history_entries_by_projects(history_entries, project_ids)
+            memberships = memberships.filter(project_id__in=project_ids)
 
-            #Memberships
-            for membership in project.memberships.exclude(user=None).exclude(user=project.owner):
-                _push_to_timelines(project, membership.user, membership, "create", membership.created_at)
+        # The same steps for a full rebuild, a project or a chunk of projects
+        for membership in memberships.iterator():
+            _push_to_timelines(membership.project, membership.user, membership, "create", membership.created_at)
 
         for project in projects.iterator():
-            print("Project:", bulk_creator.created)
+            if verbose:
+                print("Project:", bulk_creator.created)
             extra_data = {
                 "values_diff": {},
                 "user": extract_user_info(project.owner),
@@ -131,15 +147,71 @@ def generate_timeline(initial_date, final_date, project_id):
             del extra_data
 
         for historyEntry in history_entries.iterator():
-            print("History entry:", historyEntry.created_at)
+            if verbose:
+                print("History entry:", historyEntry.created_at)
             try:
                 on_new_history_entry(None, historyEntry, None)
             except ObjectDoesNotExist as e:
-                print("Ignoring")
+                if verbose:
+                    print("Ignoring")
 
     bulk_creator.flush()
 
 
+def generate_timeline(initial_date, final_date, project_id):
+    project_ids = [int(project_id)] if project_id else None
+    if initial_date or final_date or project_ids:
+        delete_timeline(initial_date, final_date, project_ids)
+
+    _generate_timeline(initial_date, final_date, project_ids)
+
+
+def _init_chunk_worker():
+    # The database connections inherited from the parent process can't be shared
+    connections.close_all()
+
+
+def generate_timeline_for_chunk(args):
+    """
+    Regenerate the timeline of the projects with ids in [first_id, last_id].
+    The previous entries of the chunk are deleted first, so an interrupted
+    chunk can be generated again safely.
+    """
+    initial_date, final_date, (first_id, last_id) = args
+    started = time.time()
+
+    project_ids = list(Project.objects.filter(id__gte=first_id, id__lte=last_id).values_list("id", flat=True))
+    delete_timeline(initial_date, final_date, project_ids)
+    _generate_timeline(initial_date, final_date, project_ids, verbose=False)
+
+    for project in Project.objects.filter(id__in=project_ids).iterator():
+        project.refresh_totals()
+
+    entries = _filter_by_dates(Timeline.objects.filter(project_id__in=project_ids), "created", initial_date, final_date)
+    return (first_id, last_id), entries.count(), time.time() - started
+
+
+def get_chunks(chunk_size):
+    limits = Project.objects.aggregate(min_id=Min("id"), max_id=Max("id"))
+    if limits["min_id"] is None:
+        return []
+
+    chunks = []
+    first_id = limits["min_id"] - limits["min_id"] % chunk_size
+    while first_id <= limits["max_id"]:
+        chunks.append((first_id, first_id + chunk_size - 1))
+        first_id += chunk_size
+    return chunks
+
+
+def read_checkpoints(checkpoint_file):
+    if not os.path.exists(checkpoint_file):
+        return set()
+
+    with open(checkpoint_file) as f:
+        return set(tuple(int(v) for v in line.split()[:2]) for line in f if line.strip())
+
+
 class Command(BaseCommand):
     help = 'Regenerate project timeline'
     option_list = BaseCommand.option_list + (
@@ -166,11 +238,90 @@ class Command(BaseCommand):
                     dest='project',
                     default=None,
                     help='Selected project id for timeline generation'),
+        ) + (
+        make_option('--processes',
+                    action='store',
+                    dest='processes',
+                    type='int',
+                    default=None,
+                    help='Generate the timeline in chunks of projects using a pool of processes'),
+        ) + (
+        make_option('--chunk_size',
+                    action='store',
+                    dest='chunk_size',
+                    type='int',
+                    default=100,
+                    help='Size of the project id ranges generated by each process (default: 100)'),
+        ) + (
+        make_option('--checkpoint_file',
+                    action='store',
+                    dest='checkpoint_file',
+                    default='rebuild_timeline.checkpoint',
+                    help='File where the generated chunks are recorded'),
+        ) + (
+        make_option('--resume',
+                    action='store_true',
+                    dest='resume',
+                    default=False,
+                    help='Skip the chunks recorded in the checkpoint file'),
         )
 
     @override_settings(DEBUG=False)
     def handle(self, *args, **options):
+        if options["processes"]:
+            return self.handle_in_chunks(**options)
+
         if options["purge"] == True:
-            Timeline.objects.all().delete()
+            delete_timeline_entries(Timeline.objects.all())
 
         generate_timeline(options["initial_date"], options["final_date"], options["project"])
+
+        # Timeline entries have been regenerated so the
+        # incremental project totals must be recounted
+        projects = Project.objects.all()
+        if options["project"]:
+            projects = projects.filter(id=options["project"])
+
+        for project in projects.iterator():
+            project.refresh_totals()
+
+    def handle_in_chunks(self, **options):
+        if options["project"]:
+            raise CommandError("--project can't be used with --processes")
+        if options["purge"] and options["resume"]:
+            raise CommandError("--purge can't be used with --resume")
+
+        checkpoint_file = options["checkpoint_file"]
+        done = read_checkpoints(checkpoint_file) if options["resume"] else set()
+        if not options["resume"] and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+        if options["purge"] == True:
+            delete_timeline_entries(Timeline.objects.all())
+
+        chunks = [c for c in get_chunks(options["chunk_size"]) if c not in done]
+        self.stdout.write("Generating {} chunks ({} already done)".format(len(chunks), len(done)))
+
+        # Every process needs its own database connection
+        connections.close_all()
+        pool = Pool(options["processes"], initializer=_init_chunk_worker)
+
+        started = time.time()
+        total_entries = 0
+        try:
+            tasks = [(options["initial_date"], options["final_date"], c) for c in chunks]
+            for count, (chunk, entries, elapsed) in enumerate(pool.imap_unordered(generate_timeline_for_chunk, tasks), 1):
+                # Record the chunk as done
+                with open(checkpoint_file, "a") as f:
+                    f.write("{} {} {}\n".format(chunk[0], chunk[1], entries))
+
+                total_entries += entries
+                total_elapsed = time.time() - started
+                self.stdout.write("Chunk {}-{} ({}/{}): {} entries in {:.1f}s ({:.1f} entries/sec), "
+                                  "total {} entries ({:.1f} entries/sec)".format(
+                                      chunk[0], chunk[1], count, len(chunks), entries, elapsed,
+                                      entries / elapsed if elapsed else 0, total_entries,
+                                      total_entries / total_elapsed if total_elapsed else 0))
+        finally:
+            pool.terminate()
+            pool.join()
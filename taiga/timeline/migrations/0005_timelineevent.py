@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django_pgjson.fields
+import django.utils.timezone
+
+
+# Entries of the same event (same type, project, date and payload) pushed
+# to several timelines are merged into a single shared event.
+FILL_EVENTS_SQL = """
+    INSERT INTO timeline_timelineevent (event_type, project_id, data, data_content_type_id, created)
+         SELECT event_type, project_id, data::json, data_content_type_id, created
+           FROM (SELECT DISTINCT event_type, project_id, data::text AS data, data_content_type_id, created
+                   FROM timeline_timeline) AS entries;
+
+    UPDATE timeline_timeline
+       SET event_id = timeline_timelineevent.id
+      FROM timeline_timelineevent
+     WHERE timeline_timelineevent.event_type = timeline_timeline.event_type
+       AND timeline_timelineevent.project_id IS NOT DISTINCT FROM timeline_timeline.project_id
+       AND timeline_timelineevent.data_content_type_id = timeline_timeline.data_content_type_id
+       AND timeline_timelineevent.created = timeline_timeline.created
+       AND timeline_timelineevent.data::text = timeline_timeline.data::text;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0038_projecttotalsbucket'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('timeline', '0004_auto_20150603_1312'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, verbose_name='ID', primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=250, db_index=True)),
+                ('data', django_pgjson.fields.JsonField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data_content_type', models.ForeignKey(to='contenttypes.ContentType', related_name='data_timeline_events')),
+                ('project', models.ForeignKey(null=True, to='projects.Project')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='timeline',
+            name='event',
+            field=models.ForeignKey(null=True, to='timeline.TimelineEvent', related_name='entries'),
+            preserve_default=True,
+        ),
+        migrations.RunSQL(FILL_EVENTS_SQL),
+        migrations.RemoveField(
+            model_name='timeline',
+            name='data',
+        ),
+        migrations.AlterField(
+            model_name='timeline',
+            name='event',
+            field=models.ForeignKey(to='timeline.TimelineEvent', related_name='entries'),
+            preserve_default=True,
+        ),
+    ]
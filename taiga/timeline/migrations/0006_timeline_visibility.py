@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+# Same rules as taiga.timeline.service.get_timeline_visibility
+FILL_VISIBILITY_SQL = """
+    UPDATE timeline_timeline
+       SET visibility = 'public'
+     WHERE project_id IS NULL
+        OR project_id IN (SELECT id FROM projects_project WHERE NOT is_private);
+
+    WITH permissions(app_label, model, permission, anon_permission) AS (VALUES
+        ('projects', 'project', 'view_project', 'view_project'),
+        ('projects', 'membership', 'membership', 'view_project'),
+        ('milestones', 'milestone', 'view_milestones', 'view_milestones'),
+        ('userstories', 'userstory', 'view_us', 'view_us'),
+        ('tasks', 'task', 'view_tasks', 'view_tasks'),
+        ('issues', 'issue', 'view_issues', 'view_issues'),
+        ('wiki', 'wikipage', 'view_wiki_pages', 'view_wiki_pages'),
+        ('wiki', 'wikilink', 'view_wiki_links', 'view_wiki_links')
+    )
+    UPDATE timeline_timeline
+       SET visibility = CASE WHEN permissions.anon_permission = ANY(projects_project.anon_permissions)
+                             THEN 'public'
+                             ELSE projects_project.id || ':' || permissions.permission
+                        END
+      FROM projects_project, django_content_type, permissions
+     WHERE timeline_timeline.project_id = projects_project.id
+       AND projects_project.is_private
+       AND timeline_timeline.data_content_type_id = django_content_type.id
+       AND django_content_type.app_label = permissions.app_label
+       AND django_content_type.model = permissions.model;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0005_timelineevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeline',
+            name='visibility',
+            field=models.CharField(max_length=250, null=True, blank=True, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunSQL(FILL_VISIBILITY_SQL),
+    ]
@@ -26,20 +26,68 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 
 from taiga.projects.models import Project
 
+class TimelineEvent(models.Model):
+    """
+    The payload of a timeline event. It is stored once and referenced by
+    one `Timeline` entry for every timeline (namespace) that shows it.
+    """
+    event_type = models.CharField(max_length=250, db_index=True)
+    project = models.ForeignKey(Project, null=True)
+    data = JsonField()
+    data_content_type = models.ForeignKey(ContentType, related_name="data_timeline_events")
+    created = models.DateTimeField(default=timezone.now)
+
+
+_NO_DATA = object()
+
+
 class Timeline(models.Model):
     content_type = models.ForeignKey(ContentType, related_name="content_type_timelines")
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
     namespace = models.CharField(max_length=250, default="default", db_index=True)
+    event = models.ForeignKey(TimelineEvent, related_name="entries")
     event_type = models.CharField(max_length=250, db_index=True)
     project = models.ForeignKey(Project, null=True)
-    data = JsonField()
     data_content_type = models.ForeignKey(ContentType, related_name="data_timelines")
     created = models.DateTimeField(default=timezone.now)
+    # Who can see the entry, see `service.get_timeline_visibility`
+    visibility = models.CharField(max_length=250, null=True, blank=True, db_index=True)
 
     class Meta:
         index_together = [('content_type', 'object_id', 'namespace'), ]
 
+    @property
+    def data(self):
+        pending_data = self.__dict__.get("_pending_data", _NO_DATA)
+        if pending_data is not _NO_DATA:
+            return pending_data
+        return self.event.data
+
+    @data.setter
+    def data(self, value):
+        # Stored in the event on save (used by the importer)
+        self.__dict__["_pending_data"] = value
+
+    def save(self, *args, **kwargs):
+        pending_data = self.__dict__.pop("_pending_data", _NO_DATA)
+        if pending_data is not _NO_DATA:
+            if self.event_id is None:
+                from .service import get_timeline_visibility
+                self.visibility = get_timeline_visibility(self.project, self.data_content_type)
+                self.event = TimelineEvent.objects.create(
+                    event_type=self.event_type,
+                    project_id=self.project_id,
+                    data=pending_data,
+                    data_content_type_id=self.data_content_type_id,
+                    created=self.created,
+                )
+            else:
+                self.event.data = pending_data
+                self.event.save(update_fields=["data"])
+
+        super().save(*args, **kwargs)
+
 
 # Register all implementations
 from .timeline_implementations import *
@@ -31,6 +31,7 @@ class TimelineSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Timeline
+        exclude = ("event",)
 
     def get_data(self, obj):
         #Updates the data user info saved if the user exists
@@ -18,7 +18,6 @@
 from django.apps import apps
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import Model
-from django.db.models import Q
 from django.db.models.query import QuerySet
 
 from functools import partial, wraps
@@ -29,6 +28,26 @@ from taiga.users.services import get_photo_or_gravatar_url, get_big_photo_or_gra
 
 _timeline_impl_map = {}
 
+# Max number of timeline entries inserted per query
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Visibility of the timeline entries that anyone can see
+PUBLIC_VISIBILITY = "public"
+
+# Members always see the memberships entries of their projects
+MEMBERSHIP_VISIBILITY_PERMISSION = "membership"
+
+# Permission needed to see the timeline entries of private projects by content type
+_visibility_permissions = {
+    ("projects", "project"): "view_project",
+    ("milestones", "milestone"): "view_milestones",
+    ("userstories", "userstory"): "view_us",
+    ("tasks", "task"): "view_tasks",
+    ("issues", "issue"): "view_issues",
+    ("wiki", "wikipage"): "view_wiki_pages",
+    ("wiki", "wikilink"): "view_wiki_links",
+}
+
 
 def _get_impl_key_from_model(model:Model, event_type:str):
     if issubclass(model, Model):
@@ -51,10 +70,9 @@ def build_project_namespace(project:object):
     return "{0}:{1}".format("project", project.id)
 
 
-def _add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
-    assert isinstance(obj, Model), "obj must be a instance of Model"
+def _create_timeline_event(instance:object, event_type:str, created_datetime:object, extra_data:dict={}):
     assert isinstance(instance, Model), "instance must be a instance of Model"
-    from .models import Timeline
+    from .models import TimelineEvent
     event_type_key = _get_impl_key_from_model(instance.__class__, event_type)
     impl = _timeline_impl_map.get(event_type_key, None)
 
@@ -62,9 +80,7 @@ def _add_to_object_timeline(obj:object, instance:object, event_type:str, created
     if hasattr(instance, "project"):
         project = instance.project
 
-    Timeline.objects.create(
-        content_object=obj,
-        namespace=namespace,
+    return TimelineEvent.objects.create(
         event_type=event_type_key,
         project=project,
         data=impl(instance, extra_data=extra_data),
@@ -73,21 +89,93 @@ def _add_to_object_timeline(obj:object, instance:object, event_type:str, created
     )
 
 
-def _add_to_objects_timeline(objects, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
+def _build_timeline_entry(obj:object, event:object, namespace:str="default"):
+    from .models import Timeline
+    visibility = get_timeline_visibility(event.project, event.data_content_type)
+    return Timeline(
+        content_object=obj,
+        namespace=namespace,
+        event=event,
+        event_type=event.event_type,
+        project_id=event.project_id,
+        data_content_type_id=event.data_content_type_id,
+        created=event.created,
+        visibility=visibility,
+    )
+
+
+def _add_to_object_timeline(obj:object, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}, event=None):
+    assert isinstance(obj, Model), "obj must be a instance of Model"
+    assert isinstance(instance, Model), "instance must be a instance of Model"
+    if event is None:
+        event = _create_timeline_event(instance, event_type, created_datetime, extra_data)
+
+    _build_timeline_entry(obj, event, namespace).save()
+
+
+def _add_to_objects_timeline(objects, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}, event=None):
+    assert isinstance(instance, Model), "instance must be a instance of Model"
+    from .models import Timeline
+    objects = list(objects)
+    if not objects:
+        return
+
+    # The data payload is stored once and shared by all the entries
+    if event is None:
+        event = _create_timeline_event(instance, event_type, created_datetime, extra_data)
+
+    timeline_objects = []
     for obj in objects:
-        _add_to_object_timeline(obj, instance, event_type, created_datetime, namespace, extra_data)
+        assert isinstance(obj, Model), "obj must be a instance of Model"
+        timeline_objects.append(_build_timeline_entry(obj, event, namespace))
 
+    Timeline.objects.bulk_create(timeline_objects, batch_size=BULK_CREATE_BATCH_SIZE)
 
-@app.task
-def push_to_timeline(objects, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
+
+def _add_to_timeline(objects, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}, **kwargs):
     if isinstance(objects, Model):
-        _add_to_object_timeline(objects, instance, event_type, created_datetime, namespace, extra_data)
+        _add_to_object_timeline(objects, instance, event_type, created_datetime, namespace, extra_data, **kwargs)
     elif isinstance(objects, QuerySet) or isinstance(objects, list):
-        _add_to_objects_timeline(objects, instance, event_type, created_datetime, namespace, extra_data)
+        _add_to_objects_timeline(objects, instance, event_type, created_datetime, namespace, extra_data, **kwargs)
     else:
         raise Exception("Invalid objects parameter")
 
 
+@app.task
+def push_to_timeline(objects, instance:object, event_type:str, created_datetime:object, namespace:str="default", extra_data:dict={}):
+    _add_to_timeline(objects, instance, event_type, created_datetime, namespace, extra_data)
+
+
+@app.task
+def push_to_timelines(targets, instance:object, event_type:str, created_datetime:object, extra_data:dict={}):
+    """
+    Store one event for `instance` and reference it from every timeline in
+    `targets`, a list of `(objects, namespace)` pairs.
+    """
+    event = _create_timeline_event(instance, event_type, created_datetime, extra_data)
+    for objects, namespace in targets:
+        _add_to_timeline(objects, instance, event_type, created_datetime, namespace, extra_data, event=event)
+
+
+def delete_timeline_entries(entries, events=None):
+    """
+    Delete the timeline entries of a queryset and then the events left
+    without entries (only the ones of `events` if given) with a query each.
+
+    The ORM delete of the events would load all of them, with their data,
+    to collect the cascade of their entries.
+    """
+    from .models import TimelineEvent
+
+    entries._raw_delete(entries.db)
+
+    if events is None:
+        events = TimelineEvent.objects.all()
+    orphan_events = events.extra(where=["NOT EXISTS (SELECT 1 FROM timeline_timeline "
+                                        "WHERE timeline_timeline.event_id = timeline_timelineevent.id)"])
+    orphan_events._raw_delete(orphan_events.db)
+
+
 def get_timeline(obj, namespace=None):
     assert isinstance(obj, Model), "obj must be a instance of Model"
     from .models import Timeline
@@ -97,46 +185,69 @@ def get_timeline(obj, namespace=None):
     if namespace is not None:
         timeline = timeline.filter(namespace=namespace)
 
-    timeline = timeline.select_related("project")
+    timeline = timeline.select_related("project", "event")
     timeline = timeline.order_by("-created", "-id")
     return timeline
 
 
-def filter_timeline_for_user(timeline, user):
-    # Filtering entities from public projects or entities without project
-    tl_filter = Q(project__is_private=False) | Q(project=None)
-
-    # Filtering private project with some public parts
-    content_types = {
-        "view_project": ContentType.objects.get(app_label="projects", model="project"),
-        "view_milestones": ContentType.objects.get(app_label="milestones", model="milestone"),
-        "view_us": ContentType.objects.get(app_label="userstories", model="userstory"),
-        "view_tasks": ContentType.objects.get(app_label="tasks", model="task"),
-        "view_issues": ContentType.objects.get(app_label="issues", model="issue"),
-        "view_wiki_pages": ContentType.objects.get(app_label="wiki", model="wikipage"),
-        "view_wiki_links": ContentType.objects.get(app_label="wiki", model="wikilink"),
-    }
+def _get_visibility_permission(data_content_type):
+    natural_key = (data_content_type.app_label, data_content_type.model)
+    if natural_key == ("projects", "membership"):
+        return MEMBERSHIP_VISIBILITY_PERMISSION
+    return _visibility_permissions.get(natural_key, None)
+
 
-    for content_type_key, content_type in content_types.items():
-        tl_filter |= Q(project__is_private=True,
-                                            project__anon_permissions__contains=[content_type_key],
-                                            data_content_type=content_type)
+def build_visibility(project_id:int, permission:str):
+    return "{0}:{1}".format(project_id, permission)
+
+
+def get_timeline_visibility(project, data_content_type):
+    """
+    Get the visibility of the timeline entries of `project` about
+    objects of `data_content_type`: PUBLIC_VISIBILITY if anyone can see
+    them, "<project id>:<permission>" if only members with that
+    permission can, or None if nobody can.
+    """
+    if project is None or not project.is_private:
+        return PUBLIC_VISIBILITY
+
+    permission = _get_visibility_permission(data_content_type)
+    if permission is None:
+        return None
 
     # There is no specific permission for seeing new memberships
-    membership_content_type = ContentType.objects.get(app_label="projects", model="membership")
-    tl_filter |= Q(project__is_private=True,
-                   project__anon_permissions__contains=["view_project"],
-                   data_content_type=membership_content_type)
+    anon_permission = "view_project" if permission == MEMBERSHIP_VISIBILITY_PERMISSION else permission
+    if anon_permission in (project.anon_permissions or []):
+        return PUBLIC_VISIBILITY
+
+    return build_visibility(project.id, permission)
+
+
+def refresh_project_timeline_visibility(project):
+    from .models import Timeline
+    timeline = Timeline.objects.filter(project=project)
+    data_content_type_ids = timeline.order_by().values_list("data_content_type_id", flat=True).distinct()
+    for data_content_type_id in list(data_content_type_ids):
+        data_content_type = ContentType.objects.get_for_id(data_content_type_id)
+        visibility = get_timeline_visibility(project, data_content_type)
+        timeline.filter(data_content_type_id=data_content_type_id).update(visibility=visibility)
 
-    # Filtering private projects where user is member
+
+def get_visibilities_for_user(user):
+    visibilities = [PUBLIC_VISIBILITY]
+
+    # Private projects where user is member
     if not user.is_anonymous():
         for membership in user.cached_memberships:
-            data_content_types = list(filter(None, [content_types.get(a, None) for a in membership.role.permissions]))
-            data_content_types.append(membership_content_type)
-            tl_filter |= Q(project=membership.project, data_content_type__in=data_content_types)
+            permissions = [p for p in _visibility_permissions.values() if p in membership.role.permissions]
+            permissions.append(MEMBERSHIP_VISIBILITY_PERMISSION)
+            visibilities += [build_visibility(membership.project_id, p) for p in permissions]
 
-    timeline = timeline.filter(tl_filter)
-    return timeline
+    return visibilities
+
+
+def filter_timeline_for_user(timeline, user):
+    return timeline.filter(visibility__in=get_visibilities_for_user(user))
 
 
 def get_profile_timeline(user, accessing_user=None):
@@ -20,21 +20,23 @@ from django.utils import timezone
 from django.utils.translation import ugettext as _
 
 from taiga.projects.history import services as history_services
+from taiga.projects.choices import TOTALS_BUCKET_ACTIVITY
 from taiga.projects.models import Project
 from taiga.users.models import User
 from taiga.projects.history.choices import HistoryType
 from taiga.projects.notifications import services as notifications_services
-from taiga.timeline.service import (push_to_timeline,
+from taiga.timeline.service import (push_to_timelines,
                                     build_user_namespace,
                                     build_project_namespace,
-                                    extract_user_info)
+                                    extract_user_info,
+                                    refresh_project_timeline_visibility)
 
 
 def _push_to_timeline(*args, **kwargs):
     if settings.CELERY_ENABLED:
-        push_to_timeline.delay(*args, **kwargs)
+        push_to_timelines.delay(*args, **kwargs)
     else:
-        push_to_timeline(*args, **kwargs)
+        push_to_timelines(*args, **kwargs)
 
 
 def _push_to_timelines(project, user, obj, event_type, created_datetime, extra_data={}):
@@ -42,24 +44,20 @@ def _push_to_timelines(project, user, obj, event_type, created_datetime, extra_d
         # Actions related with a project
 
         ## Project timeline
-        _push_to_timeline(project, obj, event_type, created_datetime,
-            namespace=build_project_namespace(project),
-            extra_data=extra_data)
+        targets = [(project, build_project_namespace(project))]
 
-        project.refresh_totals()
+        project.increment_totals(TOTALS_BUCKET_ACTIVITY, created_datetime)
 
         if hasattr(obj, "get_related_people"):
             related_people = obj.get_related_people()
-
-            _push_to_timeline(related_people, obj, event_type, created_datetime,
-                namespace=build_user_namespace(user),
-                extra_data=extra_data)
+            targets.append((related_people, build_user_namespace(user)))
     else:
         # Actions not related with a project
         ## - Me
-        _push_to_timeline(user, obj, event_type, created_datetime,
-            namespace=build_user_namespace(user),
-            extra_data=extra_data)
+        targets = [(user, build_user_namespace(user))]
+
+    # A single event is stored and shared by all the timelines
+    _push_to_timeline(targets, obj, event_type, created_datetime, extra_data=extra_data)
 
 
 def _clean_description_fields(values_diff):
@@ -84,7 +82,10 @@ def on_new_history_entry(sender, instance, created, **kwargs):
     model = history_services.get_model_from_key(instance.key)
     pk = history_services.get_pk_from_key(instance.key)
     obj = model.objects.get(pk=pk)
-    project = obj.project
+    if "project" not in instance.__dict__:
+        # Not attached by the history services (e.g. rebuilding the timeline)
+        instance.project = obj.project
+    project = instance.project
 
     if instance.type == HistoryType.create:
         event_type = "create"
@@ -157,3 +158,31 @@ def create_user_push_to_timeline(sender, instance, created, **kwargs):
         project = None
         user = instance
         _push_to_timelines(project, user, user, "create", created_datetime=user.date_joined)
+
+
+def update_timeline_visibility_on_project_change(sender, instance, **kwargs):
+    """
+    Refresh the precomputed visibility of the project timeline entries
+    when the project becomes public/private or its anon permissions change.
+    Membership and role changes don't need it, the visibilities allowed
+    for an user are calculated from them in `get_visibilities_for_user`.
+
+    @param sender: Project model
+    @param instance: Project object
+    """
+    if not instance.pk:
+        return
+
+    if instance._loaded_visibility is not None:
+        is_private, anon_permissions = instance._loaded_visibility
+    else:
+        # Not loaded from the database (or with deferred fields)
+        try:
+            is_private, anon_permissions = sender.objects.values_list("is_private", "anon_permissions").get(pk=instance.pk)
+        except sender.DoesNotExist:
+            return
+
+    if is_private != instance.is_private or set(anon_permissions or []) != set(instance.anon_permissions or []):
+        refresh_project_timeline_visibility(instance)
+
+    instance._loaded_visibility = (instance.is_private, list(instance.anon_permissions or []))
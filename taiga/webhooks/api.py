@@ -66,6 +66,9 @@ class WebhookLogViewSet(ModelListViewSet):
         if webhook.project.blocked_code is not None:
             raise exc.Blocked(_("Blocked element"))
 
+        if tasks.is_truncated_request_data(webhooklog.request_data):
+            raise exc.BadRequest(_("The request data of this log was truncated and can't be resent"))
+
         webhooklog = tasks.resend_webhook(webhook.id, webhook.url, webhook.key,
                                           webhooklog.request_data)
 
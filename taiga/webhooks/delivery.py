@@ -0,0 +1,110 @@
+# Copyright (C) 2013 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout
+from requests.packages.urllib3.exceptions import MaxRetryError
+
+from django.conf import settings
+
+# Server errors worth retrying, the receiver is probably restarting
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_sessions_pid = None
+
+
+def get_session(url:str):
+    """
+    Get the session of the host of the url, its connections are kept
+    alive between deliveries.
+    """
+    global _sessions_pid
+
+    parsed_url = urlparse(url)
+    key = (parsed_url.scheme, parsed_url.netloc)
+    with _sessions_lock:
+        # The sockets of a parent process can't be shared after a fork
+        if _sessions_pid != os.getpid():
+            _sessions_pid = os.getpid()
+            _sessions.clear()
+
+        session = _sessions.get(key, None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.WEBHOOKS_MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+
+        return session
+
+
+def _is_connect_error(exc) -> bool:
+    # The request wasn't sent, requests wraps in a MaxRetryError the
+    # errors opening the connection
+    return isinstance(exc, ConnectTimeout) or (bool(exc.args) and isinstance(exc.args[0], MaxRetryError))
+
+
+def send_request(prepared_request):
+    """
+    Send a request with the configured timeouts, retrying the errors
+    opening the connection and the temporary server errors with
+    exponential backoff. The exception of the last attempt is raised.
+
+    Read timeouts and connections dropped once the request was sent are
+    not retried, the receiver could process the same POST twice.
+    """
+    session = get_session(prepared_request.url)
+    timeout = (settings.WEBHOOKS_CONNECT_TIMEOUT, settings.WEBHOOKS_READ_TIMEOUT)
+
+    attempt = 0
+    while True:
+        try:
+            response = session.send(prepared_request, timeout=timeout)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= settings.WEBHOOKS_MAX_RETRIES:
+                return response
+        except ConnectionError as e:
+            if not _is_connect_error(e) or attempt >= settings.WEBHOOKS_MAX_RETRIES:
+                raise
+
+        time.sleep(settings.WEBHOOKS_RETRY_BACKOFF * 2 ** attempt)
+        attempt += 1
+
+
+def run_concurrently(funcs:list) -> list:
+    """
+    Run the deliveries to several webhooks at the same time so a slow
+    receiver doesn't delay the others. The functions only send the
+    requests, they must not use the database.
+    """
+    if len(funcs) <= 1:
+        return [func() for func in funcs]
+
+    max_workers = min(len(funcs), settings.WEBHOOKS_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(func) for func in funcs]
+        return [future.result() for future in futures]
@@ -165,8 +165,8 @@ class MilestoneSerializer(serializers.ModelSerializer):
 
 
 class HistoryEntrySerializer(serializers.ModelSerializer):
-    diff = HistoryDiffField()
-    snapshot = JsonField()
+    diff = HistoryDiffField(source="rendered_diff")
+    snapshot = JsonField(source="rendered_snapshot")
     values = JsonField()
     user = JsonField()
     delete_comment_user = JsonField()
@@ -53,20 +53,21 @@ def on_new_history_entry(sender, instance, created, **kwargs):
 
     webhooks = _get_project_webhooks(obj.project)
 
+    if not webhooks:
+        return None
+
+    # The payload is serialized once for all the webhooks, when the history
+    # entry is created (the object could change or be deleted before the
+    # task runs)
     if instance.type == HistoryType.create:
-        task = tasks.create_webhook
-        extra_args = []
-    elif instance.type == HistoryType.change:
-        task = tasks.change_webhook
-        extra_args = [instance]
+        data = tasks.make_create_data(obj)
     elif instance.type == HistoryType.delete:
-        task = tasks.delete_webhook
-        extra_args = [timezone.now()]
-
-    for webhook in webhooks:
-        args = [webhook["id"], webhook["url"], webhook["key"], obj] + extra_args
+        data = tasks.make_delete_data(obj, timezone.now())
+    else:
+        data = tasks.make_change_data(obj, instance)
+    serialized_data = tasks.render_data(data)
 
-        if settings.CELERY_ENABLED:
-            connection.on_commit(lambda: task.delay(*args))
-        else:
-            connection.on_commit(lambda: task(*args))
+    if settings.CELERY_ENABLED:
+        connection.on_commit(lambda: tasks.send_webhooks.delay(webhooks, serialized_data))
+    else:
+        connection.on_commit(lambda: tasks.send_webhooks(webhooks, serialized_data))
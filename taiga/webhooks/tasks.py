@@ -17,10 +17,17 @@
 
 import hmac
 import hashlib
+import functools
+import threading
+from collections import Counter
 import requests
 from requests.exceptions import RequestException
 
+from django.conf import settings
+from django.db import connection
+
 from taiga.base.api.renderers import UnicodeJSONRenderer
+from taiga.base.utils import json
 from taiga.base.utils.db import get_typename_for_model_instance
 from taiga.celery import app
 
@@ -28,6 +35,7 @@ from .serializers import (UserStorySerializer, IssueSerializer, TaskSerializer,
                           WikiPageSerializer, MilestoneSerializer,
                           HistoryEntrySerializer)
 from .models import WebhookLog
+from . import delivery
 
 
 def _serialize(obj):
@@ -57,70 +65,195 @@ def _generate_signature(data, key):
     return mac.hexdigest()
 
 
-def _send_request(webhook_id, url, key, data):
-    serialized_data = UnicodeJSONRenderer().render(data)
-    signature = _generate_signature(serialized_data, key)
+def _make_request(url, key, data, serialized_data=None, signature=None):
+    if serialized_data is None:
+        serialized_data = UnicodeJSONRenderer().render(data)
+    if signature is None:
+        signature = _generate_signature(serialized_data, key)
     headers = {
         "X-TAIGA-WEBHOOK-SIGNATURE": signature,
         "Content-Type": "application/json"
     }
     request = requests.Request('POST', url, data=serialized_data, headers=headers)
-    prepared_request = request.prepare()
+    return request.prepare()
+
 
-    session = requests.Session()
+def _deliver_request(webhook_id, url, data, prepared_request):
+    """
+    Send the request and return its log, not saved yet so it can be
+    called from the delivery threads.
+    """
+    data = _truncate_request_data(data, prepared_request.body)
     try:
-        response = session.send(prepared_request)
-        webhook_log = WebhookLog.objects.create(webhook_id=webhook_id, url=url,
-                                                status=response.status_code,
-                                                request_data=data,
-                                                request_headers=dict(prepared_request.headers),
-                                                response_data=response.content,
-                                                response_headers=dict(response.headers),
-                                                duration=response.elapsed.total_seconds())
+        response = delivery.send_request(prepared_request)
+        return WebhookLog(webhook_id=webhook_id, url=url,
+                          status=response.status_code,
+                          request_data=data,
+                          request_headers=dict(prepared_request.headers),
+                          response_data=_truncate_response_data(response.content),
+                          response_headers=dict(response.headers),
+                          duration=response.elapsed.total_seconds())
     except RequestException as e:
-        webhook_log = WebhookLog.objects.create(webhook_id=webhook_id, url=url, status=0,
-                                                request_data=data,
-                                                request_headers=dict(prepared_request.headers),
-                                                response_data="error-in-request: {}".format(str(e)),
-                                                response_headers={},
-                                                duration=0)
-    session.close()
-
-    ids = [log.id for log in WebhookLog.objects.filter(webhook_id=webhook_id).order_by("-id")[10:]]
-    WebhookLog.objects.filter(id__in=ids).delete()
+        return WebhookLog(webhook_id=webhook_id, url=url, status=0,
+                          request_data=data,
+                          request_headers=dict(prepared_request.headers),
+                          response_data="error-in-request: {}".format(str(e)),
+                          response_headers={},
+                          duration=0)
+
+
+def _send_request(webhook_id, url, key, data, serialized_data=None, signature=None):
+    prepared_request = _make_request(url, key, data, serialized_data, signature)
+    webhook_log = _deliver_request(webhook_id, url, data, prepared_request)
+    webhook_log.save()
+
+    _prune_webhook_logs_after_delivery(webhook_id)
     return webhook_log
 
 
+def _truncate_response_data(content:bytes) -> str:
+    response_data = content.decode("utf-8", errors="replace")
+    max_size = settings.WEBHOOKS_LOG_MAX_RESPONSE_SIZE
+    if max_size is not None and len(response_data) > max_size:
+        response_data = "{}... (truncated, {} characters)".format(response_data[:max_size], len(response_data))
+    return response_data
+
+
+# Key of the request data of a log truncated by _truncate_request_data
+TRUNCATED_REQUEST_DATA_KEY = "truncated"
+
+
+def _truncate_request_data(data, serialized_data:bytes):
+    """
+    Get the request data stored in a log. Large payloads are replaced by
+    their action, type, size and first WEBHOOKS_LOG_MAX_REQUEST_SIZE
+    characters (logs with truncated request data can't be resent).
+    """
+    max_size = settings.WEBHOOKS_LOG_MAX_REQUEST_SIZE
+    if max_size is None or len(serialized_data) <= max_size:
+        return data
+
+    request_data = serialized_data.decode("utf-8", errors="replace")
+    return {
+        "action": data.get("action", None),
+        "type": data.get("type", None),
+        TRUNCATED_REQUEST_DATA_KEY: "{}... (truncated, {} characters)".format(request_data[:max_size],
+                                                                              len(request_data)),
+    }
+
+
+def is_truncated_request_data(data) -> bool:
+    return isinstance(data, dict) and TRUNCATED_REQUEST_DATA_KEY in data
+
+
+PRUNE_WEBHOOK_LOGS_SQL = """
+    DELETE FROM webhooks_webhooklog
+     WHERE id IN (SELECT id
+                    FROM (SELECT id, row_number() OVER (PARTITION BY webhook_id ORDER BY id DESC) AS position
+                            FROM webhooks_webhooklog
+                           {where}) AS logs
+                   WHERE logs.position > %s)
+"""
+
+
+def _prune_webhook_logs(webhook_id=None):
+    """
+    Keep only the last WEBHOOKS_LOG_MAX_ENTRIES logs of every webhook
+    (or only of one) with a single query.
+    """
+    params = []
+    where = ""
+    if webhook_id is not None:
+        where = "WHERE webhook_id = %s"
+        params.append(webhook_id)
+    params.append(settings.WEBHOOKS_LOG_MAX_ENTRIES)
+
+    with connection.cursor() as cursor:
+        cursor.execute(PRUNE_WEBHOOK_LOGS_SQL.format(where=where), params)
+        return cursor.rowcount
+
+
 @app.task
-def change_webhook(webhook_id, url, key, obj, change):
+def prune_webhook_logs():
+    return _prune_webhook_logs()
+
+
+# Deliveries of each webhook since its logs were pruned (in this process)
+_deliveries_since_prune = Counter()
+_deliveries_since_prune_lock = threading.Lock()
+
+
+def _prune_webhook_logs_after_delivery(webhook_id):
+    """
+    Prune the logs of a webhook only every WEBHOOKS_LOG_PRUNE_EVERY
+    deliveries of it, with or without celery (with celery they are
+    pruned periodically by prune_webhook_logs too).
+    """
+    with _deliveries_since_prune_lock:
+        _deliveries_since_prune[webhook_id] += 1
+        if _deliveries_since_prune[webhook_id] < settings.WEBHOOKS_LOG_PRUNE_EVERY:
+            return
+        del _deliveries_since_prune[webhook_id]
+
+    _prune_webhook_logs(webhook_id=webhook_id)
+
+
+def make_change_data(obj, change):
     data = {}
     data['data'] = _serialize(obj)
     data['action'] = "change"
     data['type'] = _get_type(obj)
     data['change'] = _serialize(change)
+    return data
 
-    return _send_request(webhook_id, url, key, data)
 
-
-@app.task
-def create_webhook(webhook_id, url, key, obj):
+def make_create_data(obj):
     data = {}
     data['data'] = _serialize(obj)
     data['action'] = "create"
     data['type'] = _get_type(obj)
-
-    return _send_request(webhook_id, url, key, data)
+    return data
 
 
-@app.task
-def delete_webhook(webhook_id, url, key, obj, deleted_date):
+def make_delete_data(obj, deleted_date):
     data = {}
     data['data'] = _serialize(obj)
     data['action'] = "delete"
     data['type'] = _get_type(obj)
     data['deleted_date'] = deleted_date
+    return data
 
-    return _send_request(webhook_id, url, key, data)
+
+def render_data(data) -> bytes:
+    return UnicodeJSONRenderer().render(data)
+
+
+@app.task
+def send_webhooks(webhooks, serialized_data:bytes):
+    """
+    Send the payload of a history entry, already serialized once, to
+    several webhooks at the same time. Only the signature is calculated
+    for each webhook key.
+    """
+    data = json.loads(serialized_data)
+    signatures = {}
+    for webhook in webhooks:
+        if webhook["key"] not in signatures:
+            signatures[webhook["key"]] = _generate_signature(serialized_data, webhook["key"])
+
+    # Only the requests are sent from the delivery threads, the logs are
+    # saved here with a single query
+    webhook_logs = delivery.run_concurrently([
+        functools.partial(_deliver_request, webhook["id"], webhook["url"], data,
+                          _make_request(webhook["url"], webhook["key"], data, serialized_data,
+                                        signatures[webhook["key"]]))
+        for webhook in webhooks
+    ])
+    WebhookLog.objects.bulk_create(webhook_logs)
+
+    for webhook_id in {webhook["id"] for webhook in webhooks}:
+        _prune_webhook_logs_after_delivery(webhook_id)
+    return webhook_logs
 
 
 @app.task
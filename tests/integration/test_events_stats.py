@@ -0,0 +1,25 @@
+from django.core.urlresolvers import reverse
+
+from tests import factories as f
+
+import pytest
+pytestmark = pytest.mark.django_db
+
+
+def test_events_stats(client):
+    url = reverse("events-stats-list")
+    user = f.UserFactory.create()
+    superuser = f.UserFactory.create(is_superuser=True)
+
+    response = client.json.get(url)
+    assert response.status_code == 401
+
+    client.login(user)
+    response = client.json.get(url)
+    assert response.status_code == 403
+
+    client.login(superuser)
+    response = client.json.get(url)
+    assert response.status_code == 200
+    assert set(response.data["sender"].keys()) == {"pid", "queue_depth", "queue_size",
+                                                   "sent", "dropped", "failed"}
@@ -19,14 +19,19 @@
 import pytest
 from unittest.mock import patch
 
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from .. import factories as f
 
 from taiga.base.utils import json
 from taiga.projects.history import services
-from taiga.projects.history.models import HistoryEntry
+from taiga.projects.history import tasks
+from taiga.projects.history.models import HistoryEntry, HistorySnapshot, PendingSnapshot
 from taiga.projects.history.choices import HistoryType
 from taiga.projects.history.services import make_key_from_model_object
+from taiga.projects.tasks.models import Task
 
 pytestmark = pytest.mark.django_db
 
@@ -235,3 +240,286 @@ def test_delete_comment_by_project_owner(client):
     url = "%s?id=%s" % (url, history_entry.id)
     response = client.post(url, content_type="application/json")
     assert 200 == response.status_code, response.status_code
+
+
+def test_take_snapshot_keeps_materialized_snapshot(settings):
+    settings.MAX_PARTIAL_DIFFS = 2
+
+    issue = f.IssueFactory.create()
+    key = make_key_from_model_object(issue)
+
+    for counter in range(4):
+        issue.description = "desc{}".format(counter)
+        issue.save()
+        services.take_snapshot(issue, user=issue.owner)
+
+        current = HistorySnapshot.objects.get(key=key)
+        fobj, partials = services.rebuild_snapshot_for_key(key)
+        assert current.snapshot == fobj.snapshot
+        assert current.partials == partials
+
+    assert HistorySnapshot.objects.get(key=key).snapshot["description"] == "desc3"
+
+
+def test_rebuild_history_snapshots_command():
+    issue = f.IssueFactory.create()
+    key = make_key_from_model_object(issue)
+
+    services.take_snapshot(issue, user=issue.owner)
+    issue.subject = "Changed subject"
+    issue.save()
+    services.take_snapshot(issue, user=issue.owner)
+
+    HistorySnapshot.objects.all().delete()
+    call_command("rebuild_history_snapshots")
+
+    current = HistorySnapshot.objects.get(key=key)
+    assert current.snapshot["subject"] == "Changed subject"
+    assert current.partials == 1
+
+
+def test_freeze_many():
+    user_story1 = f.UserStoryFactory.create()
+    user_story2 = f.UserStoryFactory.create()
+    issue = f.IssueFactory.create()
+    removed_issue = f.IssueFactory.create()
+    removed_issue.delete()
+
+    fobjs = services.freeze_many([user_story1, issue, removed_issue, user_story2])
+
+    assert len(fobjs) == 4
+    assert fobjs[0].key == make_key_from_model_object(user_story1)
+    assert fobjs[0].snapshot == services.freeze_model_instance(user_story1).snapshot
+    assert fobjs[1].key == make_key_from_model_object(issue)
+    assert fobjs[2] is None
+    assert fobjs[3].key == make_key_from_model_object(user_story2)
+
+
+def test_take_snapshots_in_bulk():
+    task1 = f.TaskFactory.create()
+    task2 = f.TaskFactory.create(project=task1.project)
+
+    qs_all = HistoryEntry.objects.all()
+    qs_created = qs_all.filter(type=HistoryType.create)
+
+    entries = services.take_snapshots_in_bulk([task1, task2], user=task1.owner)
+
+    assert len(entries) == 2
+    assert qs_all.count() == 2
+    assert qs_created.count() == 2
+
+
+def test_freeze_many_of_loaded_instances():
+    task1 = f.TaskFactory.create()
+    task2 = f.TaskFactory.create(project=task1.project)
+    objs = list(services.with_freeze_related(Task.objects.filter(id__in=[task1.id, task2.id])
+                                                         .order_by("id")))
+
+    with CaptureQueriesContext(connection) as fetch_context:
+        fobjs = services.freeze_many(objs)
+    with CaptureQueriesContext(connection) as context:
+        loaded_fobjs = services.freeze_many(objs, fetch=False)
+
+    assert [fobj.snapshot for fobj in loaded_fobjs] == [fobj.snapshot for fobj in fobjs]
+    assert len(context.captured_queries) < len(fetch_context.captured_queries)
+
+
+def test_html_fields_are_rendered_on_read():
+    issue = f.IssueFactory.create(description="**desc**")
+
+    services.take_snapshot(issue, user=issue.owner)
+    issue.description = "**new desc**"
+    issue.save()
+    entry = services.take_snapshot(issue, user=issue.owner)
+
+    assert "description_html" not in entry.diff
+    assert entry.rendered_diff["description_html"] == [
+        "<p><strong>desc</strong></p>",
+        "<p><strong>new desc</strong></p>",
+    ]
+
+    create_entry = HistoryEntry.objects.get(key=entry.key, type=HistoryType.create)
+    assert "description_html" not in create_entry.snapshot
+    assert create_entry.rendered_snapshot["description_html"] == "<p><strong>desc</strong></p>"
+
+
+def test_hidden_changes_do_not_diff_html_fields_of_old_snapshots():
+    task = f.TaskFactory.create()
+
+    services.take_snapshot(task, user=task.owner)
+    entry = HistoryEntry.objects.get(key=make_key_from_model_object(task))
+    entry.snapshot["description_html"] = "<p>old html</p>"
+    entry.save()
+    HistorySnapshot.objects.all().delete()
+
+    task.us_order = 3
+    task.save()
+    entry = services.take_snapshot(task, user=task.owner)
+
+    assert list(entry.diff.keys()) == ["us_order"]
+    assert entry.is_hidden
+
+
+def test_make_diff_values_in_bulk():
+    project = f.ProjectFactory.create()
+    statuses = f.UserStoryStatusFactory.create_batch(3, project=project)
+    users = f.UserFactory.create_batch(2)
+
+    fdiffs = [
+        services.FrozenDiff("userstories.userstory:1", {"status": [statuses[0].id, statuses[1].id],
+                                                          "assigned_to": [None, users[0].id]}, {}),
+        services.FrozenDiff("userstories.userstory:2", {"status": [statuses[1].id, statuses[2].id],
+                                                          "assigned_to": [users[0].id, users[1].id]}, {}),
+    ]
+
+    values = services.make_diff_values_in_bulk(fdiffs)
+
+    assert values == [services.make_diff_values("userstories.userstory", fdiff) for fdiff in fdiffs]
+    assert values[1]["status"] == {str(statuses[1].id): statuses[1].name,
+                                   str(statuses[2].id): statuses[2].name}
+    assert values[1]["users"] == {str(users[0].id): users[0].get_full_name(),
+                                  str(users[1].id): users[1].get_full_name()}
+
+
+def test_make_diff_values_caches_the_project_attributes():
+    project = f.ProjectFactory.create()
+    statuses = f.UserStoryStatusFactory.create_batch(2, project=project)
+    fdiff = services.FrozenDiff("userstories.userstory:1", {"status": [statuses[0].id, statuses[1].id]}, {})
+
+    services.make_diff_values("userstories.userstory", fdiff, project_id=project.id)
+    with CaptureQueriesContext(connection) as captured:
+        values = services.make_diff_values("userstories.userstory", fdiff, project_id=project.id)
+    assert len(captured) == 0
+    assert values["status"] == {str(statuses[0].id): statuses[0].name,
+                                str(statuses[1].id): statuses[1].name}
+
+    # The cache of the project is cleared on changes
+    statuses[1].name = "Renamed"
+    statuses[1].save()
+    values = services.make_diff_values("userstories.userstory", fdiff, project_id=project.id)
+    assert values["status"][str(statuses[1].id)] == "Renamed"
+
+
+def test_make_diff_values_expires_the_project_attributes(settings):
+    settings.PROCESS_LOCAL_CACHE_TIMEOUT = 0
+    project = f.ProjectFactory.create()
+    status = f.UserStoryStatusFactory.create(project=project)
+    fdiff = services.FrozenDiff("userstories.userstory:1", {"status": [None, status.id]}, {})
+
+    services.make_diff_values("userstories.userstory", fdiff, project_id=project.id)
+
+    # Renamed without signals, like from other process with a process local cache
+    status.__class__.objects.filter(id=status.id).update(name="Renamed")
+    values = services.make_diff_values("userstories.userstory", fdiff, project_id=project.id)
+    assert values["status"][str(status.id)] == "Renamed"
+
+
+def test_request_snapshot_in_background(settings):
+    settings.HISTORY_ASYNC_SNAPSHOTS = True
+
+    issue = f.IssueFactory.create()
+    other_user = f.UserFactory.create()
+    key = make_key_from_model_object(issue)
+    original_subject = issue.subject
+
+    assert services.request_snapshot(issue, user=issue.owner) is None
+    issue.subject = "Changed subject"
+    issue.save()
+    assert services.request_snapshot(issue, user=issue.owner) is None
+    issue.description = "Changed description"
+    issue.save()
+    assert services.request_snapshot(issue, user=other_user, comment="test") is None
+
+    assert HistoryEntry.objects.count() == 0
+    assert PendingSnapshot.objects.filter(key=key).count() == 3
+
+    tasks.process_pending_snapshots(key)
+
+    # Every entry has the changes of its own request
+    assert PendingSnapshot.objects.count() == 0
+    entries = list(HistoryEntry.objects.filter(key=key).order_by("created_at"))
+    assert len(entries) == 3
+    assert entries[0].type == HistoryType.create
+    assert entries[0].snapshot["subject"] == original_subject
+    assert entries[0].user["pk"] == issue.owner.id
+    assert entries[1].type == HistoryType.change
+    assert entries[1].diff == {"subject": [original_subject, "Changed subject"]}
+    assert entries[1].user["pk"] == issue.owner.id
+    assert list(entries[2].diff.keys()) == ["description"]
+    assert entries[2].user["pk"] == other_user.id
+    assert entries[2].comment == "test"
+
+
+def test_take_snapshot_processes_the_pending_snapshots_first(settings):
+    settings.HISTORY_ASYNC_SNAPSHOTS = True
+
+    issue = f.IssueFactory.create(subject="First subject")
+    key = make_key_from_model_object(issue)
+    services.request_snapshot(issue, user=issue.owner)
+
+    issue.subject = "Second subject"
+    issue.save()
+    services.take_snapshot(issue, user=issue.owner)
+
+    assert PendingSnapshot.objects.count() == 0
+    entries = list(HistoryEntry.objects.filter(key=key).order_by("created_at"))
+    assert [entry.type for entry in entries] == [HistoryType.create, HistoryType.change]
+    assert entries[0].snapshot["subject"] == "First subject"
+    assert entries[1].diff == {"subject": ["First subject", "Second subject"]}
+
+
+def test_process_leftover_pending_snapshots(settings):
+    settings.HISTORY_ASYNC_SNAPSHOTS = True
+
+    issue = f.IssueFactory.create()
+    key = make_key_from_model_object(issue)
+    services.request_snapshot(issue, user=issue.owner)
+
+    assert tasks.process_leftover_pending_snapshots() == 0
+    assert PendingSnapshot.objects.count() == 1
+
+    assert tasks.process_leftover_pending_snapshots(older_than=-60) == 1
+    assert PendingSnapshot.objects.count() == 0
+    assert HistoryEntry.objects.filter(key=key).count() == 1
+
+
+def test_history_entries_stored_with_zlib_codec(settings):
+    settings.HISTORY_STORAGE_CODEC = "taiga.projects.history.codecs.ZlibJsonCodec"
+
+    issue = f.IssueFactory.create(subject="Compressed subject")
+    entry = services.take_snapshot(issue, user=issue.owner)
+
+    stored = HistoryEntry.objects.filter(id=entry.id).extra(select={"raw": "snapshot::text"}).values("raw")[0]
+    assert "Compressed subject" not in stored["raw"]
+
+    entry = HistoryEntry.objects.get(id=entry.id)
+    assert entry.snapshot["subject"] == "Compressed subject"
+
+
+def test_attach_projects_to_history_entries():
+    issue = f.IssueFactory.create()
+    task = f.TaskFactory.create()
+    services.take_snapshot(issue, user=issue.owner)
+    services.take_snapshot(task, user=task.owner)
+    services.take_snapshot(task.project, user=task.owner)
+
+    entries = list(HistoryEntry.objects.order_by("created_at"))
+    entries.append(HistoryEntry(key=None))
+
+    # A query per model plus one for the projects
+    with CaptureQueriesContext(connection) as context:
+        services.attach_projects_to_history_entries(entries)
+        projects = [entry.project for entry in entries]
+
+    assert len(context.captured_queries) == 4
+
+    assert projects == [issue.project, task.project, task.project, None]
+
+
+def test_new_history_entries_have_the_project_attached():
+    issue = f.IssueFactory.create()
+    entry = services.take_snapshot(issue, user=issue.owner)
+
+    with CaptureQueriesContext(connection) as context:
+        assert entry.project == issue.project
+    assert len(context.captured_queries) == 0
@@ -17,10 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import pytest
+import datetime
 
 from django.core.urlresolvers import reverse
 
 from taiga.base.utils import json
+from taiga.projects.milestones.services import get_milestone_stats
 from taiga.projects.userstories.serializers import UserStorySerializer
 
 from .. import factories as f
@@ -81,3 +83,67 @@ def test_list_milestones_taiga_info_headers(client):
     assert response2.has_header("Taiga-Info-Total-Opened-Milestones") == True
     assert response2["taiga-info-total-closed-milestones"] == "3"
     assert response2["taiga-info-total-opened-milestones"] == "1"
+
+
+def test_milestone_stats_burndown(client):
+    user = f.UserFactory.create()
+    project = f.ProjectFactory.create(owner=user)
+    role = f.RoleFactory.create(project=project, computable=True)
+    f.MembershipFactory.create(project=project, user=user, role=role, is_owner=True)
+    start = datetime.date(2016, 1, 4)
+    sprint = f.MilestoneFactory.create(project=project, owner=user,
+                                       estimated_start=start,
+                                       estimated_finish=start + datetime.timedelta(days=4))
+    points = f.PointsFactory.create(project=project, value=6)
+
+    us1 = f.UserStoryFactory.create(project=project, owner=user, milestone=sprint)
+    us2 = f.UserStoryFactory.create(project=project, owner=user, milestone=sprint, is_closed=True)
+    for us in [us1, us2]:
+        us.role_points.all().delete()
+        f.RolePointsFactory.create(user_story=us, role=role, points=points)
+
+    closed_status = f.TaskStatusFactory.create(project=project, is_closed=True)
+    finished = datetime.datetime(2016, 1, 5, 10, 0, tzinfo=datetime.timezone.utc)
+    f.TaskFactory.create(project=project, milestone=sprint, user_story=us1, status=closed_status,
+                         finished_date=finished)
+    f.TaskFactory.create(project=project, milestone=sprint, user_story=us1, is_iocaine=True)
+    f.TaskFactory.create(project=project, milestone=sprint, user_story=us2, status=closed_status,
+                         finished_date=finished - datetime.timedelta(days=10))
+
+    stats = get_milestone_stats(sprint)
+
+    assert stats["total_points"] == {role.id: 12}
+    assert stats["completed_points"] == [6]
+    assert stats["total_userstories"] == 2
+    assert stats["completed_userstories"] == 1
+    assert stats["total_tasks"] == 3
+    assert stats["completed_tasks"] == 2
+    assert stats["iocaine_doses"] == 1
+    assert [day["open_points"] for day in stats["days"]] == [6, 3, 3, 3, 3]
+    assert [day["optimal_points"] for day in stats["days"]] == [12, 9, 6, 3, 0]
+    for day in stats["days"]:
+        assert day["open_points"] == 12 - sprint.total_closed_points_by_date(day["day"])
+
+    # A new finished task invalidates the cached stats
+    f.TaskFactory.create(project=project, milestone=sprint, user_story=us2, status=closed_status,
+                         finished_date=finished + datetime.timedelta(days=1))
+    stats = get_milestone_stats(sprint)
+    assert [day["open_points"] for day in stats["days"]] == [9, 6, 3, 3, 3]
+
+    # The key includes the last finished task, so the stats are refreshed
+    # even without the signals (e.g. if the change is made by other process)
+    sprint.tasks.filter(finished_date=finished).update(finished_date=finished + datetime.timedelta(days=2))
+    stats = get_milestone_stats(sprint)
+    assert [day["open_points"] for day in stats["days"]] == [9, 9, 6, 3, 3]
+
+    # And so does a change of the value of the points
+    points.value = 3
+    points.save()
+    stats = get_milestone_stats(sprint)
+    assert stats["total_points"] == {role.id: 6}
+
+    url = reverse("milestones-stats", args=[sprint.pk])
+    client.login(user)
+    response = client.json.get(url)
+    assert response.status_code == 200
+    assert response.data["total_tasks"] == 4
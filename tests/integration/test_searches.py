@@ -23,6 +23,7 @@ from django.core.urlresolvers import reverse
 from .. import factories as f
 
 from taiga.permissions.permissions import MEMBERS_PERMISSIONS
+from taiga.searches import services
 from tests.utils import disconnect_signals, reconnect_signals
 
 
@@ -140,3 +141,97 @@ def test_search_text_query_with_an_invalid_project_id(client, searches_initial_d
 
     response = client.get(reverse("search-list"), {"project": "new", "text": "future"})
     assert response.status_code == 404
+
+
+def test_search_text_query_results_are_ranked(client, searches_initial_data):
+    data = searches_initial_data
+    in_description = f.IssueFactory.create(project=data.project1, subject="Login form",
+                                           description="The timeout is too short")
+    in_subject = f.IssueFactory.create(project=data.project1, subject="Timeout in the login form")
+
+    client.login(data.member1.user)
+
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "timeout"})
+    assert response.status_code == 200
+    # The matches in the subject weigh more than the ones in the description
+    assert [issue["id"] for issue in response.data["issues"]] == [in_subject.id, in_description.id]
+
+    # The vector is updated with the object
+    in_description.subject = "Timeout in the login form"
+    in_description.description = ""
+    in_description.save()
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "short"})
+    assert len(response.data["issues"]) == 0
+
+
+def test_search_all_types_in_one_query(searches_initial_data):
+    data = searches_initial_data
+
+    results = services.search(data.project1, "future", ["userstories", "tasks", "issues", "wikipages"])
+    assert list(results.keys()) == ["userstories", "tasks", "issues", "wikipages"]
+    assert results["userstories"] == [data.us2]
+    assert results["tasks"] == [data.tsk3]
+    assert results["issues"] == []
+    assert results["wikipages"] == [data.wiki2]
+
+    # Only the requested types are searched
+    results = services.search(data.project1, "", ["issues"])
+    assert list(results.keys()) == ["issues"]
+    assert set(results["issues"]) == {data.iss1, data.iss3}
+
+
+def test_search_without_text_keeps_the_models_ordering():
+    project = f.ProjectFactory.create()
+    wiki_page_b = f.WikiPageFactory.create(project=project, slug="b-page")
+    wiki_page_a = f.WikiPageFactory.create(project=project, slug="a-page")
+
+    results = services.search(project, "", ["wikipages"])
+    assert results["wikipages"] == [wiki_page_a, wiki_page_b]
+
+
+def test_search_typeahead_mode(client, searches_initial_data):
+    data = searches_initial_data
+    f.IssueFactory.create(project=data.project1, subject="Frontpage layout")
+
+    client.login(data.member1.user)
+
+    # Partial words match
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "fron",
+                                                   "mode": "typeahead"})
+    assert response.status_code == 200
+    assert len(response.data["issues"]) == 2
+    # The subject starting with the text first
+    assert response.data["issues"][0]["subject"] == "Frontpage layout"
+    assert len(response.data["userstories"]) == 0
+
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "fron",
+                                                   "mode": "typeahead", "limit": 1})
+    assert len(response.data["issues"]) == 1
+
+    # Refs match by prefix
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": str(data.tsk3.ref),
+                                                   "mode": "typeahead"})
+    assert data.tsk3.id in [task["id"] for task in response.data["tasks"]]
+
+    # The like wildcards are escaped
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "%",
+                                                   "mode": "typeahead"})
+    assert response.data["count"] == 0
+
+    # Wiki pages are matched by the slug
+    wiki_page = f.WikiPageFactory.create(project=data.project1, slug="release-notes")
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "text": "Release no",
+                                                   "mode": "typeahead"})
+    assert [page["id"] for page in response.data["wikipages"]] == [wiki_page.id]
+
+
+def test_search_invalid_mode_and_limit(client, searches_initial_data):
+    data = searches_initial_data
+
+    client.login(data.member1.user)
+
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "mode": "unknown"})
+    assert response.status_code == 400
+
+    response = client.get(reverse("search-list"), {"project": data.project1.id, "limit": "none"})
+    assert response.status_code == 400
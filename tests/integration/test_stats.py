@@ -3,7 +3,17 @@ import pytest
 from .. import factories as f
 from tests.utils import disconnect_signals, reconnect_signals
 
-from taiga.projects.services.stats import get_stats_for_project
+from taiga.projects.services.stats import (get_stats_for_project, get_stats_for_project_issues,
+                                           get_cached_stats_for_project, invalidate_stats_for_project,
+                                           _MilestoneIntervalIndex)
+from taiga.projects.userstories.models import UserStory, RolePoints
+from taiga.projects.apps import connect_project_stats_signals, disconnect_project_stats_signals
+
+from django.utils import timezone
+from django.utils import translation
+
+import datetime
+import time
 
 
 pytestmark = pytest.mark.django_db
@@ -155,3 +165,146 @@ def test_project_assigned_points(client, data):
     data.user_story4.save()
     project_stats = get_stats_for_project(data.project)
     assert project_stats["assigned_points_per_role"] == {data.role1.pk: 62, data.role2.pk: 1}
+
+
+def test_project_issues_stats(client, data):
+    now = timezone.now()
+    open_status = f.IssueStatusFactory(project=data.project, is_closed=False)
+    closed_status = f.IssueStatusFactory(project=data.project, is_closed=True)
+    severity = f.SeverityFactory(project=data.project)
+    priority = f.PriorityFactory(project=data.project)
+    issue_type = f.IssueTypeFactory(project=data.project)
+    common = {"project": data.project, "severity": severity, "priority": priority,
+              "type": issue_type, "milestone": None, "owner": data.user}
+
+    f.IssueFactory(status=open_status, assigned_to=data.user, created_date=now, **common)
+    f.IssueFactory(status=open_status, created_date=now - datetime.timedelta(days=2), **common)
+    f.IssueFactory(status=closed_status, created_date=now - datetime.timedelta(days=40),
+                   finished_date=now - datetime.timedelta(days=1), **common)
+
+    stats = get_stats_for_project_issues(data.project)
+    assert stats["total_issues"] == 3
+    assert stats["opened_issues"] == 2
+    assert stats["closed_issues"] == 1
+    assert stats["issues_per_status"][open_status.id]["count"] == 2
+    assert stats["issues_per_status"][closed_status.id]["count"] == 1
+    assert stats["issues_per_type"][issue_type.id]["count"] == 3
+    assert stats["issues_per_owner"][data.user.id]["count"] == 3
+    assert stats["issues_per_assigned_to"][data.user.id]["count"] == 1
+    assert stats["issues_per_assigned_to"][0]["count"] == 2
+
+    days = stats["last_four_weeks_days"]
+    assert len(days["by_open_closed"]["open"]) == 28
+    assert sum(days["by_open_closed"]["open"]) == 2
+    assert sum(days["by_open_closed"]["closed"]) == 1
+    assert days["by_severity"][severity.id]["data"][0] == 1
+    assert days["by_severity"][severity.id]["data"][-1] == 2
+    assert days["by_priority"][priority.id]["data"][0] == 1
+
+
+def test_milestone_interval_index():
+    today = datetime.date.today()
+    Milestone = type("Milestone", (object,), {})
+
+    def milestone(start, finish):
+        m = Milestone()
+        m.estimated_start = today + datetime.timedelta(days=start)
+        m.estimated_finish = today + datetime.timedelta(days=finish)
+        return m
+
+    # Sorted by estimated_start, the second one overlaps the third one
+    m1, m2, m3, m4 = milestone(0, 7), milestone(7, 21), milestone(14, 28), milestone(35, 42)
+    index = _MilestoneIntervalIndex([m1, m2, m3, m4])
+
+    assert index.find(today - datetime.timedelta(days=1)) is None
+    assert index.find(today) is m1
+    assert index.find(today + datetime.timedelta(days=7)) is m2
+    assert index.find(today + datetime.timedelta(days=15)) is m2
+    assert index.find(today + datetime.timedelta(days=22)) is m3
+    assert index.find(today + datetime.timedelta(days=30)) is None
+    assert index.find(today + datetime.timedelta(days=36)) is m4
+    assert _MilestoneIntervalIndex([]).find(today) is None
+
+
+def test_cached_project_stats_are_invalidated(client, data):
+    connect_project_stats_signals()
+    try:
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["defined_points_per_role"] == {data.role1.pk: 63}
+
+        data.role_points1.role = data.role2
+        data.role_points1.save()
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["defined_points_per_role"] == {data.role1.pk: 62, data.role2.pk: 1}
+
+        data.user_story1.is_closed = True
+        data.user_story1.save()
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["closed_points"] == 1
+    finally:
+        disconnect_project_stats_signals()
+
+
+def test_cached_project_stats_are_invalidated_for_any_language(client, data):
+    # The active language can be a variant out of settings.LANGUAGES
+    with translation.override("en-us"):
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["name"] == data.project.name
+
+        data.project.name = "Renamed project"
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["name"] != "Renamed project"
+
+        invalidate_stats_for_project(data.project.id)
+        project_stats = get_cached_stats_for_project(data.project)
+        assert project_stats["name"] == "Renamed project"
+
+
+@pytest.fixture
+def big_project():
+    """
+    Benchmark fixture: a project with thousands of estimated user stories
+    along dozens of sprints.
+    """
+    project = f.ProjectFactory(is_private=False)
+    role = f.RoleFactory(project=project)
+    points = [f.PointsFactory(project=project, value=value) for value in (1, 2, 3, 5, 8)]
+    status = f.UserStoryStatusFactory(project=project)
+
+    sprints = 40
+    first_day = datetime.date.today() - datetime.timedelta(days=14 * sprints)
+    milestones = [f.MilestoneFactory(project=project, owner=project.owner, closed=(i < sprints - 4),
+                                     estimated_start=first_day + datetime.timedelta(days=14 * i),
+                                     estimated_finish=first_day + datetime.timedelta(days=14 * (i + 1)))
+                  for i in range(sprints)]
+
+    now = timezone.now()
+    UserStory.objects.bulk_create([
+        UserStory(project=project, owner=project.owner, status=status, ref=i, subject="User Story {}".format(i),
+                  milestone=milestones[i % sprints] if i % 3 else None, is_closed=(i % 2 == 0),
+                  team_requirement=(i % 5 == 0), client_requirement=(i % 7 == 0),
+                  created_date=now - datetime.timedelta(days=i % (14 * sprints)), modified_date=now)
+        for i in range(5000)
+    ])
+    RolePoints.objects.bulk_create([RolePoints(user_story_id=us_id, role=role, points=points[us_id % len(points)])
+                                    for us_id in project.user_stories.values_list("id", flat=True)])
+    return project
+
+
+@pytest.mark.slow
+def test_project_stats_benchmark(big_project):
+    started = time.time()
+    project_stats = get_stats_for_project(big_project)
+    elapsed = time.time() - started
+
+    # Warm the cache, only the cached call is timed
+    get_cached_stats_for_project(big_project)
+    started = time.time()
+    cached_project_stats = get_cached_stats_for_project(big_project)
+    cached_elapsed = time.time() - started
+
+    assert cached_elapsed < elapsed
+    assert cached_project_stats == project_stats
+    assert project_stats["defined_points"] == sum(RolePoints.objects.filter(user_story__project=big_project)
+                                                                    .values_list("points__value", flat=True))
+    assert len(project_stats["milestones"]) == 41
@@ -18,12 +18,22 @@
 
 import pytest
 
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from .. import factories
 
+from taiga.projects.models import Project
 from taiga.projects.history import services as history_services
+from taiga.projects.history.models import HistoryEntry
 from taiga.timeline import service
-from taiga.timeline.models import Timeline
+from taiga.timeline import signals
+from taiga.timeline.models import Timeline, TimelineEvent
 from taiga.timeline.serializers import TimelineSerializer
+from taiga.timeline.management.commands.rebuild_timeline import _filter_history_entries_by_projects
+from taiga.timeline.management.commands import rebuild_timeline
 
 
 pytestmark = pytest.mark.django_db
@@ -66,6 +76,42 @@ def test_get_timeline():
     assert Timeline.objects.filter(object_id=user3.id).count() == 1
 
 
+def test_push_to_timelines_shares_the_event():
+    Timeline.objects.all().delete()
+    user1 = factories.UserFactory()
+    user2 = factories.UserFactory()
+    task = factories.TaskFactory()
+
+    service.register_timeline_implementation("tasks.task", "test", lambda x, extra_data=None: str(id(x)))
+
+    targets = [(task.project, service.build_project_namespace(task.project)),
+               ([user1, user2], service.build_user_namespace(task.owner))]
+    service.push_to_timelines(targets, task, "test", task.created_date)
+
+    timeline = Timeline.objects.filter(event_type="tasks.task.test")
+    assert timeline.count() == 3
+    assert TimelineEvent.objects.filter(event_type="tasks.task.test").count() == 1
+    assert all(t.data == id(task) for t in timeline)
+
+
+def test_delete_timeline_entries_purges_with_two_queries():
+    task = factories.TaskFactory()
+    user = factories.UserFactory()
+    service.register_timeline_implementation("tasks.task", "test", lambda x, extra_data=None: str(id(x)))
+    for i in range(5):
+        service.push_to_timelines([(task.project, service.build_project_namespace(task.project)),
+                                   ([user], service.build_user_namespace(user))],
+                                  task, "test", task.created_date)
+    assert Timeline.objects.count() > 0
+
+    with CaptureQueriesContext(connection) as context:
+        service.delete_timeline_entries(Timeline.objects.all())
+
+    assert len(context.captured_queries) == 2
+    assert Timeline.objects.count() == 0
+    assert TimelineEvent.objects.count() == 0
+
+
 def test_filter_timeline_no_privileges():
     Timeline.objects.all().delete()
     user1 = factories.UserFactory()
@@ -111,6 +157,36 @@ def test_filter_timeline_private_project_anon_permissions():
     assert timeline.count() == 1
 
 
+def test_filter_timeline_after_changing_anon_permissions():
+    Timeline.objects.all().delete()
+    user1 = factories.UserFactory()
+    user2 = factories.UserFactory()
+    project = factories.ProjectFactory.create(is_private=True, anon_permissions=[])
+    task = factories.TaskFactory.create(project=project)
+
+    service.register_timeline_implementation("tasks.task", "test", lambda x, extra_data=None: str(id(x)))
+    service._add_to_object_timeline(user1, task, "test", task.created_date)
+    timeline = Timeline.objects.filter(event_type="tasks.task.test")
+    assert service.filter_timeline_for_user(timeline, user2).count() == 0
+
+    project.anon_permissions = ["view_tasks"]
+    project.save()
+    assert service.filter_timeline_for_user(timeline, user2).count() == 1
+
+    project.anon_permissions = []
+    project.save()
+    assert service.filter_timeline_for_user(timeline, user2).count() == 0
+
+
+def test_project_visibility_changes_are_detected_without_queries():
+    project = factories.ProjectFactory.create(is_private=True, anon_permissions=[])
+    project = Project.objects.get(id=project.id)
+
+    with CaptureQueriesContext(connection) as captured:
+        signals.update_timeline_visibility_on_project_change(Project, project)
+    assert len(captured) == 0
+
+
 def test_filter_timeline_private_project_member_permissions():
     Timeline.objects.all().delete()
     user1 = factories.UserFactory()
@@ -506,3 +582,110 @@ def test_timeline_error_use_member_ids_instead_of_memberships_ids():
     external_user_timeline = service.get_profile_timeline(external_user)
     assert len(external_user_timeline) == 1
     assert external_user_timeline[0].event_type == "users.user.create"
+
+
+def test_project_timeline_cursor_pagination(client):
+    project = factories.ProjectFactory.create(is_private=False)
+    tasks = factories.TaskFactory.create_batch(3, project=project)
+
+    service.register_timeline_implementation("tasks.task", "test", lambda x, extra_data=None: str(id(x)))
+    for task in tasks:
+        service._add_to_object_timeline(project, task, "test", task.created_date,
+                                        namespace=service.build_project_namespace(project))
+
+    expected_ids = list(service.get_project_timeline(project).values_list("id", flat=True))
+    assert len(expected_ids) >= 3
+
+    client.login(project.owner)
+    url = "{}?page_size=2".format(reverse("project-timeline-detail", kwargs={"pk": project.pk}))
+    ids = []
+    while url:
+        response = client.get(url, HTTP_X_CURSOR_PAGINATION="true")
+        assert response.status_code == 200
+        assert "x-pagination-count" not in response
+        assert len(response.data) <= 2
+        ids += [entry["id"] for entry in response.data]
+        url = response.get("X-Pagination-Next", None)
+
+    assert ids == expected_ids
+
+
+def test_project_timeline_invalid_cursor(client):
+    project = factories.ProjectFactory.create(is_private=False)
+    client.login(project.owner)
+    url = "{}?cursor=invalid".format(reverse("project-timeline-detail", kwargs={"pk": project.pk}))
+    response = client.get(url)
+    assert response.status_code == 404
+
+
+def test_project_timeline_only_relevant_with_page_pagination(client):
+    project = factories.ProjectFactory.create(is_private=False)
+    task = factories.TaskFactory.create(project=project)
+    namespace = service.build_project_namespace(project)
+    project_content_type = ContentType.objects.get_for_model(project)
+    task_content_type = ContentType.objects.get_for_model(task)
+
+    entries = {}
+    for name, event_type, data in [("empty", "tasks.task.change", {"values_diff": {}}),
+                                   ("changed", "tasks.task.change", {"values_diff": {"subject": ["a", "b"]}}),
+                                   ("deleted", "tasks.task.delete", {})]:
+        entry = Timeline(content_type=project_content_type, object_id=project.id, namespace=namespace,
+                         event_type=event_type, project=project, data_content_type=task_content_type)
+        entry.data = data
+        entry.save()
+        entries[name] = entry
+
+    client.login(project.owner)
+    url = "{}?only_relevant".format(reverse("project-timeline-detail", kwargs={"pk": project.pk}))
+    response = client.get(url)
+    assert response.status_code == 200
+    ids = [entry["id"] for entry in response.data]
+    assert entries["changed"].id in ids
+    assert entries["empty"].id not in ids
+    assert entries["deleted"].id not in ids
+    assert int(response["x-pagination-count"]) == len(ids)
+
+
+def test_rebuild_timeline_filters_history_entries_by_projects():
+    task = factories.TaskFactory()
+    issue = factories.IssueFactory(project=task.project)
+    other_task = factories.TaskFactory()
+    for obj in [task, issue, other_task]:
+        history_services.take_snapshot(obj, user=obj.owner)
+
+    milestone = factories.MilestoneFactory(project=task.project)
+    for obj in [task, issue, other_task, milestone, task.project]:
+        history_services.take_snapshot(obj, user=obj.owner)
+
+    entries = _filter_history_entries_by_projects(HistoryEntry.objects.all(), [task.project.id])
+    assert sorted(entries.values_list("key", flat=True)) == sorted([
+        history_services.make_key_from_model_object(task),
+        history_services.make_key_from_model_object(issue),
+        history_services.make_key_from_model_object(milestone),
+        history_services.make_key_from_model_object(task.project),
+    ])
+
+
+def test_rebuild_timeline_in_chunks_is_the_same_as_in_a_single_process():
+    project = factories.ProjectFactory()
+    milestone = factories.MilestoneFactory(project=project, owner=project.owner)
+    task = factories.TaskFactory(project=project, milestone=milestone)
+    for obj in [project, milestone, task]:
+        history_services.take_snapshot(obj, user=obj.owner)
+    project.name = "Renamed project"
+    project.save()
+    history_services.take_snapshot(project, user=project.owner, comment="Renamed")
+
+    def get_project_timeline():
+        return sorted(Timeline.objects.filter(project=project)
+                                      .values_list("content_type_id", "object_id", "namespace",
+                                                   "event_type", "data_content_type_id", "created"))
+
+    service.delete_timeline_entries(Timeline.objects.all())
+    rebuild_timeline.generate_timeline(None, None, None)
+    expected = get_project_timeline()
+    assert any(event_type.startswith("milestones.milestone.") for _, _, _, event_type, _, _ in expected)
+    assert any(event_type == "projects.project.change" for _, _, _, event_type, _, _ in expected)
+
+    rebuild_timeline.generate_timeline_for_chunk((None, None, (project.id, project.id)))
+    assert get_project_timeline() == expected
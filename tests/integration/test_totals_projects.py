@@ -24,6 +24,8 @@ from .. import factories as f
 
 from taiga.projects.history.choices import HistoryType
 from taiga.projects.models import Project
+from taiga.projects.services import refresh_projects_totals
+from taiga.projects.services import refresh_stale_projects_totals
 
 from django.core.urlresolvers import reverse
 
@@ -153,3 +155,84 @@ def test_project_totals_updated_on_like(client):
     assert project.total_fans_last_month == 2
     assert project.total_fans_last_year == 3
     assert project.totals_updated_datetime > totals_updated_datetime
+
+
+def test_project_totals_reconciliation_repairs_buckets():
+    project = f.create_project()
+    now = datetime.datetime.now()
+
+    project.increment_totals("activity", now)
+    project.increment_totals("activity", now - datetime.timedelta(days=40))
+
+    project = Project.objects.get(id=project.id)
+    assert project.total_activity == 2
+    assert project.total_activity_last_week == 1
+    assert project.total_activity_last_month == 1
+    assert project.total_activity_last_year == 2
+
+    # There are no timeline entries for this increments
+    project.refresh_totals()
+
+    project = Project.objects.get(id=project.id)
+    assert project.total_activity == 0
+    assert project.totals_buckets.count() == 0
+
+
+def test_project_totals_reconciliation_keeps_the_right_buckets():
+    project = f.create_project()
+    f.LikeFactory.create(content_object=project)
+    project.refresh_totals()
+    bucket = project.totals_buckets.get(kind="fans")
+
+    project.increment_totals("fans", bucket.date)
+    project.refresh_totals()
+
+    # The bucket is repaired in place
+    assert project.totals_buckets.get(kind="fans").id == bucket.id
+    assert project.totals_buckets.get(kind="fans").count == 1
+    assert Project.objects.get(id=project.id).total_fans == 1
+
+
+def test_refresh_projects_totals_task_only_moves_the_windows():
+    project = f.create_project()
+    f.LikeFactory.create(content_object=project)
+    project.increment_totals("fans", datetime.datetime.now() - datetime.timedelta(days=8))
+
+    refresh_projects_totals()
+
+    # The likes are not recounted
+    project = Project.objects.get(id=project.id)
+    assert project.total_fans == 1
+    assert project.total_fans_last_week == 0
+
+
+def test_increment_totals_moves_the_stale_windows():
+    project = f.create_project()
+    project.increment_totals("fans", datetime.datetime.now() - datetime.timedelta(days=8))
+    project.refresh_totals_from_buckets()
+    Project.objects.filter(id=project.id).update(total_fans_last_year=5,
+        totals_updated_datetime=project.totals_updated_datetime - datetime.timedelta(days=2))
+
+    project = Project.objects.get(id=project.id)
+    project.increment_totals("fans", datetime.datetime.now())
+
+    # The windows are recalculated from the buckets
+    project = Project.objects.get(id=project.id)
+    assert project.total_fans == 2
+    assert project.total_fans_last_week == 1
+    assert project.total_fans_last_year == 2
+
+
+def test_refresh_stale_projects_totals():
+    project = f.create_project()
+    project.increment_totals("fans", datetime.datetime.now())
+    two_weeks_ago = project.totals_updated_datetime - datetime.timedelta(days=14)
+    Project.objects.filter(id=project.id).update(totals_updated_datetime=two_weeks_ago)
+    project.totals_buckets.update(date=two_weeks_ago.date())
+
+    refresh_stale_projects_totals()
+
+    project = Project.objects.get(id=project.id)
+    assert project.total_fans == 1
+    assert project.total_fans_last_week == 0
+    assert project.total_fans_last_month == 1
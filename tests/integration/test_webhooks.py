@@ -17,15 +17,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 from .. import factories as f
 
+from taiga.base.utils import json
 from taiga.projects.history import services
+from taiga.webhooks import tasks
 
 pytestmark = pytest.mark.django_db(transaction=True)
 
 
+def patch_send_request():
+    response = MagicMock(status_code=200, content=b"ok", headers={})
+    response.elapsed.total_seconds.return_value = 0.1
+    return patch('taiga.webhooks.delivery.send_request', return_value=response)
+
+
 def test_new_object_with_one_webhook(settings):
     settings.WEBHOOKS_ENABLED = True
     project = f.ProjectFactory()
@@ -39,22 +47,22 @@ def test_new_object_with_one_webhook(settings):
     ]
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.create_webhook') as create_webhook_mock:
+        with patch_send_request() as create_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test")
             assert create_webhook_mock.call_count == 1
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.change_webhook') as change_webhook_mock:
+        with patch_send_request() as change_webhook_mock:
             services.take_snapshot(obj, user=obj.owner)
             assert change_webhook_mock.call_count == 0
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.change_webhook') as change_webhook_mock:
+        with patch_send_request() as change_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test")
             assert change_webhook_mock.call_count == 1
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.delete_webhook') as delete_webhook_mock:
+        with patch_send_request() as delete_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test", delete=True)
             assert delete_webhook_mock.call_count == 1
 
@@ -73,22 +81,22 @@ def test_new_object_with_two_webhook(settings):
     ]
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.create_webhook') as create_webhook_mock:
+        with patch_send_request() as create_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test")
             assert create_webhook_mock.call_count == 2
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.change_webhook') as change_webhook_mock:
+        with patch_send_request() as change_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test")
             assert change_webhook_mock.call_count == 2
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.change_webhook') as change_webhook_mock:
+        with patch_send_request() as change_webhook_mock:
             services.take_snapshot(obj, user=obj.owner)
             assert change_webhook_mock.call_count == 0
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks.delete_webhook') as delete_webhook_mock:
+        with patch_send_request() as delete_webhook_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test", delete=True)
             assert delete_webhook_mock.call_count == 2
 
@@ -106,11 +114,106 @@ def test_send_request_one_webhook(settings):
     ]
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks._send_request') as _send_request_mock:
+        with patch_send_request() as _send_request_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test")
             assert _send_request_mock.call_count == 1
 
     for obj in objects:
-        with patch('taiga.webhooks.tasks._send_request') as _send_request_mock:
+        with patch_send_request() as _send_request_mock:
             services.take_snapshot(obj, user=obj.owner, comment="test", delete=True)
             assert _send_request_mock.call_count == 1
+
+
+def test_one_task_sends_the_event_to_all_the_webhooks(settings):
+    settings.WEBHOOKS_ENABLED = True
+    project = f.ProjectFactory()
+    webhook1 = f.WebhookFactory.create(project=project, key="key1")
+    webhook2 = f.WebhookFactory.create(project=project, key="key2")
+    obj = f.IssueFactory.create(project=project)
+
+    # The payload is serialized once, when the history entry is created
+    with patch('taiga.webhooks.tasks.send_webhooks') as send_webhooks_mock, \
+            patch('taiga.webhooks.tasks.render_data', wraps=tasks.render_data) as render_data_mock:
+        services.take_snapshot(obj, user=obj.owner, comment="test")
+        assert render_data_mock.call_count == 1
+        assert send_webhooks_mock.call_count == 1
+        webhooks, serialized_data = send_webhooks_mock.call_args[0]
+        assert len(webhooks) == 2
+
+    # The object can be deleted before the task runs
+    obj.delete()
+
+    # Only the signature changes with the key
+    with patch_send_request() as send_request_mock:
+        tasks.send_webhooks(webhooks, serialized_data)
+        assert send_request_mock.call_count == 2
+        requests = [call_args[0][0] for call_args in send_request_mock.call_args_list]
+        assert requests[0].body is requests[1].body
+        assert json.loads(requests[0].body)["action"] == "create"
+        assert {request.headers["X-TAIGA-WEBHOOK-SIGNATURE"] for request in requests} == {
+            tasks._generate_signature(requests[0].body, "key1"),
+            tasks._generate_signature(requests[0].body, "key2")
+        }
+
+    # The logs are saved by the calling thread
+    assert webhook1.logs.get().status == 200
+    assert webhook2.logs.get().status == 200
+
+
+def test_prune_webhook_logs(settings):
+    settings.WEBHOOKS_LOG_MAX_ENTRIES = 3
+    webhook1 = f.WebhookFactory.create()
+    webhook2 = f.WebhookFactory.create()
+    logs1 = [f.WebhookLogFactory.create(webhook=webhook1) for i in range(5)]
+    logs2 = [f.WebhookLogFactory.create(webhook=webhook2) for i in range(2)]
+
+    tasks._prune_webhook_logs(webhook_id=webhook2.id)
+    assert webhook1.logs.count() == 5
+    assert webhook2.logs.count() == 2
+
+    assert tasks.prune_webhook_logs() == 2
+    assert set(webhook1.logs.values_list("id", flat=True)) == {log.id for log in logs1[2:]}
+    assert set(webhook2.logs.values_list("id", flat=True)) == {log.id for log in logs2}
+
+
+@pytest.mark.parametrize("celery_enabled", [True, False])
+def test_webhook_logs_are_pruned_every_n_deliveries(settings, celery_enabled):
+    settings.CELERY_ENABLED = celery_enabled
+    settings.WEBHOOKS_LOG_MAX_ENTRIES = 1
+    settings.WEBHOOKS_LOG_PRUNE_EVERY = 3
+    webhook = f.WebhookFactory.create()
+    webhook_data = {"id": webhook.id, "url": webhook.url, "key": webhook.key}
+
+    with patch_send_request():
+        for i in range(2):
+            tasks.send_webhooks([webhook_data], b'{"action": "delete"}')
+        assert webhook.logs.count() == 2
+
+        tasks.send_webhooks([webhook_data], b'{"action": "delete"}')
+        assert webhook.logs.count() == 1
+
+
+def test_webhook_log_response_data_is_truncated(settings):
+    settings.WEBHOOKS_LOG_MAX_RESPONSE_SIZE = 5
+    assert tasks._truncate_response_data(b"short") == "short"
+    assert tasks._truncate_response_data(b"a longer response") == "a lon... (truncated, 17 characters)"
+
+    settings.WEBHOOKS_LOG_MAX_RESPONSE_SIZE = None
+    assert tasks._truncate_response_data(b"a longer response") == "a longer response"
+
+
+def test_webhook_log_request_data_is_truncated(settings):
+    settings.WEBHOOKS_LOG_MAX_REQUEST_SIZE = 20
+    webhook = f.WebhookFactory.create()
+    webhook_data = {"id": webhook.id, "url": webhook.url, "key": webhook.key}
+    serialized_data = b'{"action": "delete", "type": "issue", "data": {"subject": "A long subject"}}'
+
+    with patch_send_request() as send_request_mock:
+        tasks.send_webhooks([webhook_data], serialized_data)
+        # The request is sent complete
+        assert send_request_mock.call_args[0][0].body == serialized_data
+
+    request_data = webhook.logs.get().request_data
+    assert tasks.is_truncated_request_data(request_data)
+    assert request_data["action"] == "delete"
+    assert request_data["truncated"] == '{"action": "delete",... (truncated, 76 characters)'
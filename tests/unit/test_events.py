@@ -0,0 +1,359 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# Copyright (C) 2014-2016 Anler Hernández <hello@anler.me>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from taiga.events import events
+from taiga.events import sender
+from taiga.events.backends import rabbitmq
+from taiga.events.backends import postgresql
+
+
+class StubConnection:
+    """
+    Fake amqp connection, the handshake latency of a local broker
+    is simulated with `handshake_delay`.
+    """
+    handshake_delay = 0
+    opened = 0
+    published = []
+    fail_next_declare = False
+    fail_next_publish = False
+
+    def __init__(self, **kwargs):
+        time.sleep(self.handshake_delay)
+        StubConnection.opened += 1
+        self.kwargs = kwargs
+        self.declared = []
+        self.closed = False
+
+    def channel(self):
+        return StubChannel(self)
+
+    def close(self):
+        self.closed = True
+
+
+class StubChannel:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def exchange_declare(self, exchange, type, auto_delete):
+        if StubConnection.fail_next_declare:
+            StubConnection.fail_next_declare = False
+            raise IOError("Connection reset by peer")
+        self.connection.declared.append(exchange)
+
+    def basic_publish(self, message, routing_key, exchange):
+        if StubConnection.fail_next_publish:
+            StubConnection.fail_next_publish = False
+            raise IOError("Connection reset by peer")
+        StubConnection.published.append((message.body, routing_key, exchange))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def stub_broker():
+    StubConnection.handshake_delay = 0
+    StubConnection.opened = 0
+    StubConnection.published = []
+    StubConnection.fail_next_declare = False
+    StubConnection.fail_next_publish = False
+    rabbitmq._pools.clear()
+    with patch("taiga.events.backends.rabbitmq.AmqpConnection", StubConnection):
+        yield StubConnection
+    rabbitmq._pools.clear()
+
+
+def test_rabbitmq_backend_reuses_connections(stub_broker):
+    backend = rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/")
+    for i in range(10):
+        backend.emit_event("message {}".format(i), routing_key="changes.project.1.tasks")
+        backend.emit_event("message {}".format(i), routing_key="changes.project.1.tasks", channel="other")
+
+    assert stub_broker.opened == 1
+    assert len(stub_broker.published) == 20
+
+    # The exchanges are declared only once per connection
+    pooled_channel = backend.pool._idle[0]
+    assert pooled_channel.connection.declared == ["events", "other"]
+
+    # New backend instances share the pool
+    rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/").emit_event("message", routing_key="test")
+    assert stub_broker.opened == 1
+
+
+def test_rabbitmq_backend_confirm_publish(stub_broker):
+    backend = rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/", confirm_publish=True)
+    backend.emit_event("message", routing_key="test")
+    assert backend.pool._idle[0].connection.kwargs["confirm_publish"] is True
+
+
+def test_rabbitmq_backend_reconnects_broken_connections(stub_broker):
+    backend = rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/")
+    backend.emit_event("first", routing_key="test")
+    broken_connection = backend.pool._idle[0].connection
+
+    # Failures before publishing are retried with a new connection
+    stub_broker.fail_next_declare = True
+    backend.emit_event("second", routing_key="test", channel="other")
+
+    assert broken_connection.closed
+    assert stub_broker.opened == 2
+    assert [body for body, routing_key, exchange in stub_broker.published] == ["first", "second"]
+
+
+def test_rabbitmq_backend_does_not_resend_failed_publishes(stub_broker):
+    backend = rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/")
+    backend.emit_event("first", routing_key="test")
+    broken_connection = backend.pool._idle[0].connection
+
+    # The message may have been delivered
+    stub_broker.fail_next_publish = True
+    backend.emit_event("second", routing_key="test")
+    assert broken_connection.closed
+    assert stub_broker.opened == 1
+
+    backend.emit_event("third", routing_key="test")
+    assert stub_broker.opened == 2
+    assert [body for body, routing_key, exchange in stub_broker.published] == ["first", "third"]
+
+
+def test_rabbitmq_backend_resets_pool_after_fork(stub_broker):
+    backend = rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/")
+    backend.emit_event("message", routing_key="test")
+    parent_connection = backend.pool._idle[0].connection
+
+    with patch("os.getpid", return_value=os.getpid() + 1):
+        backend.emit_event("message", routing_key="test")
+
+    assert stub_broker.opened == 2
+    assert not parent_connection.closed
+
+
+class FakeConnection:
+    """
+    Mimics the commit hooks of a django connection inside a transaction.
+    """
+    def __init__(self):
+        self.run_on_commit = []
+        self.savepoint_ids = []
+        self.in_atomic_block = True
+
+    def on_commit(self, func):
+        self.run_on_commit.append((set(self.savepoint_ids), func))
+
+    def savepoint(self, sid):
+        self.savepoint_ids.append(sid)
+
+    def savepoint_commit(self):
+        self.savepoint_ids.pop()
+
+    def savepoint_rollback(self):
+        sid = self.savepoint_ids.pop()
+        self.run_on_commit = [(sids, func) for (sids, func) in self.run_on_commit if sid not in sids]
+
+    def commit(self):
+        try:
+            while self.run_on_commit:
+                sids, func = self.run_on_commit.pop(0)
+                func()
+        finally:
+            self.run_on_commit = []
+
+    def rollback(self):
+        self.savepoint_ids = []
+        self.run_on_commit = []
+
+
+class FakeTask:
+    _importing = False
+
+    def __init__(self, pk, project_id=1):
+        self.pk = pk
+        self.project_id = project_id
+
+
+def test_emit_event_for_model_on_commit_groups_events():
+    connection = FakeConnection()
+    with patch("taiga.base.utils.db.connection", connection), \
+            patch("taiga.events.backends.get_events_backend") as get_backend_mock:
+        for pk in [1, 2, 3, 2]:
+            events.emit_event_for_model_on_commit(FakeTask(pk), content_type="tasks.task")
+        events.emit_event_for_model_on_commit(FakeTask(4), content_type="tasks.task", type="create")
+        events.emit_event_for_model_on_commit(FakeTask(4), content_type="tasks.task")
+        events.emit_event_for_model_on_commit(FakeTask(5, project_id=2), content_type="tasks.task")
+        connection.on_commit(lambda: None)
+
+        emit_events_mock = get_backend_mock.return_value.emit_events
+        assert emit_events_mock.call_count == 0
+        connection.commit()
+
+    # All the events are sent to the backend at once
+    assert emit_events_mock.call_count == 1
+    messages = emit_events_mock.call_args[0][0]
+    assert [(json.loads(message)["data"], routing_key) for message, routing_key, channel in messages] == [
+        ({"type": "change", "matches": "tasks.task", "pk": [1, 2, 3]}, "changes.project.1.tasks"),
+        ({"type": "create", "matches": "tasks.task", "pk": 4}, "changes.project.1.tasks"),
+        ({"type": "change", "matches": "tasks.task", "pk": 5}, "changes.project.2.tasks"),
+    ]
+
+
+def test_emit_event_for_model_on_commit_registers_a_single_hook():
+    connection = FakeConnection()
+    with patch("taiga.base.utils.db.connection", connection), \
+            patch("taiga.events.backends.get_events_backend"):
+        for pk in range(10):
+            events.emit_event_for_model_on_commit(FakeTask(pk), content_type="tasks.task")
+
+        # The flush hook and the one of the items out of savepoints
+        assert len(connection.run_on_commit) == 2
+
+
+def test_emit_event_for_model_on_commit_after_rollbacks():
+    connection = FakeConnection()
+    with patch("taiga.base.utils.db.connection", connection), \
+            patch("taiga.events.backends.get_events_backend") as get_backend_mock:
+        events.emit_event_for_model_on_commit(FakeTask(1), content_type="tasks.task")
+        connection.rollback()
+
+        events.emit_event_for_model_on_commit(FakeTask(2), content_type="tasks.task")
+        connection.savepoint("s1")
+        events.emit_event_for_model_on_commit(FakeTask(3), content_type="tasks.task")
+        connection.savepoint_rollback()
+        connection.savepoint("s2")
+        events.emit_event_for_model_on_commit(FakeTask(4), content_type="tasks.task")
+        connection.savepoint_commit()
+        connection.commit()
+
+        # The hook registered in a rolled back savepoint is replaced
+        connection.savepoint("s3")
+        events.emit_event_for_model_on_commit(FakeTask(5), content_type="tasks.task")
+        connection.savepoint_rollback()
+        events.emit_event_for_model_on_commit(FakeTask(6), content_type="tasks.task")
+        connection.commit()
+
+    emit_events_mock = get_backend_mock.return_value.emit_events
+    assert [json.loads(call_args[0][0][0][0])["data"]["pk"]
+            for call_args in emit_events_mock.call_args_list] == [[2, 4], 6]
+
+
+def test_delete_events_are_deferred():
+    connection = FakeConnection()
+    with patch("taiga.base.utils.db.connection", connection), \
+            patch("taiga.events.backends.get_events_backend") as get_backend_mock:
+        events.emit_event_for_model_on_commit(FakeTask(1), content_type="tasks.task")
+        events.emit_event_for_model_on_commit(FakeTask(1), content_type="tasks.task", type="delete")
+        emit_events_mock = get_backend_mock.return_value.emit_events
+        assert emit_events_mock.call_count == 0
+        connection.commit()
+
+    messages = emit_events_mock.call_args[0][0]
+    assert [json.loads(message)["data"] for message, routing_key, channel in messages] == [
+        {"type": "delete", "matches": "tasks.task", "pk": 1},
+    ]
+
+
+def test_events_sender(settings):
+    settings.EVENTS_SENDER_QUEUE_SIZE = 1
+    events_sender = sender.EventsSender()
+    release = threading.Event()
+
+    with patch("taiga.events.backends.get_events_backend") as get_backend_mock:
+        get_backend_mock.return_value.emit_events.side_effect = lambda events: release.wait(5)
+        events_sender.put([("first", "test", "events")])
+        # Wait until the thread is blocked sending the first event
+        while events_sender.queue.unfinished_tasks and events_sender.queue.qsize():
+            time.sleep(0.01)
+        events_sender.put([("second", "test", "events")])
+        events_sender.put([("third", "test", "events"), ("fourth", "test", "events")])
+
+        assert events_sender.get_stats() == {"queue_depth": 1, "queue_size": 1,
+                                             "sent": 0, "dropped": 2, "failed": 0}
+        release.set()
+        events_sender.queue.join()
+
+    assert events_sender.get_stats()["sent"] == 2
+    assert get_backend_mock.return_value.emit_events.call_count == 2
+
+
+def test_postgresql_split_payload():
+    message = json.dumps({"session_id": None,
+                          "data": {"type": "change", "matches": "tasks.task", "pk": list(range(5000))}})
+    assert len(message) > postgresql.MAX_PAYLOAD_SIZE
+
+    messages = postgresql.split_payload(message)
+    assert len(messages) > 1
+    assert all(len(m.encode("utf-8")) <= postgresql.MAX_PAYLOAD_SIZE for m in messages)
+    pks = [pk for m in messages for pk in json.loads(m)["data"]["pk"]]
+    assert pks == list(range(5000))
+
+    small_message = json.dumps({"data": {"pk": 1}})
+    assert postgresql.split_payload(small_message) == [small_message]
+    assert postgresql.split_payload(json.dumps({"data": {"pk": "x" * 8000}})) == []
+
+
+def test_postgresql_batched_backend_notifies_on_commit():
+    connection = FakeConnection()
+    backend = postgresql.BatchedEventsPushBackend()
+    with patch("taiga.base.utils.db.connection", connection), \
+            patch("taiga.events.backends.postgresql.connection", connection), \
+            patch.object(postgresql._pending_notifications, "flush") as flush_mock, \
+            patch("taiga.events.backends.postgresql._notify") as notify_mock:
+        backend.emit_event("first", routing_key="changes.project.1.tasks")
+        connection.savepoint("s1")
+        backend.emit_events([("second", "changes.project.1.issues", "events")])
+        connection.savepoint_rollback()
+        backend.emit_events([("third", "changes.project.1.issues", "events")])
+        assert flush_mock.call_count == 0
+        connection.commit()
+
+        # The notifications of the rolled back savepoint are discarded
+        assert flush_mock.call_args[0][0] == [("events_changes__project__1__tasks", "first"),
+                                              ("events_changes__project__1__issues", "third")]
+
+        connection.in_atomic_block = False
+        backend.emit_event("fourth", routing_key="changes.project.1.tasks")
+        assert notify_mock.call_args[0][0] == [("events_changes__project__1__tasks", "fourth")]
+
+
+@pytest.mark.slow
+def test_rabbitmq_backend_benchmark(stub_broker):
+    stub_broker.handshake_delay = 0.005
+    events = 200
+
+    def events_per_second(backend):
+        started = time.time()
+        for i in range(events):
+            backend.emit_event("message {}".format(i), routing_key="changes.project.1.tasks")
+        return events / (time.time() - started)
+
+    # pool_size=0 keeps the previous behaviour, a connection per event
+    unpooled = events_per_second(rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/", pool_size=0))
+    pooled = events_per_second(rabbitmq.EventsPushBackend("//guest:guest@127.0.0.1/", pool_size=4))
+
+    assert stub_broker.opened == events + 1
+    assert pooled > unpooled
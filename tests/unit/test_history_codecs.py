@@ -0,0 +1,58 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from taiga.projects.history import codecs
+
+
+def test_json_codec_stores_values_as_they_are():
+    codec = codecs.JsonCodec()
+    value = {"subject": "test", "points": {"1": 2}}
+
+    assert codecs.encode(value, codec) == value
+    assert codecs.decode(value) == value
+
+
+def test_zlib_codec_roundtrip():
+    codec = codecs.ZlibJsonCodec()
+    value = {"subject": "test", "description": "long description " * 100, "tags": ["a", "b"]}
+
+    encoded = codecs.encode(value, codec)
+
+    assert codecs.is_encoded(encoded)
+    assert encoded[codecs.CODEC_KEY] == "zlib1"
+    assert len(encoded[codecs.DATA_KEY]) < len(value["description"])
+    assert codecs.decode(encoded) == value
+
+
+def test_encode_is_idempotent():
+    codec = codecs.ZlibJsonCodec()
+    encoded = codecs.encode({"subject": "test"}, codec)
+
+    assert codecs.encode(encoded, codec) == encoded
+    assert codecs.encode(None, codec) is None
+
+
+def test_get_codec_is_cached(settings):
+    settings.HISTORY_STORAGE_CODEC = "taiga.projects.history.codecs.ZlibJsonCodec"
+    settings.HISTORY_STORAGE_CODEC_OPTIONS = {"level": 9}
+
+    codec = codecs.get_codec()
+    assert codec.level == 9
+    assert codecs.get_codec() is codec
+
+    settings.HISTORY_STORAGE_CODEC_OPTIONS = {"level": 1}
+    assert codecs.get_codec().level == 1
@@ -21,7 +21,7 @@ from unittest.mock import patch, call
 from django.core.exceptions import ValidationError
 
 from taiga.timeline import service
-from taiga.timeline.models import Timeline
+from taiga.timeline.models import Timeline, TimelineEvent
 from taiga.projects.models import Project
 from taiga.users.models import User
 
@@ -29,35 +29,55 @@ import pytest
 
 
 def test_push_to_timeline_many_objects():
-    with patch("taiga.timeline.service._add_to_object_timeline") as mock:
+    with patch("taiga.timeline.service._add_to_objects_timeline") as mock:
         users = [User(), User(), User()]
         project = Project()
         service.push_to_timeline(users, project, "test", project.created_date)
-        assert mock.call_count == 3
+        assert mock.call_count == 1
         assert mock.mock_calls == [
-            call(users[0], project, "test", project.created_date, "default", {}),
-            call(users[1], project, "test", project.created_date, "default", {}),
-            call(users[2], project, "test", project.created_date, "default", {}),
+            call(users, project, "test", project.created_date, "default", {}),
         ]
         with pytest.raises(Exception):
             service.push_to_timeline(None, project, "test")
 
 
 def test_add_to_objects_timeline():
-    with patch("taiga.timeline.service._add_to_object_timeline") as mock:
+    event = TimelineEvent(id=1, event_type="projects.project.test", data={"test": "data"})
+    with patch("taiga.timeline.service._create_timeline_event", return_value=event) as create_event_mock, \
+            patch("taiga.timeline.models.Timeline.objects.bulk_create") as bulk_create_mock:
         users = [User(), User(), User()]
         project = Project()
         service._add_to_objects_timeline(users, project, "test", project.created_date)
-        assert mock.call_count == 3
-        assert mock.mock_calls == [
-            call(users[0], project, "test", project.created_date, "default", {}),
-            call(users[1], project, "test", project.created_date, "default", {}),
-            call(users[2], project, "test", project.created_date, "default", {}),
-        ]
+
+        # The event is stored once and all the entries are inserted with one bulk_create
+        assert create_event_mock.call_count == 1
+        assert bulk_create_mock.call_count == 1
+
+        timeline_objects = bulk_create_mock.call_args[0][0]
+        assert len(timeline_objects) == 3
+        assert all(t.event is event for t in timeline_objects)
+        assert all(t.data == {"test": "data"} for t in timeline_objects)
+        assert all(t.event_type == "projects.project.test" for t in timeline_objects)
         with pytest.raises(Exception):
             service.push_to_timeline(None, project, "test")
 
 
+def test_push_to_timelines_shares_the_event():
+    event = TimelineEvent(id=1, event_type="projects.project.test", data={"test": "data"})
+    with patch("taiga.timeline.service._create_timeline_event", return_value=event) as create_event_mock, \
+            patch("taiga.timeline.service._add_to_timeline") as mock:
+        users = [User(), User(), User()]
+        project = Project()
+        targets = [(project, "project:1"), (users, "user:1")]
+        service.push_to_timelines(targets, project, "test", project.created_date)
+
+        assert create_event_mock.call_count == 1
+        assert mock.mock_calls == [
+            call(project, project, "test", project.created_date, "project:1", {}, event=event),
+            call(users, project, "test", project.created_date, "user:1", {}, event=event),
+        ]
+
+
 def test_get_impl_key_from_model():
     assert service._get_impl_key_from_model(Timeline, "test") == "timeline.timeline.test"
     with pytest.raises(Exception):
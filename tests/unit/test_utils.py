@@ -22,6 +22,8 @@ import re
 
 from taiga.base.utils.urls import get_absolute_url, is_absolute_url, build_url
 from taiga.base.utils.db import save_in_bulk, update_in_bulk, update_in_bulk_with_ids, to_tsquery
+from taiga.base.utils.db import get_search_vector_sql
+from taiga.base.utils.cache import get_cache_timeout, get_cache_version, bump_cache_version_on_commit
 
 
 def test_is_absolute_url():
@@ -118,3 +120,40 @@ def test_to_tsquery():
         expected = re.sub("([0-9])", r"'\1':*", expected)
         actual = to_tsquery(input)
         assert actual == expected
+
+
+def test_get_search_vector_sql():
+    create_sql, drop_sql = get_search_vector_sql("wiki_wikipage", [("slug", "A"), ("content", "C")])
+
+    assert "ALTER TABLE wiki_wikipage ADD COLUMN search_vector tsvector;" in create_sql
+    assert "BEFORE INSERT OR UPDATE OF slug, content" in create_sql
+    assert ("setweight(to_tsvector('english_nostop', coalesce(NEW.slug::text, '')), 'A') || "
+            "setweight(to_tsvector('english_nostop', coalesce(NEW.content::text, '')), 'C')") in create_sql
+    assert "ALTER TABLE wiki_wikipage DROP COLUMN IF EXISTS search_vector;" in drop_sql
+
+
+def test_get_cache_timeout(settings):
+    settings.PROCESS_LOCAL_CACHE_TIMEOUT = 60
+
+    with mock.patch("taiga.base.utils.cache.is_process_local_cache", return_value=True):
+        assert get_cache_timeout(60 * 60) == 60
+        assert get_cache_timeout(30) == 30
+
+    with mock.patch("taiga.base.utils.cache.is_process_local_cache", return_value=False):
+        assert get_cache_timeout(60 * 60) == 60 * 60
+
+
+def test_bump_cache_version_on_commit():
+    version = get_cache_version("test-version")
+
+    with mock.patch("taiga.base.utils.cache.connection") as connection_mock:
+        connection_mock.in_atomic_block = True
+        bump_cache_version_on_commit("test-version")
+
+        bumped_version = get_cache_version("test-version")
+        assert bumped_version != version
+        assert connection_mock.on_commit.call_count == 1
+
+        on_commit_hook, = connection_mock.on_commit.call_args[0]
+        on_commit_hook()
+        assert get_cache_version("test-version") not in (version, bumped_version)
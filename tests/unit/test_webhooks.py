@@ -0,0 +1,102 @@
+# Copyright (C) 2014-2016 Andrey Antukh <niwi@niwi.nz>
+# Copyright (C) 2014-2016 Jesús Espino <jespinog@gmail.com>
+# Copyright (C) 2014-2016 David Barragán <bameda@dbarragan.com>
+# Copyright (C) 2014-2016 Alejandro Alonso <alejandro.alonso@kaleidos.net>
+# Copyright (C) 2014-2016 Anler Hernández <hello@anler.me>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import threading
+from unittest.mock import patch, MagicMock
+
+import pytest
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.packages.urllib3.exceptions import MaxRetryError
+
+from taiga.webhooks import delivery
+
+
+@pytest.fixture
+def fast_retries(settings):
+    settings.WEBHOOKS_MAX_RETRIES = 2
+    settings.WEBHOOKS_RETRY_BACKOFF = 0
+    settings.WEBHOOKS_CONNECT_TIMEOUT = 1
+    settings.WEBHOOKS_READ_TIMEOUT = 2
+
+
+def connect_error():
+    return ConnectionError(MaxRetryError(None, "http://example.com/hook"))
+
+
+def test_sessions_are_shared_by_host():
+    session1 = delivery.get_session("http://example.com/hook1")
+    session2 = delivery.get_session("http://example.com/hook2")
+    session3 = delivery.get_session("https://example.com/hook1")
+    assert session1 is session2
+    assert session1 is not session3
+
+
+def test_send_request_retries_connection_errors(fast_retries):
+    request = MagicMock(url="http://example.com/hook")
+    response = MagicMock(status_code=200)
+    with patch("requests.Session.send", side_effect=[connect_error(), response]) as send_mock:
+        assert delivery.send_request(request) is response
+
+    assert send_mock.call_count == 2
+    assert send_mock.call_args[1]["timeout"] == (1, 2)
+
+
+def test_send_request_retries_server_errors(fast_retries):
+    request = MagicMock(url="http://example.com/hook")
+    response = MagicMock(status_code=503)
+    with patch("requests.Session.send", return_value=response) as send_mock:
+        assert delivery.send_request(request) is response
+
+    assert send_mock.call_count == 3
+
+
+def test_send_request_raises_the_last_error(fast_retries):
+    request = MagicMock(url="http://example.com/hook")
+    with patch("requests.Session.send", side_effect=connect_error()) as send_mock:
+        with pytest.raises(ConnectionError):
+            delivery.send_request(request)
+
+    assert send_mock.call_count == 3
+
+
+def test_send_request_doesnt_retry_errors_after_sending(fast_retries):
+    request = MagicMock(url="http://example.com/hook")
+    for error in [ReadTimeout(), ConnectionError("Connection aborted.")]:
+        with patch("requests.Session.send", side_effect=error) as send_mock:
+            with pytest.raises(type(error)):
+                delivery.send_request(request)
+
+        assert send_mock.call_count == 1
+
+
+def test_run_concurrently(settings):
+    settings.WEBHOOKS_MAX_WORKERS = 4
+    barrier = threading.Barrier(3, timeout=5)
+
+    def slow_delivery(result):
+        # Every delivery waits for the others, it would fail if they
+        # were sent one after the other
+        barrier.wait()
+        return result
+
+    started = time.time()
+    results = delivery.run_concurrently([lambda: slow_delivery(1), lambda: slow_delivery(2),
+                                         lambda: slow_delivery(3)])
+    assert results == [1, 2, 3]
+    assert time.time() - started < 5